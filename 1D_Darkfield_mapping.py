@@ -15,42 +15,45 @@ importlib.reload(F)
 
 master_folder = os.getcwd()
 
-# Load background images.
+# Background folder (images are added to a saved background model, see below).
 background_folder = os.path.join(master_folder, 'Backgrounds')
-BG_files, BG_filenames = F.loadFolder(background_folder,
-                                      DataType='0000.edf', Mute=True)
+# Load first background image (for its header).
+BG_file, BG_filename = F.loadFile(background_folder,
+                                  DataType='0000.edf', Mute=True)
 # Load 1D data images.
 oneD_data_folder = os.path.join(master_folder, 'Mosa_chi_scan_RT')
 oneD_data_files, oneD_data_filenames = F.loadFolder(oneD_data_folder,
                                                     DataType='2258.edf',
                                                     Mute=True)
 
-# Convert background images to numpy.array
-BG_array = F.make_data_array(BG_files)
 # Convert 1D data images to numpy.array
 oneD_data_array = F.make_data_array(oneD_data_files)
 
-# For each pixel, find median value through all images.
-BG_median = np.median(BG_array, axis=2)
+# For each pixel, find median value through all images. The background
+# model is saved in the background folder, and only files added since the
+# last run are read (use F.getBackground() for the exact median).
+BG_model = F.updateBackground(background_folder, DataType='0000.edf',
+                              Mute=True)
+BG_median = BG_model.getMedian()
 
 # Get some values.
-ffz = F.getMotorValue(BG_files[0].header, 'ffz')
+ffz = F.getMotorValue(BG_file.header, 'ffz')
 ffx = 5000.0
 two_theta = np.arctan(ffz/ffx)*180/np.pi
-obpitch = F.getMotorValue(BG_files[0].header, 'obpitch')
+obpitch = F.getMotorValue(BG_file.header, 'obpitch')
 
 
 # Subtract background median from data images.
 # oneD_BG_sub = oneD_data_array - BG_median
 
 print(ffz, ffx, two_theta, obpitch)
-# for name in sorted(BG_files[0].header['motor_mne'].split()):
+# for name in sorted(BG_file.header['motor_mne'].split()):
 #     print(name)
 
 
 # F.displayFiles(oneD_data_files, oneD_data_filenames,
 #                fps=2, Mute=False)
 
-F.closeFiles(Files=BG_files, Mute=True)
+BG_file.close()
 F.closeFiles(Files=oneD_data_files, Mute=True)
 # loadFolder()
\ No newline at end of file
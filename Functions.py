@@ -1,11 +1,12 @@
 import fabio, time
-from os import listdir, path, makedirs
+from os import listdir, path, makedirs, cpu_count, walk, replace, scandir
 import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib import dates
 from matplotlib import rc
 from matplotlib import ticker
-from PIL import Image, ImageTk
+from matplotlib import animation
+from PIL import Image, ImageTk, PngImagePlugin
 import png
 import tkinter as tk
 import calendar
@@ -13,7 +14,17 @@ from datetime import date
 from datetime import datetime
 from datetime import timedelta
 import csv
+import sqlite3
+import json
 from tkinter.filedialog import askdirectory
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict, deque
+import threading
+import queue
+import tempfile
+import shutil
+import platform
+import tracemalloc
 
 
 """
@@ -55,9 +66,343 @@ def namesFromFolder(FolderPath, DataType=None):
                 NewNameList.append(FileName)
         FileNames = NewNameList
     return FileNames
-def loadFolder(FolderPath, DataType=None, Mute=False):
+def readEdfHeader(FilePath, BlockSize=512):
     """
-    This function returns a list of image files and a list of corresponding filenames.
+    This function reads only the ASCII header of an edf-file (from '{' up to the closing '}'), not the image data, and returns it as a dictionary (with the same keys and string values as the header of a fabio.image), together with the byte offset where the image data starts. edf headers are padded to a multiple of 512 bytes, so the file is read in blocks of <BlockSize> bytes until '}' is found.
+
+    FilePath:
+        String/path. edf-file to read the header from.
+    BlockSize:
+        int. Number of bytes read at a time.
+    Header:
+        Dictionary. Contains the header entries of the file. None is returned if no header is found.
+    DataOffset:
+        int. Number of bytes from the start of the file to the first byte of image data.
+    """
+    OpenFile = open(FilePath, mode='rb')
+    HeaderBytes = b''
+    HeaderEnd = -1
+    while HeaderEnd == -1:
+        Block = OpenFile.read(BlockSize)
+        if len(Block) == 0:
+            break
+        # Only search the new block.
+        HeaderEnd = Block.find(b'}')
+        if HeaderEnd != -1:
+            HeaderEnd += len(HeaderBytes)
+        HeaderBytes += Block
+    OpenFile.close()
+    HeaderStart = HeaderBytes.find(b'{')
+    if HeaderStart == -1 or HeaderEnd == -1:
+        print('No edf header found in %s' % FilePath)
+        return None, None
+
+    # Image data starts after the newline following '}'.
+    DataOffset = HeaderEnd + 1
+    if HeaderBytes[DataOffset:DataOffset+2] == b'\r\n':
+        DataOffset += 2
+    elif HeaderBytes[DataOffset:DataOffset+1] == b'\n':
+        DataOffset += 1
+
+    Header = {}  # Fill in later
+    HeaderText = HeaderBytes[HeaderStart+1:HeaderEnd].decode('latin-1')
+    for Entry in HeaderText.split(';'):
+        Key, Equals, Value = Entry.partition('=')
+        if Equals:
+            Header[Key.strip()] = Value.strip()
+    return Header, DataOffset
+def getEdfLayout(Header):
+    """
+    This function returns the numpy data type and the shape (rows, columns) of the image data described by an edf header, as read by readEdfHeader(). If the data is compressed (so it can not be read directly from the file), None is returned for both.
+
+    Header:
+        Dictionary. Contains the header of an edf-file.
+    DataType:
+        numpy.dtype. Includes the byte order given in the header.
+    Shape:
+        Tuple (Dim_2, Dim_1), that is (rows, columns).
+    """
+    DataTypes = {'SignedByte': 'i1', 'UnsignedByte': 'u1',
+                 'SignedShort': 'i2', 'UnsignedShort': 'u2',
+                 'SignedInteger': 'i4', 'UnsignedInteger': 'u4',
+                 'SignedLong': 'i4', 'UnsignedLong': 'u4',
+                 'Signed64': 'i8', 'Unsigned64': 'u8',
+                 'FloatValue': 'f4', 'FloatIEEE32': 'f4',
+                 'DoubleValue': 'f8', 'DoubleIEEE64': 'f8'}
+    if Header.get('Compression', 'None').lower() not in ['none', '']:
+        return None, None
+    if Header.get('ByteOrder', 'LowByteFirst') == 'HighByteFirst':
+        ByteOrder = '>'
+    else:
+        ByteOrder = '<'
+    DataType = np.dtype(ByteOrder + DataTypes[Header['DataType']])
+    Shape = (int(Header['Dim_2']), int(Header['Dim_1']))
+    return DataType, Shape
+class FrameStack:
+    """
+    This is a lazy stack of single-image edf-files. Only the headers are read when the stack is made (with readEdfHeader(), as done by loadFolder() with Lazy=True); frames are returned as numpy.memmap views into the files, so no image data is read until the pixels are used. Compressed edf-files can not be memory-mapped and are instead read with fabio when indexed.
+
+    Indexing:
+        stack[i] gives frame i as a 2D numpy.memmap. stack[a:b] (or a list of indices) gives a new FrameStack with those frames. stack[:, y0:y1, x0:x1] gives a FrameStack where each frame is the window [y0:y1, x0:x1] (or stack[i, y0:y1, x0:x1] gives that window of frame i). numpy.array(stack) reads all (windowed) frames into a (frames, rows, columns) array.
+    FilePaths:
+        List of strings/paths. Files of the frames, in order.
+    Headers:
+        List of dictionary. Headers of the files in FilePaths.
+    Offsets:
+        List of int. Byte offset of the image data in each file.
+    Window:
+        Tuple of indexing keys, applied in order to each frame.
+    """
+
+    def __init__(self, FilePaths, Headers, Offsets, Window=()):
+
+        self.FilePaths = list(FilePaths)
+        self.Headers = list(Headers)
+        self.Offsets = list(Offsets)
+        self.Window = tuple(Window)
+
+    def __len__(self):
+
+        return len(self.FilePaths)
+
+    def __iter__(self):
+
+        for Index in range(len(self)):
+            yield self.getFrame(Index)
+
+    def __repr__(self):
+
+        return 'FrameStack(%i frames, shape=%s, dtype=%s)' % (
+            len(self), self.shape, self.dtype)
+
+    @property
+    def shape(self):
+
+        return (len(self),) + np.shape(self.getFrame(0))
+
+    @property
+    def dtype(self):
+
+        DataType, Shape = getEdfLayout(self.Headers[0])
+        if DataType is None:
+            return self.getFrame(0).dtype
+        return DataType.newbyteorder('=')
+
+    def getFrame(self, Index):
+        """
+        Returns frame nbr. <Index> (with Window applied), as a numpy.memmap view if the file is uncompressed.
+        """
+        DataType, Shape = getEdfLayout(self.Headers[Index])
+        if DataType is None:
+            File = fabio.open(self.FilePaths[Index])
+            Frame = File.data
+            File.close()
+        else:
+            Frame = np.memmap(self.FilePaths[Index], dtype=DataType,
+                              mode='r', offset=self.Offsets[Index],
+                              shape=Shape)
+        for Key in self.Window:
+            Frame = Frame[Key]
+        return Frame
+
+    def __getitem__(self, Key):
+
+        if isinstance(Key, tuple):
+            FrameKey, PixelKey = Key[0], Key[1:]
+        else:
+            FrameKey, PixelKey = Key, ()
+        if isinstance(FrameKey, (int, np.integer)):
+            Frame = self.getFrame(FrameKey)
+            if len(PixelKey) > 0:
+                Frame = Frame[PixelKey]
+            return Frame
+        Indices = np.arange(len(self))[FrameKey]
+        Window = self.Window
+        if len(PixelKey) > 0:
+            Window += (PixelKey,)
+        return FrameStack([self.FilePaths[i] for i in Indices],
+                          [self.Headers[i] for i in Indices],
+                          [self.Offsets[i] for i in Indices],
+                          Window=Window)
+
+    def __array__(self, dtype=None, copy=None):
+
+        Array = np.empty(self.shape, dtype=dtype or self.dtype)
+        for Index in range(len(self)):
+            Array[Index] = self.getFrame(Index)
+        return Array
+
+    def close(self):
+        """
+        Nothing is kept open by the stack itself (each memmap view is closed when it is no longer referenced). Kept so a FrameStack can be passed to closeFiles().
+        """
+        return
+def getRoiBounds(Roi, Shape):
+    """
+    This function returns the bounds (RowStart, RowStop, ColStart, ColStop) of a region of interest, limited to a frame of shape <Shape> (rows, columns). Negative values count from the end, and None means the start/end of the frame, as in slicing.
+
+    Roi:
+        Tuple (RowStart, RowStop, ColStart, ColStop). If None, the whole frame.
+    Shape:
+        Tuple of int (rows, columns).
+    """
+    if Roi == None:
+        Roi = (None, None, None, None)
+    RowStart, RowStop, Step = slice(Roi[0], Roi[1]).indices(Shape[0])
+    ColStart, ColStop, Step = slice(Roi[2], Roi[3]).indices(Shape[1])
+    return RowStart, max(RowStop, RowStart), ColStart, max(ColStop, ColStart)
+def readEdfRoi(FilePath, Roi, Header=None, DataOffset=None, Out=None):
+    """
+    This function reads only a region of interest (a window of rows and columns) of the image in an edf-file. For uncompressed files, the file is opened once, and the reads start at the header offset plus the row stride times the first row: narrow windows are read row by row (only the columns of the window), wider ones as one contiguous block of whole rows, which is then cut to the columns of the window. Compressed files are read whole with fabio and cut.
+
+    FilePath:
+        String/path. edf-file to read.
+    Roi:
+        Tuple (RowStart, RowStop, ColStart, ColStop), see getRoiBounds().
+    Header, DataOffset:
+        Dictionary and int. Header and data offset of the file, as returned by readEdfHeader(). Read from the file if None.
+    Out:
+        numpy.array of shape (RowStop-RowStart, ColStop-ColStart). If given, the window is read into it.
+    Window:
+        numpy.array (native byte order) of shape (RowStop-RowStart, ColStop-ColStart). <Out> if given.
+    """
+    if Header == None:
+        Header, DataOffset = readEdfHeader(FilePath)
+    DataType, Shape = getEdfLayout(Header)
+    if DataType is None:
+        File = fabio.open(FilePath)
+        RowStart, RowStop, ColStart, ColStop = getRoiBounds(
+            Roi, np.shape(File.data))
+        Window = File.data[RowStart:RowStop, ColStart:ColStop]
+        File.close()
+        if Out is None:
+            return np.array(Window)
+        Out[:] = Window
+        return Out
+    RowStart, RowStop, ColStart, ColStop = getRoiBounds(Roi, Shape)
+    Height = RowStop - RowStart
+    Width = ColStop - ColStart
+    if Out is None:
+        Out = np.empty((Height, Width), dtype=DataType.newbyteorder('='))
+    RowBytes = Shape[1]*DataType.itemsize
+    OpenFile = open(FilePath, mode='rb')
+    if 4*Width < Shape[1]:
+        # Narrow window: one read of <Width> values per row.
+        Row = np.empty(Width, dtype=DataType)
+        for Index in range(Height):
+            OpenFile.seek(DataOffset + (RowStart + Index)*RowBytes +
+                          ColStart*DataType.itemsize)
+            OpenFile.readinto(Row)
+            Out[Index] = Row
+    else:
+        OpenFile.seek(DataOffset + RowStart*RowBytes)
+        Rows = np.fromfile(OpenFile, dtype=DataType,
+                           count=Height*Shape[1]).reshape(Height, Shape[1])
+        Out[:] = Rows[:, ColStart:ColStop]
+    OpenFile.close()
+    return Out
+def readRoiStack(Frames, Roi=None, Out=None, Workers=1):
+    """
+    This function reads a region of interest of every frame of a FrameStack with readEdfRoi() into one compact (frames, rows, columns) numpy.array, so that only the window is read and held in memory.
+
+    Frames:
+        FrameStack (from loadFolder() with Lazy=True).
+    Roi:
+        Tuple (RowStart, RowStop, ColStart, ColStop), see getRoiBounds(). If None, the whole frames are read.
+    Out:
+        numpy.array of shape (frames, rows, columns) of the window. If given, the frames are read into it.
+    Workers:
+        int. Number of files read concurrently (each into its own frame of the stack). If None, the default of concurrent.futures.ThreadPoolExecutor is used.
+    Stack:
+        numpy.array (native byte order, data type of the files). <Out> if given.
+    """
+    if len(Frames.Window) > 0:
+        # Windowed stack: cut the window of the memory-mapped frames.
+        RowStart, RowStop, ColStart, ColStop = getRoiBounds(
+            Roi, Frames.shape[1:])
+        Window = Frames[:, RowStart:RowStop, ColStart:ColStop]
+        if Out is None:
+            return np.asarray(Window)
+        for Index in range(len(Window)):
+            Out[Index] = Window[Index]
+        return Out
+    Bounds = getRoiBounds(Roi, Frames.shape[1:])
+    if Out is None:
+        Out = np.empty((len(Frames), Bounds[1] - Bounds[0],
+                        Bounds[3] - Bounds[2]), dtype=Frames.dtype)
+    if Workers == 1:
+        for Index in range(len(Frames)):
+            readEdfRoi(Frames.FilePaths[Index], Bounds,
+                       Header=Frames.Headers[Index],
+                       DataOffset=Frames.Offsets[Index], Out=Out[Index])
+        return Out
+    with ThreadPoolExecutor(max_workers=Workers) as Pool:
+        Futures = [Pool.submit(readEdfRoi, Frames.FilePaths[Index], Bounds,
+                               Header=Frames.Headers[Index],
+                               DataOffset=Frames.Offsets[Index],
+                               Out=Out[Index])
+                   for Index in range(len(Frames))]
+        for Future in Futures:
+            Future.result()
+    return Out
+def openImage(FilePath):
+    """
+    This function opens an image file and reads its data, so that it is ready to use when opened in a worker thread. edf-files are opened with fabio (which reads the data), png-files with PIL, followed by load() (PIL otherwise only reads the header, and decodes the data when first used).
+
+    FilePath:
+        String/path. Image file to open.
+    File:
+        Image (fabio-image or PIL.Image-image).
+    """
+    if FilePath.endswith('png'):
+        File = Image.open(FilePath)
+        File.load()
+        return File
+    return fabio.open(FilePath)
+def readConcurrently(Reader, FilePaths, Workers=None, MaxBytes=None):
+    """
+    This generator reads files concurrently in a thread pool and yields the results in the order of <FilePaths>. File reads mostly wait on the disk (and fabio, PIL and numpy release the GIL while reading and decompressing), so on network drives many reads in flight hide the latency of each. Files are submitted ahead of the one being yielded, as long as the total size of the files submitted but not yet yielded is at most <MaxBytes> (at least one file is always in flight).
+
+    Reader:
+        Function. Called as Reader(FilePath) in a worker thread.
+    FilePaths:
+        List of strings/paths. Files to read, in the order the results are yielded.
+    Workers:
+        int. Number of files read concurrently. If None, the default of concurrent.futures.ThreadPoolExecutor is used.
+    MaxBytes:
+        int. Limit on the file sizes (in bytes, as on disk) read ahead. If None, all files are submitted at once.
+    Result:
+        Yielded for each file: the return value of Reader(FilePath).
+    """
+    if MaxBytes == None:
+        Sizes = [0]*len(FilePaths)
+        MaxBytes = 0
+    else:
+        Sizes = [path.getsize(FilePath) for FilePath in FilePaths]
+    with ThreadPoolExecutor(max_workers=Workers) as Pool:
+        InFlight = deque()
+        InFlightBytes = 0
+        Next = 0
+        try:
+            while Next < len(FilePaths) or len(InFlight) > 0:
+                while Next < len(FilePaths) and (
+                        len(InFlight) == 0 or
+                        InFlightBytes + Sizes[Next] <= MaxBytes):
+                    InFlight.append((Pool.submit(Reader, FilePaths[Next]),
+                                     Sizes[Next]))
+                    InFlightBytes += Sizes[Next]
+                    Next += 1
+                Future, Size = InFlight.popleft()
+                InFlightBytes -= Size
+                yield Future.result()
+        finally:
+            # Stopped early (or a read failed): skip files not started.
+            for Future, Size in InFlight:
+                Future.cancel()
+def loadFolder(FolderPath, DataType=None, Mute=False, Lazy=False,
+               Roi=None, Workers=None, MaxBytes=None):
+    """
+    This function returns a list of image files and a list of corresponding filenames. The files (or, with <Lazy> or <Roi>, the headers and windows) are read concurrently in a thread pool with readConcurrently(), in the sorted order of the filenames.
 
     FolderPath:
         String/path. Folder/directory in which to search for images to open
@@ -65,8 +410,16 @@ def loadFolder(FolderPath, DataType=None, Mute=False):
         String. If specified (not None), only files with names ending with <DataType> are included, otherwise all files are included. edf-files are opened with fabio, png with PIL. To allow other data types to be opened, modify the endswith()-expressions and check that fabio or PIL supports the format, or add another module.
     Mute:
         bool. If true, skip print operations (except for unexpected behavior).
+    Lazy:
+        bool. If true (only for edf-files), only the headers are read, and Files is a FrameStack whose frames are memory-mapped from the files when indexed. Files without a valid edf header are left out (of Files and FileNames).
+    Roi:
+        Tuple (RowStart, RowStop, ColStart, ColStop), see getRoiBounds(). If given (only for edf-files), only this window of each image is read (with readRoiStack()), and Files is a compact (files, rows, columns) numpy.array.
+    Workers:
+        int. Number of files read concurrently. If None, the default of concurrent.futures.ThreadPoolExecutor is used. With 1, the files are read one at a time.
+    MaxBytes:
+        int. Limit on the size (in bytes, as on disk) of the files read ahead of the one being stored, see readConcurrently(). If None, there is no limit.
     Files:
-        List of images (fabio-image or PIL.Image-image)
+        List of images (fabio-image or PIL.Image-image), FrameStack if <Lazy> is True, or numpy.array if <Roi> is given.
     FileNames:
         List of strings. Contains the filenames (without directories) of the files in Files (in the same order).
     """
@@ -77,22 +430,57 @@ def loadFolder(FolderPath, DataType=None, Mute=False):
 
     if len(FileNames) > 0:
         """File(s) found"""
-        if FileNames[0].endswith('edf'):  # Test the first file
+        if (Lazy or Roi != None) and FileNames[0].endswith('edf'):
             if not Mute:
-                print('\nLoading files with fabio...')
-            for index in range(len(FileNames)):
-                FilePath = path.join(FolderPath, FileNames[index])
-                Files.append(fabio.open(FilePath))
+                print('\nReading headers of %i files...' % len(FileNames))
+            FilePaths = [path.join(FolderPath, FileName)
+                         for FileName in FileNames]
+            Headers = []  # Fill in later
+            Offsets = []  # Fill in later
+            for Header, DataOffset in readConcurrently(
+                    readEdfHeader, FilePaths, Workers=Workers):
+                Headers.append(Header)
+                Offsets.append(DataOffset)
+            # Files without an edf header (reported by readEdfHeader()).
+            Valid = [Index for Index, Header in enumerate(Headers)
+                     if Header != None]
+            if len(Valid) < len(FileNames):
+                print('%i file(s) without an edf header left out' %
+                      (len(FileNames) - len(Valid)))
+                if len(Valid) == 0:
+                    return None, None
+                FileNames = [FileNames[Index] for Index in Valid]
+                FilePaths = [FilePaths[Index] for Index in Valid]
+                Headers = [Headers[Index] for Index in Valid]
+                Offsets = [Offsets[Index] for Index in Valid]
+            Files = FrameStack(FilePaths, Headers, Offsets)
+            if Roi != None:
+                Files = readRoiStack(Files, Roi, Workers=Workers)
                 if not Mute:
-                    print('File loaded with fabio: ' + FilePath)
-        elif FileNames[0].endswith('png'):
+                    print('Window %s of %i files read from: %s' %
+                          (str(Roi), len(FileNames), FolderPath))
+            elif not Mute:
+                print('FrameStack made from: ' + FolderPath)
+            return Files, FileNames
+        elif Lazy or Roi != None:
+            print('Lazy loading and Roi are only possible for edf-files')
+            return None, None
+        elif FileNames[0].endswith('edf') or FileNames[0].endswith('png'):
+            # Test the first file
+            if FileNames[0].endswith('edf'):
+                Module = 'fabio'
+            else:
+                Module = 'PIL'
             if not Mute:
-                print('\nLoading files with PIL...')
-            for index in range(len(FileNames)):
-                FilePath = path.join(FolderPath, FileNames[index])
-                Files.append(Image.open(FilePath))
+                print('\nLoading files with %s...' % Module)
+            FilePaths = [path.join(FolderPath, FileName)
+                         for FileName in FileNames]
+            Opened = readConcurrently(openImage, FilePaths, Workers=Workers,
+                                      MaxBytes=MaxBytes)
+            for FilePath, File in zip(FilePaths, Opened):
+                Files.append(File)
                 if not Mute:
-                    print('File loaded with PIL: ' + FilePath)
+                    print('File loaded with %s: %s' % (Module, FilePath))
         else:
             """DataType not expected"""
             print('No files loaded')
@@ -145,18 +533,21 @@ def closeFiles(Files, Mute=False):
     This function closes a list of files.
 
     Files:
-        List of objects with a close() method
+        List of objects with a close() method, or a FrameStack.
     Mute:
         bool. If true, skip print operations.
     """
 
-    for index in range(len(Files)):
-        Files[index].close()
+    if isinstance(Files, FrameStack):
+        Files.close()
+    else:
+        for index in range(len(Files)):
+            Files[index].close()
     if not Mute:
         print('\nFiles closed with fabio/PIL/etc. ...')
 
 """Plot/display functions:"""
-def displayFile(File, FileName, Duration, Mute=False):
+def displayFile(File, FileName, Duration, Mute=False, Clim=None):
     """
     This function displays a fabio image file with matplotlib.pyplot. The image must be grayscale (single channel). The display normalizes the grayscale range to the data range of the image.
 
@@ -168,47 +559,321 @@ def displayFile(File, FileName, Duration, Mute=False):
         Float. Nbr. of seconds to display the image
     Mute:
         bool. If true, skip print operations.
+    Clim:
+        Tuple (min, max). Grayscale limits, for instance of the whole scan from getScanClim(). If None, the data range of the image is used.
     """
 
+    if Clim == None:
+        Clim = (File.getmin(), File.getmax())
     fig = plt.figure()
     ax = fig.gca()
     imgplot = ax.imshow(File.data,
                         cmap='gray',
-                        clim=(File.getmin(), File.getmax()))
+                        clim=Clim)
     if not Mute:
         print('Showing file %s' % FileName)
     plt.pause(Duration)
     plt.close(fig)
-def displayFiles(Files, FileNames, fps=1000.0, Mute=False):
+def displayFiles(Files, FileNames, fps=1000.0, Mute=False, Clim=None):
     """
-    This function displays consecutively images from a list of fabio image files with matplotlib.pyplot. The images must be grayscale (single channel). The display normalizes the grayscale range to the data range of each image.
+    This function displays consecutively images from a list of fabio image files with matplotlib.pyplot. The images must be grayscale (single channel). The display normalizes the grayscale range to the data range of each image. The images are played with playFrames(), so they are read and normalized in a background thread, and the achieved frame rate is printed.
 
     Files:
-        List of fabio.image. Files to display
+        List of fabio.image, or FrameStack. Files to display
     FileNames:
         List of strings. Filenames of the image (only needed to print info)
     fps:
         Float. Nbr. of images to display per second
     Mute:
         bool. If true, skip print operations.
+    Clim:
+        Tuple (min, max). Grayscale limits for all images, for instance of the whole scan from getScanClim(), which avoids flicker and the per-frame min/max. If None, each image is normalized to its own data range.
     """
 
-    fig = plt.figure()
-    ax = fig.gca()
-    imgplot = ax.imshow(Files[0].data, cmap='gray', clim=(
-        Files[0].getmin(), Files[0].getmax()))
-    if not Mute:
-        print('Showing file %s' % FileNames[0])
-    plt.pause(1/fps)
-    for index in range(len(Files)-1):
-        imgplot.set_data(Files[index].data)
-        imgplot.set_clim(Files[index].getmin(), Files[index].getmax())
-        if not Mute:
-            print('Showing file %s' % FileNames[index])
-        plt.pause(1/fps)
-    plt.close(fig)
+    playFrames(Files, FileNames, fps=fps, Mute=Mute, Clim=Clim)
     closeFiles(Files)
+def getFrameData(Frames, Index):
+    """
+    This function returns image nbr. <Index> of a frame source as a 2D numpy.array: a FrameStack, or a list of fabio.image, PIL.Image or numpy.array.
+    """
+    Frame = Frames[Index]
+    if hasattr(Frame, 'data') and not isinstance(Frame, np.ndarray):
+        return Frame.data
+    return np.asarray(Frame)
+class MoviePlayer:
+    """
+    This is a player of image frames with matplotlib which does not block on file reads. A worker thread reads the frames (from a lazy FrameStack, or a list of loaded images), scales them to 8 bits with their own min/max (as displayFiles() did) or with a fixed <Clim>, and puts them into a bounded queue of <BufferSize> frames. The figure is updated with matplotlib.animation.FuncAnimation with blitting, so only the image is redrawn, at the requested <fps>. If the worker falls behind, the last frame stays on screen (counted as a stall) instead of slowing down the timer. The achieved frame rate is printed when playback ends and returned by getStats().
+
+    Frames:
+        FrameStack (from loadFolder() with Lazy=True), or list of fabio.image, PIL.Image or numpy.array. Frames to play.
+    FileNames:
+        List of strings. Filenames of the frames (only needed to print info).
+    fps:
+        Float. Requested nbr. of frames per second.
+    BufferSize:
+        int. Maximum number of decoded frames waiting to be shown.
+    Clim:
+        Tuple (min, max) of data values mapped to black and white for all frames. If None, each frame is scaled to its own min/max.
+    Loop:
+        bool. If true, playback restarts after the last frame until the figure is closed.
+    Mute:
+        bool. If true, skip print operations.
+    """
+
+    def __init__(self, Frames, FileNames=None, fps=25.0, BufferSize=16,
+                 Clim=None, Loop=False, Mute=False):
+
+        self.Frames = Frames
+        self.FileNames = FileNames
+        self.fps = fps
+        self.Clim = Clim
+        self.Loop = Loop
+        self.Mute = Mute
+        self.Buffer = queue.Queue(maxsize=BufferSize)
+        self.Stop = threading.Event()
+        self.Worker = None
+        self.Image = None
+        self.Figure = None
+        self.Animation = None
+        self.Shown = 0
+        self.Stalls = 0
+        self.StartTime = None
+        self.StopTime = None
+        self.Error = None  # Exception raised by the worker thread, if any
+
+    def scaleFrame(self, Data):
+        """
+        Returns <Data> scaled to uint8 (0 to 255) with Clim, or with its own min/max if Clim is None.
+        """
+        if self.Clim == None:
+            Low, High = np.min(Data), np.max(Data)
+        else:
+            Low, High = self.Clim
+        Scale = 255/max(float(High) - float(Low), 1e-12)
+        Scaled = (np.asarray(Data, dtype=np.float32) - float(Low))*Scale
+        return np.clip(Scaled, 0, 255, out=Scaled).astype(np.uint8)
+
+    def readFrames(self):
+        """
+        Worker thread: reads and scales the frames in order into the buffer, then puts None (end of playback). If a frame can not be read, the exception is kept in Error and playback ends there.
+        """
+        try:
+            while not self.Stop.is_set() and len(self.Frames) > 0:
+                for Index in range(len(self.Frames)):
+                    Item = (Index, self.scaleFrame(getFrameData(self.Frames,
+                                                                Index)))
+                    while not self.Stop.is_set():
+                        try:
+                            self.Buffer.put(Item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if self.Stop.is_set():
+                        return
+                if not self.Loop:
+                    break
+        except Exception as e:
+            self.Error = e
+            print('Playback stopped, frame could not be read: %s' % e)
+        finally:
+            while not self.Stop.is_set():
+                try:
+                    self.Buffer.put(None, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+    def start(self):
+        """
+        Starts the worker thread and makes the figure with the first frame. Returns the figure, or None if there is no frame to show.
+        """
+        self.Worker = threading.Thread(target=self.readFrames, daemon=True)
+        self.Worker.start()
+        Item = self.Buffer.get()
+        if Item is None:
+            self.Stop.set()
+            if self.Error == None:
+                print('No frames to play')
+            return None
+        self.Figure = plt.figure()
+        ax = self.Figure.gca()
+        self.Image = ax.imshow(Item[1], cmap='gray', vmin=0, vmax=255,
+                               animated=True)
+        self.showItem(Item)
+        self.StartTime = time.perf_counter()
+        return self.Figure
+
+    def showItem(self, Item):
+
+        self.Image.set_data(Item[1])
+        self.Shown += 1
+        if not self.Mute and self.FileNames != None:
+            print('Showing file %s' % self.FileNames[Item[0]])
+
+    def update(self, FrameNumber=None):
+        """
+        Shows the next decoded frame, if there is one (called by FuncAnimation). Returns the updated artists.
+        """
+        if self.StopTime != None:
+            return [self.Image]
+        try:
+            Item = self.Buffer.get_nowait()
+        except queue.Empty:
+            self.Stalls += 1
+            return [self.Image]
+        if Item is None:
+            self.finish()
+            plt.close(self.Figure)
+        else:
+            self.showItem(Item)
+        return [self.Image]
+
+    def finish(self):
+        """
+        Stops the worker thread and prints the achieved frame rate.
+        """
+        if self.StopTime != None:
+            return
+        self.StopTime = time.perf_counter()
+        self.Stop.set()
+        if self.Animation != None and self.Animation.event_source != None:
+            self.Animation.event_source.stop()
+        if not self.Mute:
+            Stats = self.getStats()
+            print('%i frames shown at %.1f fps (requested %.1f fps), %i stalls' %
+                  (Stats['Shown'], Stats['Achieved'], self.fps,
+                   Stats['Stalls']))
+
+    def getStats(self):
+        """
+        Returns a dictionary of 'Shown' (nbr. of frames), 'Requested' and 'Achieved' (frames per second) and 'Stalls' (timer updates without a new frame).
+        """
+        StopTime = self.StopTime or time.perf_counter()
+        Elapsed = StopTime - (self.StartTime or StopTime)
+        # The first frame is shown before the timer starts.
+        Achieved = (self.Shown - 1)/Elapsed if Elapsed > 0 else 0.0
+        return {'Shown': self.Shown, 'Requested': self.fps,
+                'Achieved': Achieved, 'Stalls': self.Stalls}
+
+    def play(self):
+        """
+        Plays the frames (blocks until the last frame is shown or the figure is closed). Returns getStats().
+        """
+        if self.start() == None:
+            return self.getStats()
+        self.Animation = animation.FuncAnimation(
+            self.Figure, self.update, interval=1000/self.fps, blit=True,
+            cache_frame_data=False)
+        plt.show()
+        self.finish()
+        return self.getStats()
+def playFrames(Frames, FileNames=None, fps=25.0, BufferSize=16, Clim=None,
+               Loop=False, Mute=False):
+    """
+    This function plays image frames as a movie with MoviePlayer (frames are read and scaled in a background thread, and the display is updated with blitting), and returns the achieved frame rate. A FrameStack can be played without loading the folder first, for instance a long timescan:
+        Frames, FileNames = loadFolder(FolderPath, DataType='edf', Lazy=True)
+        playFrames(Frames, FileNames, fps=25)
 
+    Frames, FileNames, fps, BufferSize, Clim, Loop, Mute:
+        As in MoviePlayer.
+    Stats:
+        Dictionary, as returned by MoviePlayer.getStats().
+    """
+    Player = MoviePlayer(Frames, FileNames=FileNames, fps=fps,
+                         BufferSize=BufferSize, Clim=Clim, Loop=Loop,
+                         Mute=Mute)
+    return Player.play()
+
+def getScanHistogram(FolderPath, DataType='edf', CachePath=None, Mute=False):
+    """
+    This function returns the histogram of all pixel values of all (edf) images in a folder, with one bin per value (65536 bins for 16-bit data), in a single streaming pass (one memory-mapped frame at a time, see FrameStack). The histogram is cached in an npz-file next to the data, which is used as long as the names, modification times and sizes of the files are unchanged. Percentile limits for display and export are then found in O(65536) with getClimFromHistogram().
+
+    FolderPath:
+        String/path. Folder of the scan.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included.
+    CachePath:
+        String/path. npz-file of the cached histogram. If None, 'histogram_<DataType>.npz' in <FolderPath> is used.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Histogram:
+        numpy.array (int64). Histogram[v] is the number of pixels with value v. None if no files are found or the data is not unsigned 8 or 16-bit.
+    """
+    if CachePath == None:
+        CachePath = path.join(FolderPath, 'histogram_%s.npz' %
+                              str(DataType).replace('.', '_'))
+    FileNames = namesFromFolder(FolderPath, DataType=DataType)
+    if len(FileNames) == 0:
+        print('No files found in %s' % FolderPath)
+        return None
+    Key = json.dumps([[FileName,
+                       path.getmtime(path.join(FolderPath, FileName)),
+                       path.getsize(path.join(FolderPath, FileName))]
+                      for FileName in FileNames])
+    if path.isfile(CachePath):
+        with np.load(CachePath) as Cached:
+            if str(Cached['Key']) == Key:
+                return Cached['Histogram']
+
+    Frames, FileNames = loadFolder(FolderPath, DataType=DataType, Mute=True,
+                                   Lazy=True)
+    try:
+        if Frames.dtype not in [np.uint8, np.uint16]:
+            raise MyException('Histogram needs unsigned 8 or 16-bit data, not %s' %
+                              Frames.dtype)
+    except MyException as e:
+        print(e)
+        return None
+    Histogram = np.zeros(2**(8*Frames.dtype.itemsize), dtype=np.int64)
+    StartTime = time.perf_counter()
+    for Frame in Frames:
+        Histogram += np.bincount(np.asarray(Frame).ravel(),
+                                 minlength=len(Histogram))
+    try:
+        with open(CachePath, 'wb') as OpenFile:
+            np.savez(OpenFile, Key=Key, Histogram=Histogram)
+    except OSError as e:
+        print('Histogram not cached: %s' % e)
+    if not Mute:
+        print('Histogram of %i files made in %.1f s' %
+              (len(Frames), time.perf_counter() - StartTime))
+    return Histogram
+def getClimFromHistogram(Histogram, Low=0.5, High=99.5):
+    """
+    This function returns the data values at two percentiles of a histogram from getScanHistogram(), to be used as grayscale limits (clim) for all frames of a scan.
+
+    Histogram:
+        numpy.array. Histogram[v] is the number of pixels with value v.
+    Low, High:
+        Float. Percentiles (0 to 100) mapped to black and white.
+    Clim:
+        Tuple of int (min, max). High is at least min + 1.
+    """
+    Cumulative = np.cumsum(Histogram)
+    Total = Cumulative[-1]
+    Minimum = int(np.searchsorted(Cumulative, Total*Low/100, side='right'))
+    Maximum = int(np.searchsorted(Cumulative, Total*High/100, side='left'))
+    return Minimum, max(Maximum, Minimum + 1)
+def getScanClim(FolderPath, Low=0.5, High=99.5, DataType='edf', Mute=False):
+    """
+    This function returns grayscale limits (clim) at the percentiles <Low> and <High> of all pixels of a scan, from the (cached) histogram of getScanHistogram(). The same limits can be used for display (displayFile(), displayFiles(), MoviePlayer) and export (saveAs(), convertFolder()), for instance 'scan 0.5-99.5 %':
+        Clim = getScanClim(FolderPath, 0.5, 99.5)
+
+    FolderPath:
+        String/path. Folder of the scan.
+    Low, High:
+        Float. Percentiles (0 to 100).
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Clim:
+        Tuple of int (min, max). None if no histogram could be made.
+    """
+    Histogram = getScanHistogram(FolderPath, DataType=DataType, Mute=Mute)
+    if Histogram is None:
+        return None
+    return getClimFromHistogram(Histogram, Low=Low, High=High)
 """Get metadata from edf-files:"""
 def getScanType(Header):
     """
@@ -460,6 +1125,138 @@ def getNewFileName(FileName, Header):
             return newFileName[1:].replace('.', 'point')
         else:
             return newFileName.replace('.', 'point')
+def decodeScanSteps(Headers, FileNames=None):
+    """
+    This function decodes the scan steps of many files at once, giving the same steps as getScanSteps() (and getScanLocation()) for each file. getScanType() and getScanParameters() are run only once per unique 'scan' entry, and the steps are then computed for all files of that scan with numpy, so a whole folder is decoded in one pass.
+
+    Headers:
+        List of dictionary (headers of edf-files from ESRF ID06), or a HeaderIndex as returned by indexFolder() (in which case <FileNames> is taken from it).
+    FileNames:
+        List of strings. Filenames of the files whose headers are <Headers> (needed for the 'zapline-diffry' and 'zapimage-mosaicity' ScanTypes, see getScanLocation()).
+    Decoded:
+        Dictionary with the following entries:
+        'ScanTypes':    numpy.array (object) of ScanType of each file, as given by getScanType(). None if not recognized.
+        'Steps':        Dictionary of step name ('diffry', 'chi', 'obpitch', 'time', 'obxyz', 'diffty', as in getScanSteps()): numpy.array (int) of the zero-indexed step of each file. -1 where the scan does not have that step.
+        'Values':       Dictionary of motor name ('diffry', 'chi', 'obpitch'): numpy.array (float) of the motor position of each file, for the motors returned by getScanLocation() ('mosaicity' and 'strain'). For the zap ScanTypes, where the motors move during each image, the nominal position of the step is found from the limits in the scan command. NaN elsewhere.
+    """
+    if isinstance(Headers, dict):
+        FileNames = Headers['FileNames']
+        Headers = Headers['Headers']
+    NFiles = len(Headers)
+    ScanTypes = np.full(NFiles, None, dtype=object)
+    Steps = {}  # Fill in below
+    for StepName in ['diffry', 'chi', 'obpitch', 'time', 'obxyz', 'diffty']:
+        Steps[StepName] = np.full(NFiles, -1, dtype=int)
+    Values = {}  # Fill in below
+    for MotorName in ['diffry', 'chi', 'obpitch']:
+        Values[MotorName] = np.full(NFiles, np.nan)
+
+    # Group files by their 'scan' entry.
+    Scans = {}  # Fill in below: scan: list of file indices
+    for Index, Header in enumerate(Headers):
+        Scans.setdefault(Header.get('scan'), []).append(Index)
+    Motors = None  # MotorTable, made below if needed
+    for Scan, Indices in Scans.items():
+        if Scan == None:
+            continue
+        Indices = np.array(Indices)
+        Header = Headers[Indices[0]]
+        ScanType = getScanType(Header)
+        ScanTypes[Indices] = ScanType
+        if ScanType in ['mosaicity', 'strain']:
+            if ScanType == 'mosaicity':
+                diffryN = getScanParameters(Header)[0]
+                MotorNames = ['diffry', 'chi']
+            else:
+                diffryN = getScanParameters(Header)
+                MotorNames = ['diffry', 'obpitch']
+            Run = np.array([int(Headers[Index]['run'])
+                            for Index in Indices])
+            Steps['diffry'][Indices] = Run % (diffryN+1)
+            Steps[MotorNames[1]][Indices] = Run // (diffryN+1)
+            if Motors == None:
+                Motors = MotorTable(Headers)
+            for Name in MotorNames:
+                Values[Name][Indices] = Motors[Name][Indices]
+        elif ScanType in ['timescan', 'loopscan', 'obfoc', 'diffty']:
+            StepName = {'timescan': 'time', 'loopscan': 'time',
+                        'obfoc': 'obxyz', 'diffty': 'diffty'}[ScanType]
+            Steps[StepName][Indices] = [int(Headers[Index]['run'])
+                                        for Index in Indices]
+        elif ScanType in ['zapline-diffry', 'zapimage-mosaicity']:
+            if ScanType == 'zapline-diffry':
+                StepName = 'time'
+            else:
+                StepName = 'chi'
+            Steps['diffry'][Indices] = [int(Headers[Index]['acq_frame_nb'])
+                                        for Index in Indices]
+            Steps[StepName][Indices] = [int(FileNames[Index][-18:-14])-1
+                                        for Index in Indices]
+            # Nominal positions: Min + (Max-Min)*Step/N (scan[2:5], scan[7:10]).
+            scan = Header['scan'].split()
+            Limits = [('diffry', scan[2:5])]
+            if ScanType == 'zapimage-mosaicity':
+                Limits.append(('chi', scan[7:10]))
+            for Name, (Min, Max, N) in Limits:
+                Min, Max, N = float(Min), float(Max), max(int(N), 1)
+                Values[Name][Indices] = (Min + (Max - Min) *
+                                         Steps[Name][Indices]/N)
+    return {'ScanTypes': ScanTypes, 'Steps': Steps, 'Values': Values}
+def getNewFileNames(FileNames, Headers, Decoded=None):
+    """
+    This function returns the same new filenames as getNewFileName() for a list of files, but decodes all scan steps at once with decodeScanSteps() instead of classifying the scan of each file separately.
+
+    FileNames:
+        List of strings. Filenames of the edf-files whose headers are <Headers>.
+    Headers:
+        List of dictionary. Contains the headers of the edf-files from ESRF ID06 named <FileNames>.
+    Decoded:
+        Dictionary returned by decodeScanSteps() for these files. If None, it is found here.
+    newFileNames:
+        List of strings (or None where the scan is not recognized). No data type suffix is added.
+    """
+    if Decoded == None:
+        Decoded = decodeScanSteps(Headers, FileNames=FileNames)
+    Steps = Decoded['Steps']
+    newFileNames = []  # Fill in later
+    for Index, FileName in enumerate(FileNames):
+        ScanType = Decoded['ScanTypes'][Index]
+        if ScanType in ['mosaicity', 'zapimage-mosaicity']:
+            StepString = '-D%iC%i' % (Steps['diffry'][Index],
+                                      Steps['chi'][Index])
+        elif ScanType == 'strain':
+            StepString = '-D%iO%i' % (Steps['diffry'][Index],
+                                      Steps['obpitch'][Index])
+        elif ScanType in ['timescan', 'loopscan']:
+            StepString = '-T%i' % Steps['time'][Index]
+        elif ScanType == 'zapline-diffry':
+            StepString = '-D%iT%i' % (Steps['diffry'][Index],
+                                      Steps['time'][Index])
+        elif ScanType == 'obfoc':
+            scan = Headers[Index]['scan'].split()
+            StepString = '-O'
+            for Letter in ['x', 'y', 'z']:
+                if 'ob' + Letter in scan:
+                    StepString += Letter
+            StepString += '%i' % Steps['obxyz'][Index]
+        elif ScanType == 'none':
+            StepString = ''
+        elif ScanType == 'diffty':
+            StepString = '-Y%i' % Steps['diffty'][Index]
+        else:
+            newFileNames.append(None)
+            continue
+        if ScanType in ['zapline-diffry', 'zapimage-mosaicity']:
+            newFileName = FileName[0:-19] + StepString
+        else:
+            newFileName = FileName[0:-9] + StepString
+        if newFileName[0] == '-':
+            # Guard against names starting with '-', as getNewFileName().
+            newFileName = newFileName[1:]
+        newFileNames.append(newFileName.replace('.', 'point'))
+    return newFileNames
+""" Dictionary of motor_mne entry: {motor name: column}, used by getMotorValue() and MotorTable (the same motor_mne is shared by many files)."""
+MotorColumnsCache = {}
 def getMotorValue(Header, Name):
     """
     This function returns the motor value in Header whose name is <Name>. The function is based on the syntax of headers from edf files from ESRF ID06, in that there is an entry with motor names in the header, and an entry with the corresponding motor positions in the same order. No failsafe is implemented.
@@ -470,8 +1267,12 @@ def getMotorValue(Header, Name):
         String. Motor name to search for.
     """
     motor_pos = Header['motor_pos'].split()  # Motor positions
-    motor_mne = Header['motor_mne'].split()  # Motor Names
-    index = motor_mne.index(Name)  # Find <name> entry
+    if Header['motor_mne'] not in MotorColumnsCache:
+        # Motor Names, split and searched once per motor_mne entry.
+        MotorColumnsCache[Header['motor_mne']] = dict(
+            (MotorName, index) for index, MotorName in
+            reversed(list(enumerate(Header['motor_mne'].split()))))
+    index = MotorColumnsCache[Header['motor_mne']][Name]  # Find <name>
     return float(motor_pos[index])
 def motorPosArray(Header):
     """
@@ -499,6 +1300,200 @@ def getMovedMotors(Header1, Header2):
         MovedMotors.append(
             (MotorNames1[index], str(MotorPosDifference[index])))
     return MovedMotors
+class MotorTable:
+    """
+    This is a table of the motor positions of many edf-files from ESRF ID06, made once (for instance per folder) so that motor positions do not have to be found by splitting the 'motor_mne' and 'motor_pos' entries of each header again. Files with identical 'motor_mne' entries share the name-to-column lookup and are parsed together.
+
+    Headers:
+        List of dictionary (headers of edf-files from ESRF ID06), or a HeaderIndex as returned by indexFolder().
+    Names:
+        List of strings. All motor names found, in the order first found.
+    Columns:
+        Dictionary of motor name: column in Positions.
+    Positions:
+        numpy.array (float64) of shape (files, motors). NaN where a motor is not in the header of a file, or where its 'motor_pos' entry can not be read.
+
+    table['diffry'] gives the column of diffry positions of all files.
+    """
+
+    def __init__(self, Headers):
+
+        if isinstance(Headers, dict):
+            Headers = Headers['Headers']
+        # Group files by their motor_mne entry.
+        Groups = {}  # Fill in below: motor_mne: list of file indices
+        for Index, Header in enumerate(Headers):
+            Groups.setdefault(Header.get('motor_mne', ''), []).append(Index)
+        self.Names = []  # Fill in below
+        self.Columns = {}  # Fill in below
+        for motor_mne in Groups:
+            for Name in motor_mne.split():
+                if Name not in self.Columns:
+                    self.Columns[Name] = len(self.Names)
+                    self.Names.append(Name)
+        self.Positions = np.full((len(Headers), len(self.Names)), np.nan)
+        for motor_mne, Indices in Groups.items():
+            GroupNames = motor_mne.split()
+            if len(GroupNames) == 0:
+                continue
+            GroupColumns = [self.Columns[Name] for Name in GroupNames]
+            try:
+                # All motor positions of the group parsed at once.
+                GroupPositions = np.array(
+                    ' '.join(Headers[Index].get('motor_pos', '')
+                             for Index in Indices)
+                    .split(), dtype=float).reshape(len(Indices),
+                                                   len(GroupNames))
+            except ValueError:
+                # A bad motor_pos in the group: parse file by file.
+                GroupPositions = np.full((len(Indices), len(GroupNames)),
+                                         np.nan)
+                for Row, Index in enumerate(Indices):
+                    try:
+                        Positions = np.array(
+                            Headers[Index].get('motor_pos', '').split(),
+                            dtype=float)
+                        if len(Positions) != len(GroupNames):
+                            raise ValueError('Wrong number of positions')
+                        GroupPositions[Row] = Positions
+                    except ValueError:
+                        print('Bad motor_pos in header of file nbr. %i, positions set to NaN' %
+                              Index)
+            self.Positions[np.ix_(Indices, GroupColumns)] = GroupPositions
+
+    def __len__(self):
+
+        return len(self.Positions)
+
+    def __getitem__(self, Name):
+
+        return self.Positions[:, self.Columns[Name]]
+
+    def __repr__(self):
+
+        return 'MotorTable(%i files, %i motors)' % self.Positions.shape
+
+    def getMovedMotors(self, Index1, Index2):
+        """
+        Returns the moved motors from file nbr. <Index1> to file nbr. <Index2>, in the same form as getMovedMotors().
+        """
+        MotorPosDifference = self.Positions[Index2] - self.Positions[Index1]
+        MovedMotors = []  # Fill in later
+        for index in np.flatnonzero(MotorPosDifference).tolist():
+            if not np.isnan(MotorPosDifference[index]):
+                MovedMotors.append(
+                    (self.Names[index], str(MotorPosDifference[index])))
+        return MovedMotors
+
+    def getMoved(self):
+        """
+        Returns a boolean numpy.array of shape (files-1, motors) which is True where a motor moved from one file to the next, found with a single numpy.diff().
+        """
+        return np.diff(self.Positions, axis=0) != 0
+def getHeaderDatetime(Header):
+    """
+    This function returns the time of acquisition in a header of an edf-file from ESRF ID06, from the 'time' entry (or 'date' if there is no 'time' entry), which is of the form 'Mon Jun 18 21:45:18 2018'.
+
+    Header:
+        Dictionary. Contains the header of an edf-file from ESRF ID06.
+    HeaderDatetime:
+        datetime.datetime. None is returned if no time is found, or if it can not be read (which is reported).
+    """
+    if 'time' in Header:
+        HeaderDate = Header['time']
+    elif 'date' in Header:
+        HeaderDate = Header['date']
+    else:
+        return None
+    try:
+        # Joined again to remove double spaces (before one-digit days).
+        return datetime.strptime(' '.join(HeaderDate.split()),
+                                 '%a %b %d %H:%M:%S %Y')
+    except ValueError:
+        print('Time of acquisition not understood: %s' % HeaderDate)
+        return None
+def getScanSteps(Header, FileName=None):
+    """
+    This function returns the step number(s) of the scan that a file is at, as found with getScanLocation(), in a dictionary where each step is named by the motor (or time) it belongs to. The names are the same as the letters used by getNewFileName():
+        'diffry': D, 'chi': C, 'obpitch': O (strain), 'time': T, 'obxyz': O (obfoc), 'diffty': Y.
+
+    Header:
+        Dictionary. Contains the header of an edf-file from ESRF ID06.
+    FileName:
+        String. Filename of the edf-file whose header is <Header> (needed for the 'zapline-diffry' and 'zapimage-mosaicity' ScanTypes, see getScanLocation()).
+    Steps:
+        Dictionary of step name: zero-indexed step (int). Empty if the scan has no steps or is not recognized.
+    """
+    ScanType = getScanType(Header)
+    if ScanType == None or ScanType == 'none':
+        return {}
+    Location = getScanLocation(Header, FileName=FileName)
+    if ScanType in ['mosaicity', 'zapimage-mosaicity']:
+        if ScanType == 'mosaicity':
+            Location = Location[2:]
+        return {'diffry': Location[0], 'chi': Location[1]}
+    elif ScanType == 'strain':
+        return {'diffry': Location[2], 'obpitch': Location[3]}
+    elif ScanType == 'zapline-diffry':
+        return {'diffry': Location[0], 'time': Location[1]}
+    elif ScanType in ['timescan', 'loopscan']:
+        return {'time': Location}
+    elif ScanType == 'obfoc':
+        return {'obxyz': Location}
+    elif ScanType == 'diffty':
+        return {'diffty': Location}
+def indexFolder(FolderPath, DataType='edf', Workers=None):
+    """
+    This function reads the headers (only, with readEdfHeader()) of all edf-files in a folder and returns an index of the most used header entries. No image data is read, so this is much faster than opening the files with fabio. The headers are read concurrently in a thread pool, which hides the latency of network drives.
+
+    FolderPath:
+        String/path. Folder/directory in which to search for edf-files.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included, otherwise all files are included.
+    Workers:
+        int. Number of headers read concurrently. If None, the default of concurrent.futures.ThreadPoolExecutor is used.
+    HeaderIndex:
+        Dictionary with the following entries, each a list in the same order as 'FileNames' (sorted alphabetically). Entries missing in a header are given as None.
+        'Folder':       FolderPath.
+        'FileNames':    Filenames (without directories).
+        'Headers':      Complete headers (dictionaries).
+        'Offsets':      Byte offsets of the image data in the files.
+        'scan':         Scan command.
+        'run':          Run number (int).
+        'acq_frame_nb': Acquisition frame number (int).
+        'time':         Time of acquisition ('time' entry, or 'date' if there is no 'time' entry).
+        'Motors':       Dictionaries of motor name: motor position (float). Empty if the header has no (readable) motor positions.
+    """
+    FileNames = namesFromFolder(FolderPath, DataType=DataType)
+    FilePaths = [path.join(FolderPath, FileName) for FileName in FileNames]
+    with ThreadPoolExecutor(max_workers=Workers) as Pool:
+        Results = list(Pool.map(readEdfHeader, FilePaths))
+
+    HeaderIndex = {'Folder': FolderPath, 'FileNames': FileNames,
+                   'Headers': [], 'Offsets': [], 'scan': [], 'run': [],
+                   'acq_frame_nb': [], 'time': [], 'Motors': []}
+    for Header, DataOffset in Results:
+        if Header == None:
+            Header = {}
+        HeaderIndex['Headers'].append(Header)
+        HeaderIndex['Offsets'].append(DataOffset)
+        HeaderIndex['scan'].append(Header.get('scan'))
+        for Key in ['run', 'acq_frame_nb']:
+            if Key in Header:
+                HeaderIndex[Key].append(int(Header[Key]))
+            else:
+                HeaderIndex[Key].append(None)
+        HeaderIndex['time'].append(Header.get('time', Header.get('date')))
+        Motors = {}
+        if 'motor_mne' in Header and 'motor_pos' in Header:
+            try:
+                Motors = dict(zip(Header['motor_mne'].split(),
+                                  map(float, Header['motor_pos'].split())))
+            except ValueError:
+                print('Bad motor_pos in header of %s, motors skipped' %
+                      FilePaths[len(HeaderIndex['Motors'])])
+        HeaderIndex['Motors'].append(Motors)
+    return HeaderIndex
 def testNbrScanInFoldersJune2018(Mute=False, DataType='edf'):
     """
     This function returns a string that tells if any of the folders returned by getAllFoldersJune2018() contains files with different values (within the same folder) for the 'scan' parameter in the file headers. This function is meant for files from Magnus ESRF ID06 beamtime June 2018, where each folder ideally contains only one scan, but in practice does not. The instances where it does not must be found in order to handle the fact that some functions used in data analysis might expect only one scan per folder.
@@ -543,20 +1538,18 @@ def testNbrScanInFoldersJune2018(Mute=False, DataType='edf'):
     for Directory in Directories:
         if not Mute:
             print('Searching in: %s\n' % Directory)
-        FileNames = namesFromFolder(Directory, DataType=DataType)
-        for FileIndex in range(len(FileNames)):
-            File, FileName = loadFile(Directory, Index=FileIndex,
-                                      DataType=DataType, Mute=True)
+        # Only headers are read.
+        Scans = indexFolder(Directory, DataType=DataType)['scan']
+        for FileIndex in range(len(Scans)):
             if FileIndex == 0:
-                PreviousScan = File.header['scan']
-            CurrentScan = File.header['scan']
+                PreviousScan = Scans[FileIndex]
+            CurrentScan = Scans[FileIndex]
             if PreviousScan != CurrentScan:
                 # Current scan is different from previous
                 Results += 'File nbr. %i has different scan from \
                             previous file in %s\n' % (FileIndex,
                                                       Directory)
             PreviousScan = CurrentScan
-            File.close()
     if len(Results) == 0:
         Results += 'No folders found with multiple scan inputs'
     if not Mute:
@@ -568,15 +1561,17 @@ def printAllFolderDates(DriveLetter='D'):
     DatedFolders = []
     for directory in directories:
         Folder = path.normpath(directory)
+        FileNames = namesFromFolder(Folder, DataType='edf')
         FileIndices = [0, -1]
         OrderedDate = []
         for FileIndex in FileIndices:
-            File, FileName = loadFile(Folder, DataType='edf',
-                                      Mute=True, Index=FileIndex)
-            if 'time' in File.header:
-                HeaderDate = File.header['time']
-            elif 'date' in File.header:
-                HeaderDate = File.header['date']
+            # Only the header is read.
+            Header, DataOffset = readEdfHeader(
+                path.join(Folder, FileNames[FileIndex]))
+            if 'time' in Header:
+                HeaderDate = Header['time']
+            elif 'date' in Header:
+                HeaderDate = Header['date']
             HeaderDate = HeaderDate.split()
             year = HeaderDate[4]
             month = str(list(calendar.month_abbr).index(HeaderDate[1]))
@@ -588,7 +1583,6 @@ def printAllFolderDates(DriveLetter='D'):
                 hour + '-' + minute + '-' + second)
         DatedFolders.append(OrderedDate[0] + ' ' + OrderedDate[1] +\
             '\t' + Folder[len(PathToRemove):])
-        File.close()
 
     DatedFolders = sorted(DatedFolders)
     for DatedFolder in DatedFolders:
@@ -612,10 +1606,63 @@ def convertDateEntry(date_entry):
                              second=second,
                              microsecond=centisecond*10**4)
     return this_datetime, this_time
+def readTemperatureFile(FilePath, Cache=True):
+    """
+    This function reads a file with temperatures as created by LabVIEW at ESRF June 2018 (tab-separated rows of 'DD.MM.YYYY HH:MM:SS.cc' and temperatures) in one go with numpy.loadtxt(), and returns the date and time of each row as numpy.datetime64 and the temperatures as a numpy.array. The dates are read as fixed-width bytes and converted with integer arithmetic on the digits (no datetime object per row). If <Cache> is True, the result is saved to a sidecar file '<FilePath>.npz', which is read instead of the text file as long as the modification time and size of the text file are unchanged.
+
+    FilePath:
+        String/path. File to read.
+    Cache:
+        bool. If true, the sidecar npz-file is used (and written if missing or outdated).
+    Datetimes:
+        numpy.array (datetime64[us]). Date and time of each row. None is returned if the file is not found.
+    Temperatures:
+        numpy.array (float64) where each row is (cold temp, temp1, temp2, temp3, temp4) of a row of the file.
+    """
+    FilePath = path.normpath(FilePath)
+    if not path.exists(FilePath):
+        print('No File found: %s' % FilePath)
+        return None, None
+    Key = np.array([path.getmtime(FilePath), path.getsize(FilePath)])
+    CachePath = FilePath + '.npz'
+    if Cache and path.isfile(CachePath):
+        with np.load(CachePath) as Cached:
+            if np.array_equal(Cached['Key'], Key):
+                return Cached['Datetimes'], Cached['Temperatures']
+
+    OpenFile = open(FilePath, 'r')
+    NColumns = len(OpenFile.readline().split('\t'))
+    OpenFile.close()
+    Columns = np.dtype([('Date', 'S22'), ('Temperatures', np.float64,
+                                          (NColumns-1,))])
+    Rows = np.loadtxt(FilePath, dtype=Columns, delimiter='\t', ndmin=1)
+    Temperatures = Rows['Temperatures'].reshape(len(Rows), NColumns-1)
+    # Digits of 'DD.MM.YYYY HH:MM:SS.cc', one row per date.
+    Digits = np.ascontiguousarray(Rows['Date']).view(np.uint8).reshape(
+        len(Rows), 22).astype(np.int64) - ord('0')
+    def getNumber(Start, Stop):
+        Number = np.zeros(len(Rows), dtype=np.int64)
+        for Column in range(Start, Stop):
+            Number = 10*Number + Digits[:, Column]
+        return Number
+    Months = (getNumber(6, 10) - 1970)*12 + getNumber(3, 5) - 1
+    Days = Months.astype('datetime64[M]').astype('datetime64[D]') +\
+        (getNumber(0, 2) - 1)
+    Microseconds = (((getNumber(11, 13)*60 + getNumber(14, 16))*60 +
+                     getNumber(17, 19))*100 + getNumber(20, 22))*10**4
+    Datetimes = Days.astype('datetime64[us]') + Microseconds
+    if Cache:
+        try:
+            with open(CachePath, 'wb') as OpenFile:
+                np.savez(OpenFile, Key=Key, Datetimes=Datetimes,
+                         Temperatures=Temperatures)
+        except OSError as e:
+            print('Temperatures not cached: %s' % e)
+    return Datetimes, Temperatures
 def getTemperaturesFromFile(file,
                             start_date=(2018, 6, 18),
                             start_time=(21, 45, 18, 78)):
-    """Reads a file with temperatures as created by LabVIEW at ESRF June 2018, and finds seconds elapsed from start_date, and returns that and read temperatures in a numpy.array.
+    """Reads a file with temperatures as created by LabVIEW at ESRF June 2018, and finds seconds elapsed from start_date, and returns that and read temperatures in a numpy.array. The file is read with readTemperatureFile() (vectorized, and cached).
 
     file:
         Strin/path to file to read.
@@ -628,55 +1675,255 @@ def getTemperaturesFromFile(file,
     time_stamps:
         List of datetime.datetime objects, containing date and time of the returned temperature entries.
     """
-    FilePath = path.normpath(file)
-    """ To be added below: each row is [date time, coldtemp, temp1, temp2, temp3, temp4]"""
-    temps_list = []
-    these_datetimes = []
-    these_times = []
-    if path.exists(FilePath):
-        File = open(FilePath, 'r')
-        reader = csv.reader(File, delimiter='\t')
-        start_datetime = datetime(start_date[0], start_date[1], start_date[2], hour=start_time[0], minute=start_time[1], second=start_time[2], microsecond=start_time[3]*10**4)
-        for row in reader:
-            this_datetime, this_time = convertDateEntry(row[0])
-            datetime_diff = this_datetime-start_datetime
-            # seconds passed this day
-            seconds_of_day = datetime_diff.days * 24 * 60**2
-            seconds_of_day += datetime_diff.seconds
-            seconds_of_day += datetime_diff.microseconds/10**6
-            new_row = np.zeros(np.shape(row))
-            new_row[0] = np.float64(seconds_of_day)
-            new_row[1:] = np.float64(row[1:])
-            temps_list.append(new_row)
-            these_datetimes.append(this_datetime)
-            these_times.append(this_time)
-        File.close()
-        temps_array = np.array(temps_list)
-        return temps_array, these_datetimes, these_times
-    else:
-        print('No File found: %s' % file)
+    Datetimes, Temperatures = readTemperatureFile(file)
+    if Datetimes is None:
+        return None, None
+    start_datetime = np.datetime64(datetime(
+        start_date[0], start_date[1], start_date[2], hour=start_time[0],
+        minute=start_time[1], second=start_time[2],
+        microsecond=start_time[3]*10**4), 'us')
+    temps_array = np.empty((len(Temperatures),
+                            np.shape(Temperatures)[1] + 1))
+    temps_array[:, 0] = (Datetimes - start_datetime)/np.timedelta64(1, 's')
+    temps_array[:, 1:] = Temperatures
+    these_datetimes = Datetimes.tolist()
+    these_times = getTimeOfDay(Datetimes).tolist()
+    return temps_array, these_datetimes, these_times
+def getTimeOfDay(Datetimes):
+    """
+    This function returns the time of day of each numpy.datetime64 in <Datetimes> as a datetime64 on 2000-01-01 (like the this_time of convertDateEntry()), so that temperatures from different days can be plotted on the same time axis.
+    """
+    Datetimes = np.asarray(Datetimes, dtype='datetime64[us]')
+    return np.datetime64('2000-01-01', 'us') + (
+        Datetimes - Datetimes.astype('datetime64[D]'))
+def getFrameDatetimes(Headers):
+    """
+    This function returns the time of acquisition of many edf-files at once as numpy.datetime64, from the 'time' (or 'date') header entries, as getHeaderDatetime() does for one file. Each distinct entry is parsed only once (files of a scan share most of them).
+
+    Headers:
+        List of dictionary (headers of edf-files from ESRF ID06), or a HeaderIndex as returned by indexFolder().
+    Datetimes:
+        numpy.array (datetime64[s]). NaT where no time is found.
+    """
+    if isinstance(Headers, dict):
+        Headers = Headers['Headers']
+    Parsed = {}  # Fill in below: header entry: datetime64
+    Datetimes = np.full(len(Headers), np.datetime64('NaT'),
+                        dtype='datetime64[s]')
+    for Index, Header in enumerate(Headers):
+        Entry = Header.get('time', Header.get('date'))
+        if Entry == None:
+            continue
+        if Entry not in Parsed:
+            Parsed[Entry] = np.datetime64(getHeaderDatetime(Header), 's')
+        Datetimes[Index] = Parsed[Entry]
+    return Datetimes
+def loadTemperatureLogs(Folder, Days=None):
+    """
+    This function reads the LabVIEW temperature logs of a folder (files named 'YYYY-MM-DD_Temperature_data.txt', read with readTemperatureFile()) and returns the sample temperature, (temp2 + temp3)/2 as in plotAllTemperatures(), as one series sorted by time.
+
+    Folder:
+        String/path. Folder with the temperature logs.
+    Days:
+        numpy.array (datetime64). If given, only the logs of these days (and the day before and after, to cover frames near midnight) are read. If None, all logs are read.
+    LogDatetimes:
+        numpy.array (datetime64[us]). Sorted times of the log entries. None is returned if no log is found.
+    SampleTemperatures:
+        numpy.array (float64). Sample temperature of each entry.
+    """
+    FileNames = namesFromFolder(Folder, DataType='_Temperature_data.txt')
+    if Days is not None:
+        Days = np.unique(np.asarray(Days, dtype='datetime64[D]'))
+        Days = Days[~np.isnat(Days)]
+        Wanted = set(str(Day) for Day in
+                     np.concatenate([Days - 1, Days, Days + 1]))
+        FileNames = [FileName for FileName in FileNames
+                     if FileName[0:10] in Wanted]
+    LogDatetimes = []  # Fill in below
+    SampleTemperatures = []  # Fill in below
+    for FileName in FileNames:
+        Datetimes, Temperatures = readTemperatureFile(path.join(Folder,
+                                                                FileName))
+        if Datetimes is None:
+            continue
+        LogDatetimes.append(Datetimes)
+        SampleTemperatures.append((Temperatures[:, 2] +
+                                   Temperatures[:, 3])/2)
+    if len(LogDatetimes) == 0:
+        print('No temperature logs found in %s' % Folder)
         return None, None
+    LogDatetimes = np.concatenate(LogDatetimes)
+    SampleTemperatures = np.concatenate(SampleTemperatures)
+    Order = np.argsort(LogDatetimes, kind='stable')
+    return LogDatetimes[Order], SampleTemperatures[Order]
+def getFrameTemperatures(FrameDatetimes, LogDatetimes, SampleTemperatures,
+                         MaxGap=60.0):
+    """
+    This function interpolates the sample temperature at the time of each frame. The two log entries around each frame time are found with a binary search in the sorted log times (numpy.searchsorted()), and the temperature is interpolated linearly between them.
+
+    FrameDatetimes:
+        numpy.array (datetime64). Times of the frames, for instance from getFrameDatetimes().
+    LogDatetimes, SampleTemperatures:
+        numpy.array. Sorted log times (datetime64) and temperatures, as from loadTemperatureLogs().
+    MaxGap:
+        Float. Largest time (s) between the two log entries around a frame for which a temperature is given. If None, there is no limit.
+    FrameTemperatures:
+        numpy.array (float64). NaN for frames without a time, outside the logs, or in a gap of the logs.
+    """
+    FrameTimes = np.asarray(FrameDatetimes, dtype='datetime64[us]')
+    LogTimes = np.asarray(LogDatetimes, dtype='datetime64[us]')
+    Valid = ~np.isnat(FrameTimes)
+    FrameTemperatures = np.full(len(FrameTimes), np.nan)
+    if len(LogTimes) == 0:
+        return FrameTemperatures
+    Seconds = (FrameTimes[Valid] - LogTimes[0])/np.timedelta64(1, 's')
+    LogSeconds = (LogTimes - LogTimes[0])/np.timedelta64(1, 's')
+    Inside = (Seconds >= 0) & (Seconds <= LogSeconds[-1])
+    # Index of the first log entry after each frame (at least 1).
+    Upper = np.clip(np.searchsorted(LogSeconds, Seconds, side='right'), 1,
+                    max(len(LogSeconds) - 1, 1))
+    Lower = np.minimum(Upper - 1, len(LogSeconds) - 1)
+    Upper = np.minimum(Upper, len(LogSeconds) - 1)
+    Gap = LogSeconds[Upper] - LogSeconds[Lower]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Fraction = np.where(Gap > 0, (Seconds - LogSeconds[Lower])/Gap, 0.0)
+    Temperatures = SampleTemperatures[Lower] + Fraction*(
+        SampleTemperatures[Upper] - SampleTemperatures[Lower])
+    if MaxGap != None:
+        Inside &= Gap <= MaxGap
+    FrameTemperatures[Valid] = np.where(Inside, Temperatures, np.nan)
+    return FrameTemperatures
+def alignTemperatures(Headers, TemperatureFolder, MaxGap=60.0):
+    """
+    This function returns the sample temperature at the time of each frame, from the headers of the frames and the LabVIEW logs of the days of the frames (see getFrameDatetimes(), loadTemperatureLogs() and getFrameTemperatures()).
+
+    Headers:
+        List of dictionary (headers of edf-files from ESRF ID06), or a HeaderIndex as returned by indexFolder().
+    TemperatureFolder:
+        String/path. Folder with the temperature logs.
+    MaxGap:
+        Float. As in getFrameTemperatures().
+    FrameTemperatures:
+        numpy.array (float64). NaN where no temperature is found.
+    """
+    FrameDatetimes = getFrameDatetimes(Headers)
+    LogDatetimes, SampleTemperatures = loadTemperatureLogs(
+        TemperatureFolder, Days=FrameDatetimes)
+    if LogDatetimes is None:
+        return np.full(len(FrameDatetimes), np.nan)
+    return getFrameTemperatures(FrameDatetimes, LogDatetimes,
+                                SampleTemperatures, MaxGap=MaxGap)
+""" Dictionary of (file path, modification time, size, number of bins): (times of day, sample temperatures) of decimated temperature logs, used by plotAllTemperatures()."""
+DecimationCache = {}
+def decimateMinMax(X, Y, NBins, Range=None):
+    """
+    This function reduces a series to at most two points per bin of <X>, the points with the lowest and highest Y in each bin (in their original order), which is the min/max decimation used for plotting: with one bin per pixel column, a line through the decimated points covers the same pixels as the full series. Where bins are empty, a NaN point is inserted so that lines are broken at gaps in the data. NaN values of <Y> are skipped.
+
+    X, Y:
+        numpy.array (float). The series, sorted by X.
+    NBins:
+        int. Number of bins, for instance the width of the plot in pixels.
+    Range:
+        Tuple (min, max) of X covered by the bins. If None, the range of X is used.
+    Xd, Yd:
+        numpy.array (float). The decimated series.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    Keep = ~np.isnan(Y)
+    X = X[Keep]
+    Y = Y[Keep]
+    if len(X) == 0:
+        return X, Y
+    if Range == None:
+        Range = (X[0], X[-1])
+    Width = max(Range[1] - Range[0], 1e-300)
+    Bins = np.clip(((X - Range[0])/Width*NBins).astype(np.int64), 0,
+                   NBins - 1)
+    # Sorted by bin and then by Y: the first and last point of each bin.
+    Order = np.lexsort((Y, Bins))
+    Starts = np.flatnonzero(np.r_[True, np.diff(Bins[Order]) != 0])
+    Stops = np.r_[Starts[1:], len(Order)] - 1
+    Selected = np.unique(np.r_[Order[Starts], Order[Stops]])
+    Xd = X[Selected]
+    Yd = Y[Selected]
+    # Break the line where bins are skipped.
+    Gaps = np.flatnonzero(np.diff(Bins[Selected]) > 1) + 1
+    return np.insert(Xd, Gaps, np.nan), np.insert(Yd, Gaps, np.nan)
+def getDecimatedTemperatures(FilePath, NBins):
+    """
+    This function returns the sample temperature ((temp2 + temp3)/2) of a LabVIEW temperature log (see readTemperatureFile()) against the time of day in seconds, decimated with decimateMinMax() into <NBins> bins over the whole day. The result is kept in DecimationCache until the file changes.
+
+    FilePath:
+        String/path. Temperature log.
+    NBins:
+        int. Number of bins over the day.
+    Seconds:
+        numpy.array (float). Seconds since midnight (NaN at breaks). None if the file is not found.
+    SampleTemperatures:
+        numpy.array (float).
+    """
+    Key = (path.normpath(FilePath), path.getmtime(FilePath),
+           path.getsize(FilePath), NBins)
+    if Key not in DecimationCache:
+        Datetimes, Temperatures = readTemperatureFile(FilePath)
+        if Datetimes is None:
+            return None, None
+        Seconds = (Datetimes - Datetimes.astype('datetime64[D]')
+                   )/np.timedelta64(1, 's')
+        Order = np.argsort(Seconds, kind='stable')
+        SampleTemperatures = (Temperatures[:, 2] + Temperatures[:, 3])/2
+        DecimationCache[Key] = decimateMinMax(
+            Seconds[Order], SampleTemperatures[Order], NBins,
+            Range=(0, 24*60**2))
+    return DecimationCache[Key]
 def plotAllTemperatures(
-        folder=path.normpath('\\\\home.ansatt.ntnu.no\\Magnussc\\Documents\\PhD\\Furnace\\LabView')):
-    temps = []  # Fill in later
-    file_names = namesFromFolder(folder,
-                                 DataType='_Temperature_data.txt')
-    for file_name in file_names:
-        file_path = path.join(folder, file_name)
-        temps.append(getTemperaturesFromFile(file_path))
+        folder=path.normpath('\\\\home.ansatt.ntnu.no\\Magnussc\\Documents\\PhD\\Furnace\\LabView'),
+        NPoints=None, Decimate=True):
+    """
+    Plots the sample temperature of all LabVIEW temperature logs in <folder> against the time of day, one series per day, and saves the figure as pdf and jpg.
+
+    folder:
+        String/path. Folder with the temperature logs.
+    NPoints:
+        int. Target number of points per day when <Decimate> is True (at most NPoints, two per bin, see decimateMinMax()). If None, two points per pixel column of the saved figure are used, which looks the same as the full plot.
+    Decimate:
+        bool. If true, each day is decimated (min/max per bin, cached with getDecimatedTemperatures()) and drawn as a line, which at one bin per pixel column covers the same pixels as the markers of the full series. If false, every sample is plotted as a marker.
+    """
     font = {'size'   : 22}
     rc('font', **font)
     fig = plt.figure(figsize=(25,8))
+    file_names = namesFromFolder(folder,
+                                 DataType='_Temperature_data.txt')
+    if Decimate:
+        if NPoints == None:
+            NPoints = 2*int(fig.get_figwidth()*plt.rcParams['savefig.dpi']
+                            if plt.rcParams['savefig.dpi'] != 'figure'
+                            else fig.get_figwidth()*fig.dpi)
+        for file_name in file_names:
+            Seconds, sample_temp = getDecimatedTemperatures(
+                path.join(folder, file_name), max(1, NPoints//2))
+            if Seconds is None:
+                continue
+            # NaN (breaks between bins) becomes NaT.
+            time = np.datetime64('2000-01-01', 'us') + (
+                Seconds*10**6).astype('timedelta64[us]')
+            plt.plot(time, sample_temp, '-', label=file_name[0:10],
+                     linewidth=1.5)
+    temps = []  # Fill in later
+    for file_name in file_names if not Decimate else []:
+        file_path = path.join(folder, file_name)
+        temps.append(readTemperatureFile(file_path))
     for day in range(len(temps)):
-        this_datetime = temps[day][1]  # datetime objects
-        time = temps[day][2]  # datetime objects
-        temp1 = temps[day][0][:,2]  # Temp. of elment nbr. 1
-        temp2 = temps[day][0][:,3]  # Temp. of elment nbr. 2
-        temp3 = temps[day][0][:,4]  # Temp. of elment nbr. 3
-        temp4 = temps[day][0][:,5]  # Temp. of elment nbr. 4
+        this_datetime = temps[day][0]  # numpy.datetime64
+        time = getTimeOfDay(this_datetime)  # numpy.datetime64
+        temp1 = temps[day][1][:,1]  # Temp. of elment nbr. 1
+        temp2 = temps[day][1][:,2]  # Temp. of elment nbr. 2
+        temp3 = temps[day][1][:,3]  # Temp. of elment nbr. 3
+        temp4 = temps[day][1][:,4]  # Temp. of elment nbr. 4
         sample_temp = (temp2 + temp3) / 2
         plt.plot(time, sample_temp, '.',
-                 label=this_datetime[0].date(),
+                 label=this_datetime[0].astype('datetime64[D]'),
                  markersize=3)
         # for index in range(len(time)):
         #     test = datetime.fromordinal(datetime.toordinal(this_datetime[index]))
@@ -686,9 +1933,13 @@ def plotAllTemperatures(
     plt.xlim(datetime(2000,1,1),datetime(2000,1,2))
     plt.grid(which='major', axis='both', linewidth=2)
     plt.grid(which='minor', axis='both', linewidth=0.5)
-    plt.legend(loc='upper right',
-               bbox_to_anchor=(0.3, 1),
-               markerscale=10)
+    if Decimate:
+        plt.legend(loc='upper right',
+                   bbox_to_anchor=(0.3, 1))
+    else:
+        plt.legend(loc='upper right',
+                   bbox_to_anchor=(0.3, 1),
+                   markerscale=10)
     plt.title('Furnace temperature ESRF June 2018')
     plt.xlabel('Time of day (HH:MM)')
     plt.ylabel('Temperature ($\degree$C)')
@@ -713,60 +1964,160 @@ def printFolderMotors(DataFolder):
     DataFolder:
         String/path. The folder in which to find the files whose header elements should be printed.
     """
-    FileNames = namesFromFolder(DataFolder)
-    for index in range(len(FileNames)):
-        File = fabio.open(DataFolder + '\\' + FileNames[index])
-        print(FileNames[index],
-              '\tchi:', getMotorValue(File.header, 'chi'),
-              '\t', 'diffry', getMotorValue(File.header, 'diffry'),
-              '\t', 'ffz', getMotorValue(File.header, 'ffz'),
-              '\t', 'obz', getMotorValue(File.header, 'obz'),
-              '\t', 'obpitch', getMotorValue(File.header, 'obpitch'),
-              '\t', 'run', File.header['run'])
-        File.close()
+    # Only headers (of edf-files) are read.
+    HeaderIndex = indexFolder(DataFolder, DataType='edf')
+    Table = MotorTable(HeaderIndex)
+    for index, FileName in enumerate(HeaderIndex['FileNames']):
+        if 'motor_mne' not in HeaderIndex['Headers'][index]:
+            print(FileName, '\tno motor positions in header')
+            continue
+        print(FileName,
+              '\tchi:', Table['chi'][index],
+              '\t', 'diffry', Table['diffry'][index],
+              '\t', 'ffz', Table['ffz'][index],
+              '\t', 'obz', Table['obz'][index],
+              '\t', 'obpitch', Table['obpitch'][index],
+              '\t', 'run', HeaderIndex['Headers'][index]['run'])
 def printHeaderChange(Headers):
     """
-    This function prints the motors that have moved, found with getMovedMotors(), between each of the files whose headers are in Headers. For the 'zapline-diffry' ScanType, as given by getScanType(), some other info is also printed for testing purposes.
+    This function prints the motors that have moved between each of the files whose headers are in Headers (in the same form as getMovedMotors()). The motor positions are put in a MotorTable, and the changes between all files are found with one numpy.diff(). For the 'zapline-diffry' ScanType, as given by getScanType(), some other info is also printed for testing purposes.
 
     Headers:
         List of dictionary. Contains the headers of edf-files from ESRF.
     """
+    Table = MotorTable(Headers)
+    # Change from each file to the previous one.
+    MotorPosDifference = -np.diff(Table.Positions, axis=0)
+    ScanTypes = {}  # Filled in below: scan: ScanType
     StringToPrint = ''  # Fill in later
     for index, header in enumerate(Headers):
-        if getScanType(header) == 'zapline-diffry':
+        if header['scan'] not in ScanTypes:
+            ScanTypes[header['scan']] = getScanType(header)
+        if ScanTypes[header['scan']] == 'zapline-diffry':
             StringToPrint += 'Image: ' + header['Image']
             StringToPrint += '; acq_frame_nb: ' +\
                 header['acq_frame_nb']
             StringToPrint += '; scan: ' + header['scan']
         if index > 0:
             StringToPrint += '; motor_pos change: '
-            MovedMotors = getMovedMotors(header, Headers[index-1])
-            for motor in MovedMotors:
-                StringToPrint += motor[0] + ' '
-                StringToPrint += motor[1] + '; '
+            Difference = MotorPosDifference[index-1]
+            for column in np.flatnonzero(Difference != 0).tolist():
+                if not np.isnan(Difference[column]):
+                    StringToPrint += Table.Names[column] + ' '
+                    StringToPrint += str(Difference[column]) + '; '
         StringToPrint += '\n'
     print(StringToPrint)
 
 """Save functions:"""
-def saveAs(File, DataType, SaveFolder, FileName, pngCpr=0,
-           BitDepth=16, Size=None):
+def getScaleTable(Scale, BitDepth=16):
     """
-    This function saves a fabio.image as a grayscale image file of the selcted format. It is intended for edf-files from ESRF ID06.
+    This function returns a lookup table which maps every 16-bit value x to round(x*<Scale>), limited to the largest value of <BitDepth> bits. Indexing the table with uint16 data (Table[Data]) scales the data without any float intermediate, since uint16 data can only have 65536 values.
 
-    File:
-        fabio.image. Image to save.
+    Scale:
+        Float. Scale factor.
+    BitDepth:
+        int. Bit depth of the scaled values (1 to 16).
+    Table:
+        numpy.array (uint8 for BitDepth up to 8, otherwise uint16) of length 65536.
+    """
+    if BitDepth <= 8:
+        TableType = np.uint8
+    else:
+        TableType = np.uint16
+    return np.minimum(np.rint(np.arange(2**16)*Scale),
+                      2**BitDepth-1).astype(TableType)
+def getClimTable(Clim, BitDepth=16):
+    """
+    This function returns a lookup table which maps every 16-bit value to <BitDepth> bits, with Clim[0] and below mapped to 0 and Clim[1] and above to the largest value of <BitDepth> bits (linear in between). Indexing the table with uint8/uint16 data applies fixed (for instance per-scan, see getScanClim()) grayscale limits without any per-frame min/max or float pass.
+
+    Clim:
+        Tuple (min, max) of data values.
+    BitDepth:
+        int. Bit depth of the scaled values (1 to 16).
+    Table:
+        numpy.array (uint8 for BitDepth up to 8, otherwise uint16) of length 65536.
+    """
+    Scale = (2**BitDepth-1)/max(float(Clim[1]) - float(Clim[0]), 1e-12)
+    return getScaleTable(Scale, BitDepth=BitDepth)[np.clip(
+        np.arange(2**16) - int(Clim[0]), 0, 2**16-1)]
+def saveRaw(DataArray, DataType, FilePath, pngCpr=0, BitDepth=16,
+            Scale=None):
+    """
+    This function saves unsigned 8 or 16-bit image data as a grayscale png or tiff file without normalization, so that absolute intensities are kept and can be compared across frames. 16-bit data is passed directly to PIL.Image (no float intermediate). If <Scale> is given, or <BitDepth> is less than 16, the data is scaled (and limited to <BitDepth> bits) with a lookup table from getScaleTable(). The scale is stored in the file ('scale' text chunk in png, ImageDescription in tiff), so that original value = saved value / scale. Used by saveAs() with Normalize=False.
+
+    DataArray:
+        numpy.array (uint8 or uint16). Image to save.
     DataType:
-         String. Data type to store image as. Allowed formats are 'tiff' and 'png', which are saved with the PIL.image and png modules, respectively. To allow other data types to be saved, modify the DataType comparisons and check that PIL or png supports the format, or add another module that does (remember possibly different scaling of the raw data). '.<DataType>' is appended to the filename of the saved file.
-    SaveFolder:
-        String/path. Folder/directory in which to save the file.
-    FileName:
-        String. Contains the filename(without directory) of the file to open. Based on this, a new filename is made with getNewFileName(), which is used for the saved file.
+        String. 'png' or 'tiff'.
+    FilePath:
+        String/path. File to save.
     pngCpr:
-        int. Compression level used when saving as png. Allowed values from 0 to 9. 0 means no compression and 9 means the most compression (more time consuming).
+        int. Compression level used when saving as png (0 to 9).
     BitDepth:
-        int. Bith depth used when saving png. 16 matches raw data edf-files from ESRF ID06. Allowed values are 1, 2, 4, 8 and 16.
+        int. Bit depth of the saved png (1, 2, 4, 8 or 16). tiff files are saved with 8 bits if BitDepth is 8 or less, otherwise 16.
+    Scale:
+        Float. Scale applied to the data, for instance the same for all frames of a scan. If None, 1 is used (data unchanged).
+    """
+    try:
+        if DataArray.dtype not in [np.uint8, np.uint16]:
+            raise MyException('Data type %s can not be saved raw' %
+                              DataArray.dtype)
+    except MyException as e:
+        print(e)
+        print('No file saved')
+        return None
+    if Scale == None:
+        Scale = 1.0
+    if Scale != 1.0 or BitDepth < 8*DataArray.dtype.itemsize:
+        DataArray = getScaleTable(Scale, BitDepth=BitDepth)[DataArray]
+    Description = json.dumps({'scale': Scale, 'bitdepth': BitDepth})
+    if DataType == 'tiff':
+        ImageObject = Image.fromarray(DataArray)
+        ImageObject.save(FilePath, description=Description)
+    elif BitDepth in [8, 16]:
+        DataArray = DataArray.astype('uint%i' % BitDepth, copy=False)
+        ImageObject = Image.fromarray(DataArray)
+        Info = PngImagePlugin.PngInfo()
+        Info.add_text('scale', repr(Scale))
+        ImageObject.save(FilePath, compress_level=pngCpr, pnginfo=Info)
+    else:
+        # Bit depths below 8 are packed by the png module.
+        pngWriter = png.Writer(width=np.shape(DataArray)[1],
+                               height=np.shape(DataArray)[0],
+                               greyscale=True, bitdepth=BitDepth,
+                               compression=pngCpr)
+        OpenFile = open(FilePath, mode='wb')
+        pngWriter.write(OpenFile, DataArray)
+        OpenFile.close()
+    return FilePath
+def saveAs(File, DataType, SaveFolder, FileName, pngCpr=0,
+           BitDepth=16, Size=None, Mute=False, Normalize=True, Scale=None,
+           Clim=None):
+    """
+    This function saves a fabio.image as a grayscale image file of the selcted format. It is intended for edf-files from ESRF ID06.
+
+    File:
+        fabio.image. Image to save.
+    DataType:
+         String. Data type to store image as. Allowed formats are 'tiff' and 'png', which are saved with the PIL.image and png modules, respectively. To allow other data types to be saved, modify the DataType comparisons and check that PIL or png supports the format, or add another module that does (remember possibly different scaling of the raw data). '.<DataType>' is appended to the filename of the saved file.
+    SaveFolder:
+        String/path. Folder/directory in which to save the file.
+    FileName:
+        String. Contains the filename(without directory) of the file to open. Based on this, a new filename is made with getNewFileName(), which is used for the saved file.
+    pngCpr:
+        int. Compression level used when saving as png. Allowed values from 0 to 9. 0 means no compression and 9 means the most compression (more time consuming).
+    BitDepth:
+        int. Bith depth used when saving png. 16 matches raw data edf-files from ESRF ID06. Allowed values are 1, 2, 4, 8 and 16.
     Size:
         tuple: (width, height). Only for saving png-images. If given (not None), image width and height will be reduced to these values (if larger originally) in the saved image.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Normalize:
+        bool. If true, each image is normalized to its own maximum (the full range of <BitDepth> bits). If false, the data is saved unchanged with saveRaw() (or scaled by <Scale>), which is lossless for 16-bit data and much faster.
+    Scale:
+        Float. Only if Normalize is False. Scale applied to the data (for instance the same for all frames of a scan, see getScanScale()), recorded in the saved file. If None, the data is not scaled.
+    Clim:
+        Tuple (min, max) of data values mapped to black and the largest value of <BitDepth> bits, for instance the scan percentiles from getScanClim(). Applied with a lookup table (getClimTable()), and used instead of <Normalize> and <Scale> if given (not None).
     newFileName:
         String. Name of the saved file (without folders). Found with getNewFileName(), and then has '.<DataType>' as a suffix.
     """
@@ -782,9 +2133,38 @@ def saveAs(File, DataType, SaveFolder, FileName, pngCpr=0,
             '.'+DataType
         if newFileName == None:
             return None
+        if Clim != None:
+            DataArray = getClimTable(Clim, BitDepth=BitDepth)[File.data]
+            if DataType == 'png' and Size != None and\
+                    (Size[0] < np.shape(DataArray)[1] or
+                     Size[1] < np.shape(DataArray)[0]):
+                DataArray = np.array(Image.fromarray(DataArray).resize(Size))
+            if saveRaw(DataArray, DataType,
+                       path.join(SaveFolder, newFileName), pngCpr=pngCpr,
+                       BitDepth=BitDepth) == None:
+                return None
+            if not Mute:
+                print('File saved (clim %i to %i): ' % (Clim[0], Clim[1]) +
+                      path.join(SaveFolder, newFileName))
+            return newFileName
+        if not Normalize:
+            DataArray = File.data
+            if DataType == 'png' and Size != None and\
+                    (Size[0] < np.shape(DataArray)[1] or
+                     Size[1] < np.shape(DataArray)[0]):
+                DataArray = np.array(Image.fromarray(DataArray).resize(Size))
+            if saveRaw(DataArray, DataType,
+                       path.join(SaveFolder, newFileName), pngCpr=pngCpr,
+                       BitDepth=BitDepth, Scale=Scale) == None:
+                return None
+            if not Mute:
+                print('File saved raw (scale %s): ' % Scale +
+                      path.join(SaveFolder, newFileName))
+            return newFileName
         if DataType == 'tiff':
-            im = Image.fromarray(File.data/File.getmax())
-            im.save(SaveFolder + '\\' + newFileName)
+            Normalization = File.getmax()
+            im = Image.fromarray(File.data/Normalization)
+            im.save(path.join(SaveFolder, newFileName))
             im.close()
         elif DataType == 'png':
             CurrentWidth = int(File.header['Dim_1'])
@@ -812,20 +2192,178 @@ def saveAs(File, DataType, SaveFolder, FileName, pngCpr=0,
                     DataArray = File.data
             else:
                 DataArray = File.data
-            pngArray = ((DataArray/np.amax(DataArray)) *
+            Normalization = np.amax(DataArray)
+            pngArray = ((DataArray/Normalization) *
                         (2**pngWriter.bitdepth-1)).astype(int)
-            OpenFile = open((SaveFolder + '\\' + newFileName),
+            OpenFile = open(path.join(SaveFolder, newFileName),
                             mode='wb')
             pngWriter.write(OpenFile, pngArray)
             OpenFile.close()
-        print('File saved with PIL.Image (Normalized to %.0f): ' %
-              np.amax(pngArray) + SaveFolder + '\\' + newFileName)
+        if not Mute:
+            print('File saved with PIL.Image (Normalized to %.0f): ' %
+                  Normalization + path.join(SaveFolder, newFileName))
         return newFileName
+def getScanScale(FolderPath, BitDepth=16, DataType='edf'):
+    """
+    This function returns the scale that maps the largest value of all (edf) images in a folder to the largest value of <BitDepth> bits, to be used as a global (per-scan) Scale in saveAs() with Normalize=False. The images are read one at a time (memory-mapped, see FrameStack).
+
+    FolderPath:
+        String/path. Folder of the scan.
+    BitDepth:
+        int. Bit depth of the saved images.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included.
+    Scale:
+        Float. None if no files are found.
+    """
+    Frames, FileNames = loadFolder(FolderPath, DataType=DataType, Mute=True,
+                                   Lazy=True)
+    if Frames == None:
+        return None
+    Maximum = max(int(np.amax(Frame)) for Frame in Frames)
+    return (2**BitDepth-1)/max(Maximum, 1)
+def benchmarkSaveAs(File, FileName, SaveFolder, DataType='png', pngCpr=0,
+                    BitDepth=16, Size=None, Repeats=5, Mute=False):
+    """
+    This function times saveAs() on one file with the normalized path (Normalize=True) and the raw path (Normalize=False), and prints and returns the mean time per frame.
+
+    File:
+        fabio.image. Image to save.
+    FileName:
+        String. Filename of the file (used by getNewFileName()).
+    SaveFolder:
+        String/path. Folder to save the test files in.
+    DataType, pngCpr, BitDepth, Size:
+        As in saveAs().
+    Repeats:
+        int. Number of times each path is timed.
+    Mute:
+        bool. If true, skip print operations.
+    Times:
+        Dictionary of 'normalized' and 'raw': mean time (s) per frame.
+    """
+    Times = {}  # Fill in below
+    for Name, Normalize in [('normalized', True), ('raw', False)]:
+        StartTime = time.perf_counter()
+        for Repeat in range(Repeats):
+            saveAs(File, DataType, SaveFolder, FileName, pngCpr=pngCpr,
+                   BitDepth=BitDepth, Size=Size, Mute=True,
+                   Normalize=Normalize)
+        Times[Name] = (time.perf_counter() - StartTime)/Repeats
+    if not Mute:
+        print('saveAs() %s, Cmpr%i, %i bit: normalized %.1f ms/frame, raw %.1f ms/frame (%.1fx)' %
+              (DataType, pngCpr, BitDepth, Times['normalized']*1000,
+               Times['raw']*1000, Times['normalized']/Times['raw']))
+    return Times
+def convertFile(FilePath, DataType, SaveFolder, pngCpr=0, BitDepth=16,
+                Size=None, Normalize=True, Scale=None, Clim=None):
+    """
+    This function opens an edf-file with fabio, saves it with saveAs() (muted) and closes it. It is the task run by each worker process of convertFolder(), and must therefore be reached through an imported module (import Functions), not through exec(). A file which can not be converted is reported and None returned, so the rest of the folder is still converted.
+
+    FilePath:
+        String/path. edf-file to convert.
+    DataType, SaveFolder, pngCpr, BitDepth, Size, Normalize, Scale, Clim:
+        As in saveAs().
+    newFileName:
+        String. Name of the saved file (without folders), or None if not saved.
+    """
+    try:
+        File = fabio.open(FilePath)
+        newFileName = saveAs(File, DataType, SaveFolder,
+                             path.basename(FilePath), pngCpr=pngCpr,
+                             BitDepth=BitDepth, Size=Size, Mute=True,
+                             Normalize=Normalize, Scale=Scale, Clim=Clim)
+        File.close()
+    except Exception as e:
+        print('%s not converted: %s' % (FilePath, e))
+        return None
+    return newFileName
+def convertFolder(OriginalFolder, SaveFolder, DataType, BitDepth=16,
+                  pngCpr=0, DataTypeToRead='edf', Size=None, Workers=1,
+                  Overwrite=False, Mute=False, Normalize=True, Scale=None,
+                  Clim=None):
+    """
+    This function converts all edf-files in a folder to grayscale image files with saveAs(), using a pool of worker processes so that reading, normalization and compression of different files run at the same time on all cores. The new filenames are found with getNewFileNames() from the headers (read with readEdfHeader(), without image data), and files whose converted file already exists and is newer than the original are skipped. The throughput is printed at the end.
+
+    OriginalFolder:
+        String/path. Folder in which to read files from.
+    SaveFolder:
+        String/path. Folder in which to save files. Must exist.
+    DataType, BitDepth, pngCpr, Size:
+        As in saveAs().
+    DataTypeToRead:
+        String. Data type to open in OriginalFolder. Files with names not ending with <DataTypeToRead> are not opened or saved.
+    Workers:
+        int. Number of worker processes. If 1, files are converted in this process (needed if this script is run with exec()). If None, the number of CPU cores is used; the worker processes import Functions (so run from a script that imports it, with its own code under if __name__ == '__main__': on Windows).
+    Overwrite:
+        bool. If true, files are converted even if the converted file exists and is newer than the original.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Normalize:
+        bool. As in saveAs().
+    Scale:
+        Float or 'scan'. As in saveAs(). If 'scan', the scale is found with getScanScale() (the same for all files of the folder).
+    Clim:
+        Tuple or 'scan'. As in saveAs(). If 'scan', the 0.5 and 99.5 percentiles of all pixels of the folder are used (getScanClim()).
+    NewFileNames:
+        List of strings. Names of the converted files (including skipped ones), in the order of the original files.
+    """
+    HeaderIndex = indexFolder(OriginalFolder, DataType=DataTypeToRead)
+    FilePaths = []  # Fill in later: files to convert
+    NewFileNames = []  # Fill in later
+    NSkipped = 0
+    for FileName, newFileName in zip(
+            HeaderIndex['FileNames'],
+            getNewFileNames(HeaderIndex['FileNames'],
+                            HeaderIndex['Headers'])):
+        FilePath = path.join(OriginalFolder, FileName)
+        if newFileName == None:
+            print('No new filename found for %s, not converted' % FilePath)
+            continue
+        newFileName += '.' + DataType
+        NewFileNames.append(newFileName)
+        NewFilePath = path.join(SaveFolder, newFileName)
+        if not Overwrite and path.exists(NewFilePath) and\
+                path.getmtime(NewFilePath) >= path.getmtime(FilePath):
+            NSkipped += 1
+        else:
+            FilePaths.append(FilePath)
+    NBytes = sum(path.getsize(FilePath) for FilePath in FilePaths)
+
+    if Workers == None:
+        Workers = cpu_count() or 1
+    StartTime = time.perf_counter()
+    if Scale == 'scan' and not Normalize:
+        Scale = getScanScale(OriginalFolder, BitDepth=BitDepth,
+                             DataType=DataTypeToRead)
+    if Clim == 'scan':
+        Clim = getScanClim(OriginalFolder, DataType=DataTypeToRead,
+                           Mute=Mute)
+    Arguments = ([DataType]*len(FilePaths), [SaveFolder]*len(FilePaths),
+                 [pngCpr]*len(FilePaths), [BitDepth]*len(FilePaths),
+                 [Size]*len(FilePaths), [Normalize]*len(FilePaths),
+                 [Scale]*len(FilePaths), [Clim]*len(FilePaths))
+    if Workers == 1 or len(FilePaths) <= 1:
+        Results = list(map(convertFile, FilePaths, *Arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=Workers) as Pool:
+            ChunkSize = max(1, len(FilePaths)//(4*Workers))
+            Results = list(Pool.map(convertFile, FilePaths, *Arguments,
+                                    chunksize=ChunkSize))
+    Duration = max(time.perf_counter() - StartTime, 1e-9)
+    NFailed = sum(Result == None for Result in Results)
+
+    if not Mute:
+        print('%s: %i files converted, %i failed, %i skipped (up to date), %.1f frames/s, %.1f MB/s (read)' %
+              (OriginalFolder, len(FilePaths) - NFailed, NFailed, NSkipped,
+               len(FilePaths)/Duration, NBytes/Duration/10**6))
+    return NewFileNames
 def saveFolder(OriginalFolder, DataType, BitDepth=16, pngCpr=0,
                DataTypeToRead='edf', TargetFolder=None,
-               PathToRemove='', Size=None):
+               PathToRemove='', Size=None, Workers=1, Overwrite=False,
+               Normalize=True, Scale=None, Clim=None):
     """
-    This function opens files from a whole folder as fabio.image objects and saves them as grayscale image files of the selcted format, using saveAs(). It is intended for edf-files from ESRF ID06. Files will be saved in the same folder branch as the original data, except the tailmost folder will be a separate one, given the name of the original folder with a suffix indicating the file type and compression level (if any) (for instance 'myFolder/data/OldFileName.edf' -> 'myFolder/data_png_Cmpr2/NewFileName.png').
+    This function opens files from a whole folder as fabio.image objects and saves them as grayscale image files of the selcted format, using saveAs() in parallel through convertFolder(). It is intended for edf-files from ESRF ID06. Files will be saved in the same folder branch as the original data, except the tailmost folder will be a separate one, given the name of the original folder with a suffix indicating the file type and compression level (if any) (for instance 'myFolder/data/OldFileName.edf' -> 'myFolder/data_png_Cmpr2/NewFileName.png').
 
     OriginalFolder:
         String/path. Folder in which to read files from.
@@ -843,6 +2381,12 @@ def saveFolder(OriginalFolder, DataType, BitDepth=16, pngCpr=0,
         String/path. If TargetFolder is given (not None), PathToRemove is removed from the root end of the original data's folder branch before this truncated path is appended to TargetFolder to give the new total path in which to save the new file. In other words, PathToRemove denotes the part of the original data's folder branch not to be considered as the branch structure to preserve.
     Size:
         tuple: (width, height). Only for saving png-images. If given (not None), image width and height will be reduced to these values (if larger originally) in the saved image, and target entered <Width>x<Height> is given in the new leaf-level folder and in within TargetFolder (if given).
+    Workers:
+        int. Number of worker processes, see convertFolder().
+    Overwrite:
+        bool. If true, files are converted even if already converted (and newer than the original).
+    Normalize, Scale, Clim:
+        As in convertFolder(). If Clim is given, '_clim' is added to the new leaf-level folder, otherwise '_raw' if Normalize is False.
     """
     try:
         if DataType not in ['tiff', 'png']:
@@ -857,6 +2401,10 @@ def saveFolder(OriginalFolder, DataType, BitDepth=16, pngCpr=0,
             ModString += '_Cmpr%i' % pngCpr
         if Size != None:
             ModString += '_%ix%i' % (Size[0], Size[1])
+        if Clim != None:
+            ModString += '_clim'
+        elif not Normalize:
+            ModString += '_raw'
         DataFolderConvert += ModString
         if TargetFolder != None:
             NewPathRoot = path.join(path.normpath(TargetFolder),
@@ -866,16 +2414,11 @@ def saveFolder(OriginalFolder, DataType, BitDepth=16, pngCpr=0,
             DataFolderConvert = path.join(NewPathRoot, NewPathTail)
         if not path.exists(DataFolderConvert):
             makedirs(DataFolderConvert)
-        FileNames = namesFromFolder(OriginalFolder,
-                                    DataType=DataTypeToRead)
-        for index in range(len(FileNames)):
-            File = fabio.open(OriginalFolder + '\\' + FileNames[index])
-            print('File loaded with fabio: ' + OriginalFolder + '\\' +
-                  FileNames[index])
-            newFileName = saveAs(File, DataType, DataFolderConvert,
-                                 FileNames[index], pngCpr=pngCpr,
-                                 BitDepth=BitDepth, Size=Size)
-            File.close()
+        convertFolder(OriginalFolder, DataFolderConvert, DataType,
+                      BitDepth=BitDepth, pngCpr=pngCpr,
+                      DataTypeToRead=DataTypeToRead, Size=Size,
+                      Workers=Workers, Overwrite=Overwrite,
+                      Normalize=Normalize, Scale=Scale, Clim=Clim)
 def getAllFoldersJune2018(DriveLetter='D'):
     """
     This function returns a list of all folders/paths with data from Magnus Christensen's ESRF ID06 beamtime June 2018, as put on a harddrive on port D. Change D as appropriate if the harddrive is changed.
@@ -1008,7 +2551,7 @@ def getAllFoldersJune2018(DriveLetter='D'):
     return Directories
 def convertAllJune2018(DataType='png', pngCpr=1, BitDepth=16,
                        TargetFolder='F:\\ESRF June 2018',
-                       DriveLetter='F', Size=None):
+                       DriveLetter='F', Size=None, Workers=1):
     """
     This function converts all of Magnus Christensen's ESRF ID06 June 2018 beamtime edf data files by performs saveFolder() on all folders returned by getAllFoldersJune2018(). It is intended for edf-files from ESRF ID06. Files will be saved in the same folder branch as the original data, except the tailmost folder will be a separate one, given the name of the original folder with a suffix indicating the file type and compression level (if any) (for instance 'myFolder/data/OldFileName.edf' -> 'myFolder/data_png_Cmpr2/NewFileName.png').
 
@@ -1024,6 +2567,8 @@ def convertAllJune2018(DataType='png', pngCpr=1, BitDepth=16,
         String. Drive letter of current harddrive, passed to getAllFoldersJune2018() to get the folders of the original data.
     Size:
         tuple: (width, height). Only for saving png-images. If given (not None), image width and height will be reduced to these values (if larger originally) in the saved image.
+    Workers:
+        int. Number of worker processes used by saveFolder() (see convertFolder()). 1 converts in this process; if None, the number of CPU cores is used.
     """
 
     """ Not used if TargetFolder is None. Only its length is used when removing it, so the drive letter used is unimportant."""
@@ -1035,9 +2580,460 @@ def convertAllJune2018(DataType='png', pngCpr=1, BitDepth=16,
         saveFolder(Folder, DataType, pngCpr=pngCpr,
                    TargetFolder=TargetFolder,
                    PathToRemove=PathToRemove, BitDepth=BitDepth,
-                   Size=Size)
+                   Size=Size, Workers=Workers)
+
+def downscaleFrame(Frame, Factor):
+    """
+    This function returns <Frame> reduced in size by an integer <Factor> along both axes, each pixel being the mean of a <Factor> x <Factor> block (rounded, in the data type of <Frame>). Rows and columns not filling a whole block are cut off.
+
+    Frame:
+        2D numpy.array.
+    Factor:
+        int. Downscaling factor.
+    """
+    if Factor == 1:
+        return np.asarray(Frame)
+    NRows = (np.shape(Frame)[0]//Factor)*Factor
+    NCols = (np.shape(Frame)[1]//Factor)*Factor
+    Blocks = np.asarray(Frame)[0:NRows, 0:NCols].reshape(
+        NRows//Factor, Factor, NCols//Factor, Factor)
+    Mean = Blocks.mean(axis=(1, 3))
+    if np.issubdtype(Frame.dtype, np.integer):
+        Mean = np.rint(Mean)
+    return Mean.astype(Frame.dtype)
+def savePyramid(OriginalFolder, PyramidPath=None, Levels=(2048, 1024, 512,
+                                                          256),
+                DataTypeToRead='edf', ChunkSize=256, Compression='gzip',
+                CompressionLevel=1, Mute=False):
+    """
+    This function saves all edf-files of a folder as a multi-resolution image pyramid in one HDF5 file (needs the h5py module): one chunked, compressed dataset of shape (files, size, size) per level, in the data type of the files. Each file is read once (memory-mapped, see FrameStack) and every level is made with downscaleFrame() (in float64, rounded only when saved) from the smallest larger level whose downscaling factor divides its own, or from the full frame if there is none (for instance levels 20 and 12 of 60 rows are both made from the full frame). The new filenames from getNewFileNames() (with '.<DataTypeToRead>' appended, so that they can be parsed by getScanTypeFromName()) are stored in the dataset 'names', and the original filenames in 'original_names'. The pyramid is browsed with imageBrowser(PyramidPath=...). This replaces running saveFolder() once for every Size.
+
+    OriginalFolder:
+        String/path. Folder in which to read files from.
+    PyramidPath:
+        String/path. HDF5 file to save. If None, '<OriginalFolder>_pyramid.h5' is used.
+    Levels:
+        Tuple of int. Sizes (number of rows) of the levels. The frame size divided by each size must be an integer, for instance (2048, 1024, 512, 256) for 2048x2048 frames.
+    DataTypeToRead:
+        String. Data type to open in OriginalFolder.
+    ChunkSize:
+        int. Chunks are (1, ChunkSize, ChunkSize) (or the whole image of smaller levels).
+    Compression, CompressionLevel:
+        HDF5 compression filter and its option, as used by h5py (for instance 'gzip' and 1, or 'lzf' and None).
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    PyramidPath:
+        String/path of the saved file. None is returned if not saved.
+    """
+    try:
+        import h5py
+    except ImportError:
+        print('h5py is needed to save image pyramids, no file saved')
+        return None
+    Frames, FileNames = loadFolder(OriginalFolder, DataType=DataTypeToRead,
+                                   Mute=True, Lazy=True)
+    try:
+        if Frames == None:
+            raise MyException('No files found in %s' % OriginalFolder)
+        NRows, NCols = Frames.shape[1:]
+        Levels = sorted(Levels, reverse=True)
+        Factors = [NRows//Level for Level in Levels]
+        for Level, Factor in zip(Levels, Factors):
+            if Factor < 1 or Level*Factor != NRows:
+                raise MyException('Level %i does not divide the %i rows' %
+                                  (Level, NRows))
+    except MyException as e:
+        print(e)
+        print('No file saved')
+        return None
+
+    if PyramidPath == None:
+        PyramidPath = path.normpath(OriginalFolder) + '_pyramid.h5'
+    newFileNames = getNewFileNames(FileNames, Frames.Headers)
+    newFileNames = [(newFileName or FileName[0:-len(DataTypeToRead)-1]) +
+                    '.' + DataTypeToRead
+                    for newFileName, FileName in zip(newFileNames,
+                                                     FileNames)]
+    StartTime = time.perf_counter()
+    PyramidFile = h5py.File(PyramidPath, 'w')
+    PyramidFile.create_dataset('names', data=np.array(newFileNames,
+                                                      dtype=object),
+                               dtype=h5py.string_dtype())
+    PyramidFile.create_dataset('original_names',
+                               data=np.array(FileNames, dtype=object),
+                               dtype=h5py.string_dtype())
+    PyramidFile.attrs['levels'] = Levels
+    Datasets = []  # Fill in below
+    for Level, Factor in zip(Levels, Factors):
+        Shape = (len(Frames), NRows//Factor, NCols//Factor)
+        Datasets.append(PyramidFile.create_dataset(
+            'level_%i' % Level, shape=Shape, dtype=Frames.dtype,
+            chunks=(1, min(ChunkSize, Shape[1]), min(ChunkSize, Shape[2])),
+            compression=Compression, compression_opts=CompressionLevel))
+    IsInteger = np.issubdtype(Frames.dtype, np.integer)
+    for Index in range(len(Frames)):
+        # Kept as float between levels to avoid repeated rounding.
+        Made = {1: np.asarray(Frames[Index], dtype=np.float64)}
+        for Factor, Dataset in zip(Factors, Datasets):
+            SourceFactor = max(Known for Known in Made
+                               if Factor % Known == 0)
+            Frame = downscaleFrame(Made[SourceFactor], Factor//SourceFactor)
+            Made[Factor] = Frame
+            if IsInteger:
+                Dataset[Index] = np.rint(Frame).astype(Frames.dtype)
+            else:
+                Dataset[Index] = Frame.astype(Frames.dtype)
+    PyramidFile.close()
+    if not Mute:
+        print('Pyramid of %i files with levels %s saved in %.1f s: %s' %
+              (len(Frames), Levels, time.perf_counter()-StartTime,
+               PyramidPath))
+    return PyramidPath
+
+def saveScanContainer(OriginalFolder, ContainerPath=None, Format='hdf5',
+                      Chunks='frame', Compression='lz4', CompressionLevel=5,
+                      DataTypeToRead='edf', Mute=False):
+    """
+    This function saves all edf-files of a folder (one scan) in a single chunked and compressed container file, instead of one image file per frame as saveFolder(). The container holds:
+        'data':             (files, rows, columns) array in the data type of the files.
+        'steps/<name>':     Scan steps of each file from decodeScanSteps() (-1 where not part of the scan), and 'scan_types'.
+        'motors':           (files, motors) array of motor positions from MotorTable, with the motor names in its attribute 'names'.
+        'file_names', 'new_file_names': Original filenames and names from getNewFileNames().
+        'headers':          The complete headers (JSON), as a dataset of strings (hdf5) or an attribute (zarr).
+    The first header is also stored as attributes of the container. The frames are read (memory-mapped, see FrameStack) and written one block of chunks at a time, so the scan is never held in memory.
+
+    OriginalFolder:
+        String/path. Folder in which to read files from.
+    ContainerPath:
+        String/path. File (hdf5) or directory (zarr) to save. If None, '<OriginalFolder>.h5' or '<OriginalFolder>.zarr' is used.
+    Format:
+        String. 'hdf5' (needs h5py, and hdf5plugin for the 'lz4' and 'blosc' compressions) or 'zarr' (needs zarr).
+    Chunks:
+        'frame' for chunks of one whole frame (fast reading of single frames), 'column' for chunks of (files, 32, 32) (fast reading of the rocking curve of each pixel), or a tuple (frames, rows, columns).
+    Compression:
+        String. 'lz4', 'blosc' (Blosc with LZ4 and bit-shuffle), 'gzip' (hdf5 only), 'lzf' (hdf5 only) or None. If hdf5plugin is missing, 'gzip' is used instead of 'lz4' and 'blosc'.
+    CompressionLevel:
+        int. Compression level for 'blosc' and 'gzip'.
+    DataTypeToRead:
+        String. Data type to open in OriginalFolder.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    ContainerPath:
+        String/path of the saved container. None is returned if not saved.
+    """
+    Frames, FileNames = loadFolder(OriginalFolder, DataType=DataTypeToRead,
+                                   Mute=True, Lazy=True)
+    try:
+        if Frames == None:
+            raise MyException('No files found in %s' % OriginalFolder)
+        if Format not in ['hdf5', 'zarr']:
+            raise MyException('Invalid Format')
+        if Compression not in ['lz4', 'blosc', 'gzip', 'lzf', None]:
+            raise MyException('Invalid Compression')
+        if Format == 'zarr' and Compression in ['gzip', 'lzf']:
+            raise MyException('Compression %s not available for zarr' %
+                              Compression)
+        if Format == 'hdf5':
+            import h5py
+        else:
+            import zarr
+    except MyException as e:
+        print(e)
+        print('No file saved')
+        return None
+    except ImportError as e:
+        print(e)
+        print('No file saved')
+        return None
+
+    Shape = Frames.shape
+    if Chunks == 'frame':
+        Chunks = (1,) + Shape[1:]
+    elif Chunks == 'column':
+        Chunks = (Shape[0], min(32, Shape[1]), min(32, Shape[2]))
+    Chunks = tuple(min(Chunk, Size) for Chunk, Size in zip(Chunks, Shape))
+    Decoded = decodeScanSteps(Frames.Headers, FileNames=FileNames)
+    Table = MotorTable(Frames.Headers)
+    newFileNames = [newFileName or '' for newFileName in
+                    getNewFileNames(FileNames, Frames.Headers,
+                                    Decoded=Decoded)]
+    Headers = [json.dumps(Header) for Header in Frames.Headers]
+    StartTime = time.perf_counter()
+
+    if Format == 'hdf5':
+        if ContainerPath == None:
+            ContainerPath = path.normpath(OriginalFolder) + '.h5'
+        Filter = {}  # Compression arguments, filled in below
+        if Compression in ['lz4', 'blosc']:
+            try:
+                import hdf5plugin
+            except ImportError:
+                print('hdf5plugin not found, using gzip compression')
+                Compression = 'gzip'
+        if Compression == 'lz4':
+            Filter = dict(hdf5plugin.LZ4())
+        elif Compression == 'blosc':
+            Filter = dict(hdf5plugin.Blosc(
+                cname='lz4', clevel=CompressionLevel,
+                shuffle=hdf5plugin.Blosc.BITSHUFFLE))
+        elif Compression == 'gzip':
+            Filter = {'compression': 'gzip',
+                      'compression_opts': CompressionLevel}
+        elif Compression == 'lzf':
+            Filter = {'compression': 'lzf'}
+        Container = h5py.File(ContainerPath, 'w')
+        Data = Container.create_dataset('data', shape=Shape,
+                                        dtype=Frames.dtype, chunks=Chunks,
+                                        **Filter)
+        StringType = h5py.string_dtype()
+        Container.create_dataset('headers', data=np.array(Headers,
+                                                          dtype=object),
+                                 dtype=StringType)
+        for Name, Values in [('file_names', FileNames),
+                             ('new_file_names', newFileNames),
+                             ('scan_types', [str(ScanType) for ScanType in
+                                             Decoded['ScanTypes']])]:
+            Container.create_dataset(Name, data=np.array(Values,
+                                                         dtype=object),
+                                     dtype=StringType)
+        for Name, Steps in Decoded['Steps'].items():
+            Container.create_dataset('steps/' + Name, data=Steps)
+        Container.create_dataset('motors', data=Table.Positions)
+        Container['motors'].attrs['names'] = Table.Names
+        Container.attrs.update(Frames.Headers[0])
+    else:
+        if ContainerPath == None:
+            ContainerPath = path.normpath(OriginalFolder) + '.zarr'
+        Container = zarr.open_group(ContainerPath, mode='w')
+        if int(zarr.__version__.split('.')[0]) >= 3:
+            if Compression == 'lz4':
+                Compressors = [zarr.codecs.BloscCodec(cname='lz4')]
+            elif Compression == 'blosc':
+                Compressors = [zarr.codecs.BloscCodec(
+                    cname='lz4', clevel=CompressionLevel,
+                    shuffle='bitshuffle')]
+            else:
+                Compressors = None
+            Data = Container.create_array('data', shape=Shape,
+                                          dtype=Frames.dtype, chunks=Chunks,
+                                          compressors=Compressors)
+            createArray = lambda Name, Values: Container.create_array(
+                Name, data=Values)
+        else:
+            import numcodecs
+            if Compression == 'lz4':
+                Compressor = numcodecs.Blosc(cname='lz4')
+            elif Compression == 'blosc':
+                Compressor = numcodecs.Blosc(
+                    cname='lz4', clevel=CompressionLevel,
+                    shuffle=numcodecs.Blosc.BITSHUFFLE)
+            else:
+                Compressor = None
+            Data = Container.create_dataset('data', shape=Shape,
+                                            dtype=Frames.dtype,
+                                            chunks=Chunks,
+                                            compressor=Compressor)
+            createArray = lambda Name, Values: Container.create_dataset(
+                Name, data=Values)
+        for Name, Steps in Decoded['Steps'].items():
+            createArray('steps/' + Name, Steps)
+        createArray('motors', Table.Positions)
+        Container['motors'].attrs['names'] = Table.Names
+        Container.attrs.update(Frames.Headers[0])
+        Container.attrs['file_names'] = FileNames
+        Container.attrs['new_file_names'] = newFileNames
+        Container.attrs['scan_types'] = [str(ScanType) for ScanType in
+                                         Decoded['ScanTypes']]
+        Container.attrs['headers'] = Frames.Headers
+
+    # Write one block of whole chunks (all columns) at a time.
+    for FrameStart in range(0, Shape[0], Chunks[0]):
+        FrameStop = min(FrameStart + Chunks[0], Shape[0])
+        for RowStart in range(0, Shape[1], Chunks[1]):
+            RowStop = min(RowStart + Chunks[1], Shape[1])
+            Data[FrameStart:FrameStop, RowStart:RowStop] = np.asarray(
+                Frames[FrameStart:FrameStop, RowStart:RowStop])
+    if Format == 'hdf5':
+        Container.close()
+    if not Mute:
+        NBytes = Frames.dtype.itemsize*np.prod(Shape)
+        Duration = max(time.perf_counter() - StartTime, 1e-9)
+        print('%i files saved in %.1f s (%.1f MB/s): %s' %
+              (Shape[0], Duration, NBytes/Duration/10**6, ContainerPath))
+    return ContainerPath
 
 """ImageBrowser functions:"""
+class PyramidReader:
+    """
+    This is a reader of image pyramids saved by savePyramid(), used by imageBrowser(PyramidPath=...). For display, images are read from the smallest level at least as large as the displayed shape, and scaled to 8 bit (normalized to the maximum of each image, as saveAs()).
+
+    PyramidPath:
+        String/path. HDF5 file saved by savePyramid().
+    FileNames:
+        List of strings. New filenames of the images (as getNewFileNames()).
+    Levels:
+        List of int. Sizes of the levels, largest first.
+    """
+
+    def __init__(self, PyramidPath):
+
+        import h5py
+        self.File = h5py.File(PyramidPath, 'r')
+        self.FileNames = [Name.decode() if isinstance(Name, bytes) else Name
+                          for Name in self.File['names'][()]]
+        self.Levels = sorted((int(Level) for Level in
+                              self.File.attrs['levels']), reverse=True)
+        # h5py serializes access anyway, and is not safe to reenter.
+        self.Lock = threading.Lock()
+
+    def toImage(self, Data):
+
+        Data = np.asarray(Data, dtype=np.float64)
+        Maximum = np.amax(Data)
+        if Maximum > 0:
+            Data = Data*(255/Maximum)
+        return Image.fromarray(Data.astype(np.uint8), mode='L')
+
+    def getImage(self, Index, ImageShape):
+        """
+        Returns image nbr. <Index> as an 8-bit PIL.Image resized to <ImageShape> (width, height), read from the smallest sufficient level.
+        """
+        Level = self.Levels[0]
+        for Size in self.Levels:
+            if Size >= max(ImageShape):
+                Level = Size
+        with self.Lock:
+            Data = self.File['level_%i' % Level][Index]
+        return self.toImage(Data).resize(tuple(ImageShape))
+
+    def getCrop(self, Index, ImageShape):
+        """
+        Returns the centre of image nbr. <Index> at full resolution (largest level), cropped to <ImageShape> (width, height), as an 8-bit PIL.Image. Only the chunks of the crop are read.
+        """
+        Dataset = self.File['level_%i' % self.Levels[0]]
+        Width = min(ImageShape[0], Dataset.shape[2])
+        Height = min(ImageShape[1], Dataset.shape[1])
+        Row0 = (Dataset.shape[1] - Height)//2
+        Col0 = (Dataset.shape[2] - Width)//2
+        with self.Lock:
+            Data = Dataset[Index, Row0:Row0+Height, Col0:Col0+Width]
+        return self.toImage(Data)
+
+    def close(self):
+
+        self.File.close()
+class ImagePrefetcher:
+    """
+    This is a cache of images (PIL.Image, already resized to the displayed shape) for imageBrowser(). Images are decoded and resized in a pool of background threads when prefetch() is called with the indices of the files likely to be shown next (the neighbours of the current image along each scan dimension), so that ChangeImage() can display them without reading from disk. The least recently used images are dropped when the cache exceeds <CacheMB>.
+
+    Directory:
+        String/path. Folder of the files.
+    FileNames:
+        List of strings. Names of the files in Directory (indexed as root.FileNames).
+    ImageShape:
+        Tuple (width, height) to resize the images to.
+    CacheMB:
+        Float. Maximum size of the cached images in MB.
+    Workers:
+        int. Number of threads decoding images.
+    Loader:
+        Function taking an index and returning the resized PIL.Image. If None, the image is read from <Directory>/<FileNames[index]>.
+    """
+
+    BytesPerPixel = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2,
+                     'LA': 2, 'RGB': 3, 'RGBA': 4, 'I': 4, 'F': 4}
+
+    def __init__(self, Directory, FileNames, ImageShape, CacheMB=256,
+                 Workers=4, Loader=None):
+
+        self.Loader = Loader
+        self.Directory = Directory
+        self.FileNames = FileNames
+        self.ImageShape = tuple(ImageShape)
+        self.CacheBytes = CacheMB*10**6
+        self.Cache = OrderedDict()  # index: (PIL.Image, bytes)
+        self.Futures = {}  # index: Future, for images being loaded
+        self.UsedBytes = 0
+        self.Lock = threading.Lock()
+        self.Pool = ThreadPoolExecutor(max_workers=Workers)
+
+    def loadImage(self, Index):
+        """
+        Reads, decodes and resizes image nbr. <Index> (run in the background threads).
+        """
+        if self.Loader != None:
+            return self.Loader(Index)
+        FilePath = path.join(self.Directory, self.FileNames[Index])
+        ImageObject = Image.open(FilePath)
+        ImageObject = ImageObject.resize(self.ImageShape)
+        ImageObject.load()
+        return ImageObject
+
+    def store(self, Index, ImageObject):
+
+        Bytes = ImageObject.width*ImageObject.height*\
+            self.BytesPerPixel.get(ImageObject.mode, 4)
+        with self.Lock:
+            self.Futures.pop(Index, None)
+            if Index in self.Cache:
+                return
+            self.Cache[Index] = (ImageObject, Bytes)
+            self.UsedBytes += Bytes
+            while self.UsedBytes > self.CacheBytes and len(self.Cache) > 1:
+                OldObject, OldBytes = self.Cache.popitem(last=False)[1]
+                self.UsedBytes -= OldBytes
+
+    def get(self, Index):
+        """
+        Returns image nbr. <Index>, from the cache if prefetched (waiting for it if it is being loaded), otherwise read now.
+        """
+        with self.Lock:
+            if Index in self.Cache:
+                self.Cache.move_to_end(Index)
+                return self.Cache[Index][0]
+            Future = self.Futures.get(Index)
+        ImageObject = None
+        if Future != None:
+            try:
+                ImageObject = Future.result()
+            except Exception as e:
+                # Failed in the background: try once more here.
+                print('Prefetch of image nbr. %i failed (%s), reading it again' %
+                      (Index, e))
+        if ImageObject == None:
+            ImageObject = self.loadImage(Index)
+        self.store(Index, ImageObject)
+        return ImageObject
+
+    def prefetch(self, Indices):
+        """
+        Starts loading the images nbr. <Indices> in the background (those not already cached or being loaded). None entries are ignored.
+        """
+        for Index in Indices:
+            with self.Lock:
+                if Index == None or Index in self.Cache or\
+                        Index in self.Futures:
+                    continue
+                Future = self.Pool.submit(self.loadImage, Index)
+                self.Futures[Index] = Future
+            Future.add_done_callback(
+                lambda Future, Index=Index: self.finishPrefetch(Index,
+                                                                Future))
+
+    def finishPrefetch(self, Index, Future):
+        """
+        Stores the image of a finished prefetch. A failed (or cancelled) prefetch is removed from Futures, so that the image is read again by get() or a later prefetch().
+        """
+        if not Future.cancelled() and Future.exception() == None:
+            self.store(Index, Future.result())
+            return
+        with self.Lock:
+            if self.Futures.get(Index) is Future:
+                del self.Futures[Index]
+
+    def close(self):
+
+        self.Pool.shutdown(wait=False)
 def ChangeImage(root, ParamNbr=None, Direction=None, StartIndex=0):
     """
     This function adds/changes some attributes to/of root, incuding a widget that displays the first image found in root.FileNames. It can be used to change the displayed image to an adjacent step of the same scan (in the context of edf-files from ESRF ID06).
@@ -1051,7 +3047,9 @@ def ChangeImage(root, ParamNbr=None, Direction=None, StartIndex=0):
     ParamNbr:
         int. This gives the direction along which to move in a scan when opening next image; 0 to move to next/previous image of the first parameter in the filename, and 1 to move along the second parameter, as given by getNextFileIndex().
     Direction:
-        String. Either 'up' to increase or 'down' to decrease the parameter given by ParamNbr. If None (default), root is setup for showing an image (the first in root.FileNames) for the first time.
+        String. Either 'up' to increase or 'down' to decrease the parameter given by ParamNbr. If None (default), root is setup for showing an image (the first in root.FileNames) for the first time. If 'same', the current image is shown again (for instance after zooming).
+
+    If root has a Pyramid attribute (PyramidReader), images are read from it instead of from files, at full resolution if root.Zoom is True.
     """
 
     if Direction == None:
@@ -1059,6 +3057,8 @@ def ChangeImage(root, ParamNbr=None, Direction=None, StartIndex=0):
         root.CurrentIndex = StartIndex
         # Label widget that displays the image, store in root
         root.PhotoWidget = tk.Label(root.ImageFrame)
+    elif Direction == 'same':
+        pass
     else:
         NextIndex = getNextFileIndex(root, ParamNbr=ParamNbr,
                                      Direction=Direction)
@@ -1068,7 +3068,7 @@ def ChangeImage(root, ParamNbr=None, Direction=None, StartIndex=0):
             # Filename of currently displayed file, store in root.
             root.FileName = root.FileNames[root.CurrentIndex]
             # Nbr. of dimensions in scan.
-            root.ScanDimensions = getScanTypeFromName(root.FileName)[3]
+            root.ScanDimensions = getScanDimensions(root)
             for button in root.Buttons:
                 button.destroy()
             ButtonDirections = ['up', 'down']
@@ -1090,7 +3090,18 @@ def ChangeImage(root, ParamNbr=None, Direction=None, StartIndex=0):
     # Path of currently displayed file, store in root.
     root.FilePath = path.join(root.Directory, root.FileName)
     # Intermediary Image object
-    ImageObject = Image.open(root.FilePath).resize(root.ImageShape)
+    if hasattr(root, 'Pyramid') and root.Zoom:
+        # Full resolution (centre of image).
+        ImageObject = root.Pyramid.getCrop(root.CurrentIndex,
+                                           root.ImageShape)
+    elif hasattr(root, 'Prefetcher'):
+        # Read in the background if prefetched.
+        ImageObject = root.Prefetcher.get(root.CurrentIndex)
+    elif hasattr(root, 'Pyramid'):
+        ImageObject = root.Pyramid.getImage(root.CurrentIndex,
+                                            root.ImageShape)
+    else:
+        ImageObject = Image.open(root.FilePath).resize(root.ImageShape)
     print(ImageObject)
     # Photo to display, store in root.
     root.Photo = ImageTk.PhotoImage(ImageObject, master=root)
@@ -1101,6 +3112,14 @@ def ChangeImage(root, ParamNbr=None, Direction=None, StartIndex=0):
     # Change window title to show name of displayed file
     root.title('Image browser ' + ' %s' % root.FileName)
     print('Current file: %s' % root.FileName)
+    if hasattr(root, 'Prefetcher'):
+        # Start loading the neighbours along all scan dimensions.
+        Neighbours = []  # Fill in later
+        for n in range(getScanDimensions(root)):
+            for d in ['up', 'down']:
+                Neighbours.append(getNextFileIndex(root, ParamNbr=n,
+                                                   Direction=d))
+        root.Prefetcher.prefetch(Neighbours)
 def getScanTypeFromName(FileName):
     """
     This function returns a scan type based on a filename. This is intended to use on png-files converted from edf-files from ESRF ID06. FileName must be of the structure given by getNewFileName(). This function is in some ways the inverse of getNewFileName() in that getNewFileName() gives a filename basen on a scan type, while this function gives the scan type based on the filename. There is no differentiation between timescan and loopscan, or between mosaicity and zapimage-mosaicity, or strain and rocking. Rocking is called strain in getNewFileName() also.
@@ -1173,6 +3192,16 @@ def getScanTypeFromName(FileName):
         NScans = len(OtherParams)-1
 
     return ScanType, OtherParams, NoName, NScans
+def getScanDimensions(root):
+    """
+    This function returns the nbr. of dimensions of the scan of the currently displayed file (root.FileName), from root.ScanGrid if present, otherwise from getScanTypeFromName().
+
+    root:
+        Tk toplevel widget window with at least the attributes FileName and CurrentIndex.
+    """
+    if hasattr(root, 'ScanGrid'):
+        return root.ScanGrid.getScanDimensions(root.CurrentIndex)
+    return getScanTypeFromName(root.FileName)[3]
 def getNextFileIndex(root, ParamNbr=0, Direction='up'):
     """
     This function returns the index of the next image in root.FileNames when moving along a certain scan direction. It is intended for png-files converted from edf-files from ESRF ID06. ScanType is found from getScanTypeFromName(), which is used to find which part of the current root.FileName that is the scan location to increase/decrease to get the filename of the next image to display.
@@ -1187,8 +3216,14 @@ def getNextFileIndex(root, ParamNbr=0, Direction='up'):
         String. Either 'up' to increase or 'down' to decrease the parameter given by ParamNbr. If None (default), root is setup for showing an image (the first in root.FileNames) for the first time.
     NextFileIndex:
         int. Index of next image along the specified direction.
+
+    If root has a ScanGrid attribute (ScanGridIndex of root.FileNames, as made by imageBrowser()), the next index is looked up in it (using root.CurrentIndex) instead.
     """
 
+    if hasattr(root, 'ScanGrid'):
+        return root.ScanGrid.getNext(root.CurrentIndex, ParamNbr=ParamNbr,
+                                     Direction=Direction)
+
     File = root.FileName  # For easier read below.
     ScanType, OtherParams, NoName, NScans = getScanTypeFromName(File)
     # Nbr of scan parameters in this ScanType.
@@ -1274,8 +3309,123 @@ def getNextFileIndex(root, ParamNbr=0, Direction='up'):
         # Unexpected return from getScanTypeFromName().
         print('ScanType not recognized')
         return None
+class ScanGridIndex:
+    """
+    This is an index of the scan steps in the filenames of a folder (named as by getNewFileName()), made once by parsing every filename with getScanTypeFromName(). Each file is stored under its stem, scan parameter letters and step numbers, so the neighbour of a file along a scan direction is found by a dictionary lookup, instead of building the filename and searching through all filenames as getNextFileIndex() does without an index. Filenames without stem and obfoc filenames ('Oxyz') are handled as in getNextFileIndex().
+
+    FileNames:
+        List of strings. Filenames to index (as root.FileNames of imageBrowser()).
+    Entries:
+        List with (ScanType, NScans) of each file, as given by getScanTypeFromName().
+    """
+
+    def __init__(self, FileNames):
+
+        self.FileNames = FileNames
+        self.Entries = []  # Fill in below
+        self.Keys = []  # Fill in below: key of each file (or None)
+        self.Exact = {}  # key: index
+        # Step part of filename: index of first file ending with it.
+        self.Ends = {}
+        for Index, FileName in enumerate(FileNames):
+            ScanType, NScans, Key = self.parse(FileName)
+            self.Entries.append((ScanType, NScans))
+            self.Keys.append(Key)
+            if Key == None:
+                continue
+            self.Exact.setdefault(Key, Index)
+            Stem, Head, Letters, Values, Tail = Key
+            # Ends with and without '-' (the latter for nameless files).
+            for Dash in ['-', '']:
+                End = self.getEnd(Dash, Head, Letters, Values, Tail)
+                if FileName.endswith(End):
+                    self.Ends.setdefault(End, Index)
+
+    def parse(self, FileName):
+        """
+        Returns ScanType and NScans (from getScanTypeFromName()) and the key (stem, head, letters, step numbers, tail) of <FileName>. The key is None for files without scan type.
+        """
+        ScanType, OtherParams, NoName, NScans = getScanTypeFromName(
+            FileName)
+        NPrms = len(OtherParams)
+        if ScanType == 'obfoc':
+            NPrms -= 1
+        if ScanType == None or NPrms not in [2, 3]:
+            return ScanType, NScans, None
+        PrmInds = OtherParams[0:NPrms-1]
+        EndInd = OtherParams[NPrms-1]
+        if ScanType == 'obfoc':
+            # 'O' and all but the last of 'x', 'y' and 'z'.
+            NameEndInd = OtherParams[2]
+            Head = FileName[NameEndInd:PrmInds[0]]
+        else:
+            NameEndInd = PrmInds[0]
+            Head = ''
+        Letters = tuple(FileName[Ind] for Ind in PrmInds)
+        try:
+            Values = tuple(int(FileName[OtherParams[Ind]+1:
+                                        OtherParams[Ind+1]])
+                           for Ind in range(NPrms-1))
+        except ValueError:
+            return ScanType, NScans, None
+        if NoName:
+            Stem = None
+        else:
+            Stem = FileName[0:NameEndInd-1]
+        return ScanType, NScans, (Stem, Head, Letters, Values,
+                                  FileName[EndInd:])
+
+    def getEnd(self, Dash, Head, Letters, Values, Tail):
+
+        End = Dash + Head
+        for Letter, Value in zip(Letters, Values):
+            End += Letter + str(Value)
+        return End + Tail
+
+    def getNext(self, Index, ParamNbr=0, Direction='up'):
+        """
+        Returns the index of the next file from file nbr. <Index> along scan parameter nbr. <ParamNbr> in <Direction> ('up' or 'down'), or None if there is no such file. Files without scan type give the next file alphabetically.
+        """
+        if Direction == 'up':
+            Change = 1
+        elif Direction == 'down':
+            Change = -1
+        else:
+            print('Direction not valid')
+            return None
+        ScanType, NScans = self.Entries[Index]
+        Key = self.Keys[Index]
+        if ScanType == None:
+            # If no scan type, return next file alphabetically.
+            if 0 <= Index + Change < len(self.FileNames):
+                return Index + Change
+            return None
+        if Key == None:
+            print('ScanType not recognized')
+            return None
+        Stem, Head, Letters, Values, Tail = Key
+        Values = list(Values)
+        Values[ParamNbr] += Change
+        Values = tuple(Values)
+        NextKey = (Stem, Head, Letters, Values, Tail)
+        if NextKey in self.Exact:
+            return self.Exact[NextKey]
+        # Else find first file with the same step part, as
+        # getNextFileIndex().
+        if Stem == None:
+            Dash = ''
+        else:
+            Dash = '-'
+        return self.Ends.get(self.getEnd(Dash, Head, Letters, Values, Tail))
+
+    def getScanDimensions(self, Index):
+        """
+        Returns NScans (nbr. of scan dimensions) of file nbr. <Index>, as getScanTypeFromName().
+        """
+        return self.Entries[Index][1]
 def imageBrowser(DataType='png', DataFolder=None,
-                 ImageShape=(700, 700), StartIndex=0):
+                 ImageShape=(700, 700), StartIndex=0, CacheMB=256,
+                 PrefetchWorkers=4, PyramidPath=None):
     """
     This function opens a file from a folder - specified by a user prompt - and displays it with the oportunity to flip through images (within the folder) in the direction of increasing or decreasing scan step as given in the filename which is assumed to be of the form made by getNewFileName(). This is intended for png-files converted from edf-files from ESRF ID06. It does not work on 16-bit png-images.
 
@@ -1285,6 +3435,12 @@ def imageBrowser(DataType='png', DataFolder=None,
         String/path. If given (not None), this will be the folder whose files are browsed, and no user prompt occurs.
     ImageShape:
         Tuple with 2 elements. Width and height in pixels of the image shown.
+    CacheMB:
+        Float. Size in MB of the cache of prefetched images (see ImagePrefetcher). If 0, no images are prefetched.
+    PrefetchWorkers:
+        int. Number of threads prefetching images.
+    PyramidPath:
+        String/path. If given (not None), images are browsed from this image pyramid (saved by savePyramid()) instead of from a folder: the level matching ImageShape is shown, and a 'zoom' button toggles showing the centre of the image at full resolution. This also works for 16-bit data.
     """
 
     # Create toplevel window.
@@ -1293,7 +3449,12 @@ def imageBrowser(DataType='png', DataFolder=None,
     root.ImageShape = ImageShape
 
     # Get folder to open files from, and store in root.
-    if DataFolder == None:
+    if PyramidPath != None:
+        # Pyramid to read images from, store in root.
+        root.Pyramid = PyramidReader(PyramidPath)
+        root.Zoom = False
+        root.Directory = path.dirname(path.normpath(PyramidPath))
+    elif DataFolder == None:
         # Get folder from user input.
         root.Directory = path.normpath(askdirectory())
     else:
@@ -1301,7 +3462,20 @@ def imageBrowser(DataType='png', DataFolder=None,
         root.Directory = path.normpath(DataFolder)
 
     # Store list of files in root
-    root.FileNames = namesFromFolder(root.Directory, DataType=DataType)
+    if PyramidPath != None:
+        root.FileNames = root.Pyramid.FileNames
+        Loader = lambda Index: root.Pyramid.getImage(Index, root.ImageShape)
+    else:
+        root.FileNames = namesFromFolder(root.Directory, DataType=DataType)
+        Loader = None
+    # Index of scan steps in the filenames, store in root.
+    root.ScanGrid = ScanGridIndex(root.FileNames)
+    if CacheMB > 0:
+        # Cache of images loaded in the background, store in root.
+        root.Prefetcher = ImagePrefetcher(root.Directory, root.FileNames,
+                                          root.ImageShape, CacheMB=CacheMB,
+                                          Workers=PrefetchWorkers,
+                                          Loader=Loader)
 
     # Frame widget to show buttons/controls on, store in root
     root.ControlFrame = tk.Frame(root)
@@ -1309,11 +3483,17 @@ def imageBrowser(DataType='png', DataFolder=None,
     # Frame widget to show image on, store in root
     root.ImageFrame = tk.Frame(root)
     root.ImageFrame.grid(row=0, column=1)  # Right window column
+    if PyramidPath != None:
+        # Button to toggle full resolution, store in root
+        root.ZoomButton = tk.Button(root.ControlFrame, text='zoom',
+                                    font='16', command=lambda: toggleZoom(
+                                        root))
+        root.ZoomButton.pack()
 
     # Displayed the first image in the folder (alphabetically).
     ChangeImage(root, StartIndex=StartIndex)
     # Nbr. of dimensions in scan.
-    root.ScanDimensions = getScanTypeFromName(root.FileName)[3]
+    root.ScanDimensions = getScanDimensions(root)
 
     # Create list of buttons in root
     root.Buttons = []  # Fill in later
@@ -1330,23 +3510,1581 @@ def imageBrowser(DataType='png', DataFolder=None,
 
     # Run the interface
     root.mainloop()
+    if CacheMB > 0:
+        root.Prefetcher.close()
+    if PyramidPath != None:
+        root.Pyramid.close()
+def toggleZoom(root):
+    """
+    This function toggles between showing the whole image and the centre of the image at full resolution, in imageBrowser() with an image pyramid.
+
+    root:
+        Tk toplevel widget window made by imageBrowser() with PyramidPath given.
+    """
+    root.Zoom = not root.Zoom
+    ChangeImage(root, Direction='same')
+
+"""Background functions:"""
+def getBackgroundBand(Frames, RowStart, RowStop, Method='median',
+                      Percentile=50.0, TrimFraction=0.1, ColStart=0,
+                      ColStop=None):
+    """
+    This function computes the background of a band of rows (<RowStart> to <RowStop>, and columns <ColStart> to <ColStop>) through all the frames in <Frames>. Only the window of the band is read from each file (with readRoiStack()), so no more than the band is read. The band is stacked as a (frames, rows, columns) numpy.array in the native data type of the files, and reduced along the frame axis. It is used by getBackground(), where the methods are explained.
+
+    Frames:
+        FrameStack (from loadFolder() with Lazy=True). Frames to compute the background from.
+    RowStart, RowStop:
+        int. First row (zero-indexed) and the row after the last row of the band.
+    ColStart, ColStop:
+        int. First column and the column after the last column of the band. If ColStop is None, the band goes to the last column.
+    Band:
+        numpy.array (float64) of shape (RowStop-RowStart, ColStop-ColStart).
+    """
+    Stack = readRoiStack(Frames, (RowStart, RowStop, ColStart, ColStop))
+    if Method == 'median':
+        Band = np.median(Stack, axis=0)
+    elif Method == 'mean':
+        Band = np.mean(Stack, axis=0, dtype=np.float64)
+    elif Method == 'percentile':
+        Band = np.percentile(Stack, Percentile, axis=0)
+    elif Method == 'trimmed mean':
+        # Same number of frames cut as scipy.stats.trim_mean().
+        NCut = int(TrimFraction*len(Frames))
+        Stack.sort(axis=0)
+        Band = np.mean(Stack[NCut:len(Frames)-NCut], axis=0,
+                       dtype=np.float64)
+    return Band.astype(np.float64, copy=False)
+def getBackground(FolderPath, DataType='edf', Method='median',
+                  Percentile=50.0, TrimFraction=0.1,
+                  MaxMemory=2*1024**3, Workers=None, Mute=False, Roi=None):
+    """
+    This function returns a background image computed pixel by pixel through all the edf images in a folder (or a region of interest of them), without holding all the images in memory at once. The images are opened as a FrameStack and split into bands of rows, and each band is read from all files (in the native data type, uint16 for edf-files from ESRF ID06) and reduced with getBackgroundBand(). The band height is chosen so that the total memory used stays below <MaxMemory>, and the bands are processed in parallel in a thread pool (numpy releases the GIL while sorting). The result is the same as numpy.median() (or numpy.mean() etc.) along the frame axis of the (files, rows, columns) array from make_data_array(), which holds all frames at once (2 bytes per pixel and frame in the default native uint16, 8 with dtype=numpy.float64).
 
+    FolderPath:
+        String/path. Folder/directory in which to search for images.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included, otherwise all files are included.
+    Method:
+        String. 'median', 'mean', 'trimmed mean' or 'percentile'.
+    Percentile:
+        Float. Percentile (0 to 100) to use when <Method> is 'percentile'.
+    TrimFraction:
+        Float. Fraction of frames to cut from each end (lowest and highest values of each pixel) when <Method> is 'trimmed mean'.
+    MaxMemory:
+        int. Approximate upper limit (bytes) of the memory used, including the returned array. 2*1024**3 means 2 GB.
+    Workers:
+        int. Number of bands processed in parallel. If None, the number of CPU cores is used.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Roi:
+        Tuple (RowStart, RowStop, ColStart, ColStop), see getRoiBounds(). If given, only this window of the images is read, and the background has the shape of the window.
+    Background:
+        numpy.array (float64) of shape (rows, columns). None is returned if no files are found or Method is invalid.
+    """
+    try:
+        if Method not in ['median', 'mean', 'trimmed mean', 'percentile']:
+            raise MyException('Invalid Method')
+    except MyException as e:
+        print(e)
+        return None
+
+    Frames, FileNames = loadFolder(FolderPath, DataType=DataType,
+                                   Mute=True, Lazy=True)
+    if Frames == None:
+        print('No files found in %s' % FolderPath)
+        return None
+    NFrames = len(Frames)
+    RowFirst, RowLast, ColStart, ColStop = getRoiBounds(Roi,
+                                                         Frames.shape[1:])
+    NRows = RowLast - RowFirst
+    NCols = ColStop - ColStart
+    ItemSize = Frames.dtype.itemsize
+
+    if Workers == None:
+        Workers = cpu_count() or 1
+    """ Each worker holds its band, a sorted/partitioned copy of it and the result. The returned array is shared."""
+    BytesPerRow = NFrames*NCols*(2*ItemSize) + NCols*8
+    WorkerMemory = (MaxMemory - NRows*NCols*8)//Workers
+    BandRows = int(min(NRows, max(1, WorkerMemory//BytesPerRow)))
+    if WorkerMemory < BytesPerRow:
+        print('MaxMemory too small for %i frames, using one row per band' %
+              NFrames)
+    Bands = [(RowStart, min(RowStart + BandRows, NRows))
+             for RowStart in range(0, NRows, BandRows)]
+    Workers = min(Workers, len(Bands))
+    if not Mute:
+        print('\nComputing %s background of %i files in %i band(s) of %i rows with %i worker(s)...' %
+              (Method, NFrames, len(Bands), BandRows, Workers))
+
+    Background = np.empty((NRows, NCols))
+    with ThreadPoolExecutor(max_workers=Workers) as Pool:
+        Futures = [Pool.submit(getBackgroundBand, Frames,
+                               RowFirst + RowStart, RowFirst + RowStop,
+                               Method=Method, Percentile=Percentile,
+                               TrimFraction=TrimFraction,
+                               ColStart=ColStart, ColStop=ColStop)
+                   for RowStart, RowStop in Bands]
+        for (RowStart, RowStop), Future in zip(Bands, Futures):
+            Background[RowStart:RowStop] = Future.result()
+            if not Mute:
+                print('Rows %i to %i done' % (RowStart, RowStop))
+    return Background
+class BackgroundModel:
+    """
+    This is a background model which is updated one frame at a time, so that a background folder only has to be read once: when new files are added to the folder, update() reads only those. For each pixel it keeps the number of frames, the running mean and sum of squared deviations (Welford's method, giving the variance), and an estimate of a percentile (the median by default) with the P-square algorithm (Jain & Chlamtac, 1985), vectorized over all pixels. The P-square estimate uses five markers per pixel (heights and positions), which are moved towards the desired quantile positions with parabolic interpolation as frames are added; it is exact for up to five frames and usually within a few counts of numpy.median() for background frames. The state is saved to (and loaded from) an npz-file with save(), together with the filename, modification time and size of every file ingested (the filename only, so the state stays valid when the folder is copied or moved).
+
+    StatePath:
+        String/path. npz-file of a saved state. Loaded if it exists, and used by save().
+    Percentile:
+        Float. Percentile (0 to 100) estimated with P-square. Ignored if a state is loaded (the saved percentile is used).
+    """
+
+    def __init__(self, StatePath=None, Percentile=50.0):
+
+        self.StatePath = StatePath
+        self.Percentile = Percentile
+        self.Count = 0
+        self.FileKeys = {}  # Fill in with update(): name: [mtime, size]
+        self.Mean = None    # Made when the first frame is added
+        self.M2 = None
+        self.Heights = None  # P-square markers, (5, rows, columns)
+        self.Positions = None
+        if StatePath != None and path.isfile(StatePath):
+            self.load()
+
+    def __repr__(self):
+
+        return 'BackgroundModel(%i frames, percentile %g)' % (
+            self.Count, self.Percentile)
+
+    def getDesiredPositions(self, Count):
+        """
+        Returns the desired (one-indexed) positions of the five P-square markers after <Count> frames. They are the same for all pixels.
+        """
+        p = self.Percentile/100
+        Increments = np.array([0, p/2, p, (1+p)/2, 1])
+        return np.array([1, 1+2*p, 1+4*p, 3+2*p, 5]) + (Count-5)*Increments
+
+    def add(self, Frame):
+        """
+        Adds a frame (numpy.array or numpy.memmap of the frame shape) to the model.
+        """
+        Frame = np.asarray(Frame, dtype=np.float64)
+        if self.Count == 0:
+            self.Mean = np.zeros(Frame.shape)
+            self.M2 = np.zeros(Frame.shape)
+            self.Heights = np.zeros((5,) + Frame.shape, dtype=np.float32)
+            self.Positions = np.zeros((5,) + Frame.shape, dtype=np.int32)
+        self.Count += 1
+        Delta = Frame - self.Mean
+        self.Mean += Delta/self.Count
+        self.M2 += Delta*(Frame - self.Mean)
+
+        if self.Count <= 5:
+            """ The first five frames are kept (sorted when the fifth is added) as the initial markers."""
+            self.Heights[self.Count-1] = Frame
+            if self.Count == 5:
+                self.Heights.sort(axis=0)
+                self.Positions[:] = np.arange(1, 6).reshape(
+                    (5,) + (1,)*Frame.ndim)
+            return
+        q = self.Heights
+        n = self.Positions
+        # Markers above the new value move up one position.
+        for i in [1, 2, 3]:
+            n[i] += Frame < q[i]
+        n[4] += 1
+        np.minimum(q[0], Frame, out=q[0])
+        np.maximum(q[4], Frame, out=q[4])
+        Desired = self.getDesiredPositions(self.Count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i in [1, 2, 3]:
+                d = Desired[i] - n[i]
+                Up = (d >= 1) & (n[i+1] - n[i] > 1)
+                Down = (d <= -1) & (n[i-1] - n[i] < -1)
+                if not (Up.any() or Down.any()):
+                    continue
+                s = Up.astype(np.int32) - Down
+                qi = q[i].astype(np.float64)
+                qUp = q[i+1].astype(np.float64)
+                qDown = q[i-1].astype(np.float64)
+                nUp = n[i+1] - n[i]
+                nDown = n[i] - n[i-1]
+                Parabolic = qi + s/(nUp + nDown)*(
+                    (nDown + s)*(qUp - qi)/nUp +
+                    (nUp - s)*(qi - qDown)/nDown)
+                Linear = np.where(Up, qi + (qUp - qi)/nUp,
+                                  qi - (qi - qDown)/nDown)
+                New = np.where((qDown < Parabolic) & (Parabolic < qUp),
+                               Parabolic, Linear)
+                Move = Up | Down
+                q[i][Move] = New[Move]
+                n[i] += s
+
+    def update(self, FolderPath, DataType='edf', Mute=False):
+        """
+        Adds the (edf) files in <FolderPath> that have not been added before (identified by their filename, modification time and size), and returns the number of files added. Files that have changed since they were added can not be removed from the model, and are only reported. The state file of the model (and its temporary file) is skipped if it is in <FolderPath>.
+        """
+        if self.StatePath != None:
+            StatePaths = [path.abspath(self.StatePath),
+                          path.abspath(self.StatePath + '.tmp')]
+        else:
+            StatePaths = []
+        FilePaths = []  # Fill in below: new files
+        for FileName in namesFromFolder(FolderPath, DataType=DataType):
+            FilePath = path.join(FolderPath, FileName)
+            if path.abspath(FilePath) in StatePaths:
+                continue
+            Key = [path.getmtime(FilePath), path.getsize(FilePath)]
+            if FileName not in self.FileKeys:
+                FilePaths.append((FileName, FilePath, Key))
+            elif self.FileKeys[FileName] != Key:
+                print('File changed after it was added to the background (not updated): ' +
+                      FilePath)
+        NAdded = 0
+        for FileName, FilePath, Key in FilePaths:
+            Header, DataOffset = readEdfHeader(FilePath)
+            if Header == None:
+                # Reported by readEdfHeader(), tried again next update.
+                continue
+            Frames = FrameStack([FilePath], [Header], [DataOffset])
+            self.add(Frames[0])
+            Frames.close()
+            self.FileKeys[FileName] = Key
+            NAdded += 1
+            if not Mute:
+                print('Added to background: ' + FilePath)
+        if not Mute:
+            print('%i new file(s) added to the background, %i in total' %
+                  (NAdded, self.Count))
+        return NAdded
+
+    def getMean(self):
+        """
+        Returns the mean of each pixel (numpy.array, float64).
+        """
+        return self.Mean.copy()
+
+    def getVariance(self):
+        """
+        Returns the (sample) variance of each pixel (numpy.array, float64), as numpy.var(..., ddof=1). NaN if fewer than two frames are added.
+        """
+        if self.Count < 2:
+            return np.full(self.Mean.shape, np.nan)
+        return self.M2/(self.Count - 1)
+
+    def getStd(self):
+        """
+        Returns the (sample) standard deviation of each pixel (numpy.array, float64).
+        """
+        return np.sqrt(self.getVariance())
+
+    def getMedian(self):
+        """
+        Returns the P-square estimate of the percentile (the median by default) of each pixel (numpy.array, float64). With five frames or fewer it is computed exactly with numpy.percentile().
+        """
+        if self.Count < 5:
+            return np.percentile(self.Heights[:self.Count], self.Percentile,
+                                 axis=0)
+        elif self.Count == 5:
+            return np.percentile(self.Heights, self.Percentile, axis=0)
+        return self.Heights[2].astype(np.float64)
+
+    def save(self, StatePath=None):
+        """
+        Saves the state to the npz-file <StatePath> (if None, to the StatePath of the model). The file is written to a temporary file first and then replaced, so an interrupted save does not leave a broken state.
+        """
+        if StatePath == None:
+            StatePath = self.StatePath
+        self.StatePath = StatePath
+        TempPath = StatePath + '.tmp'
+        with open(TempPath, 'wb') as OpenFile:
+            np.savez(OpenFile, Count=self.Count, Percentile=self.Percentile,
+                     FileKeys=json.dumps(self.FileKeys), Mean=self.Mean,
+                     M2=self.M2, Heights=self.Heights,
+                     Positions=self.Positions)
+        replace(TempPath, StatePath)
+
+    def load(self):
+        """
+        Loads the state from the npz-file StatePath of the model.
+        """
+        with np.load(self.StatePath) as State:
+            self.Count = int(State['Count'])
+            self.Percentile = float(State['Percentile'])
+            # States saved with full paths are keyed by filename.
+            self.FileKeys = dict(
+                (path.basename(Key), Value) for Key, Value in
+                json.loads(str(State['FileKeys'])).items())
+            if self.Count > 0:
+                self.Mean = State['Mean']
+                self.M2 = State['M2']
+                self.Heights = State['Heights']
+                self.Positions = State['Positions']
+def updateBackground(FolderPath, StatePath=None, DataType='edf',
+                     Percentile=50.0, Mute=False):
+    """
+    This function loads the BackgroundModel saved for a background folder, adds the files of the folder that have not been added before, and saves the model again if files were added. Re-running an analysis after one new background frame is acquired therefore reads one frame, not the whole folder. The median background is BackgroundModel.getMedian() of the returned model.
+
+    FolderPath:
+        String/path. Folder/directory with the background images.
+    StatePath:
+        String/path. npz-file of the model. If None, 'background_<DataType>.npz' in <FolderPath> is used.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included.
+    Percentile:
+        Float. Percentile (0 to 100) estimated by a new model (see BackgroundModel).
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Model:
+        BackgroundModel. None if no files are found.
+    """
+    if StatePath == None:
+        StatePath = path.join(FolderPath, 'background_%s.npz' %
+                              str(DataType).replace('.', '_'))
+    Model = BackgroundModel(StatePath, Percentile=Percentile)
+    if Model.update(FolderPath, DataType=DataType, Mute=Mute) > 0:
+        Model.save()
+    if Model.Count == 0:
+        print('No files found in %s' % FolderPath)
+        return None
+    return Model
+
+"""Analysis functions:"""
+def makeScanCube(FolderPath, DataType='edf', Scan=None, CubePath=None,
+                 Mute=False):
+    """
+    This function places the frames of a 2D scan into an N-D array (data cube), using the scan steps found with decodeScanSteps(). Mosaicity scans give a (chi, diffry, rows, columns) cube, strain (and rocking) scans an (obpitch, diffry, rows, columns) cube, and zapline-diffry scans a (time, diffry, rows, columns) cube. Each frame is read once, from its memory-mapped file (see FrameStack), directly into its place in the cube. Steps without a file (for instance of an aborted scan) are left as zeros and marked False in <Mask>.
+
+    FolderPath:
+        String/path. Folder with the edf-files of the scan.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included, otherwise all files are included.
+    Scan:
+        String. 'scan' header entry of the files to include, for folders with more than one scan. If None, the scan of the first file is used.
+    CubePath:
+        String/path. If given (not None), the cube is a numpy.memmap backed by this .npy file (which can later be opened with numpy.load(CubePath, mmap_mode='r')), so scans larger than the memory can be assembled. Otherwise the cube is kept in memory.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Cube:
+        numpy.array (or numpy.memmap) of shape (outer steps, diffry steps, rows, columns) in the data type of the files.
+    Mask:
+        numpy.array (bool) of shape (outer steps, diffry steps). True where a frame was found.
+    Axes:
+        Dictionary of the names of the two scan axes (for instance 'chi' and 'diffry'): numpy.array of the mean motor position (or step number for 'time') of each step. NaN where no frame was found.
+    """
+    Frames, FileNames = loadFolder(FolderPath, DataType=DataType, Mute=True,
+                                   Lazy=True)
+    try:
+        if Frames == None:
+            raise MyException('No files found in %s' % FolderPath)
+        if Scan == None:
+            Scan = Frames.Headers[0]['scan']
+        Indices = [Index for Index, Header in enumerate(Frames.Headers)
+                   if Header.get('scan') == Scan]
+        if len(Indices) == 0:
+            raise MyException('No files with scan %s' % Scan)
+        Frames = Frames[Indices]
+        FileNames = [FileNames[Index] for Index in Indices]
+        Decoded = decodeScanSteps(Frames.Headers, FileNames=FileNames)
+        ScanType = Decoded['ScanTypes'][0]
+        if ScanType in ['mosaicity', 'zapimage-mosaicity']:
+            OuterName = 'chi'
+        elif ScanType == 'strain':
+            OuterName = 'obpitch'
+        elif ScanType == 'zapline-diffry':
+            OuterName = 'time'
+        else:
+            raise MyException('ScanType %s can not be made into a cube' %
+                              ScanType)
+    except MyException as e:
+        print(e)
+        return None, None, None
+
+    OuterSteps = Decoded['Steps'][OuterName]
+    diffrySteps = Decoded['Steps']['diffry']
+    # Include steps of aborted scans, as given by the scan command.
+    ScanParameters = getScanParameters(Frames.Headers[0])
+    if ScanType in ['mosaicity', 'zapimage-mosaicity']:
+        NOuter = max(ScanParameters[1] + 1, np.amax(OuterSteps) + 1)
+        Ndiffry = max(ScanParameters[0] + 1, np.amax(diffrySteps) + 1)
+    else:
+        NOuter = np.amax(OuterSteps) + 1
+        Ndiffry = max(ScanParameters + 1, np.amax(diffrySteps) + 1)
+    FrameShape = Frames.shape[1:]
+    Shape = (int(NOuter), int(Ndiffry)) + FrameShape
+
+    if CubePath != None:
+        Cube = np.lib.format.open_memmap(CubePath, mode='w+',
+                                         dtype=Frames.dtype, shape=Shape)
+    else:
+        Cube = np.zeros(Shape, dtype=Frames.dtype)
+    Mask = np.zeros(Shape[0:2], dtype=bool)
+    if not Mute:
+        print('\nMaking %s cube of shape %s from %i files...' %
+              (ScanType, Shape, len(Frames)))
+    for Index in range(len(Frames)):
+        Step = (OuterSteps[Index], diffrySteps[Index])
+        if Mask[Step]:
+            print('More than one file at step %s, using %s' %
+                  (Step, FileNames[Index]))
+        # The only copy: from the memory-mapped file into the cube.
+        Cube[Step] = Frames[Index]
+        Mask[Step] = True
+    if CubePath != None:
+        Cube.flush()
+    if np.sum(~Mask) > 0 and not Mute:
+        print('%i steps missing in %s' % (np.sum(~Mask), FolderPath))
+
+    # Mean motor position of each step.
+    Axes = {}  # Fill in below
+    for Name, Steps, NSteps in [(OuterName, OuterSteps, Shape[0]),
+                                ('diffry', diffrySteps, Shape[1])]:
+        if Name == 'time':
+            Values = Steps.astype(float)
+        else:
+            Values = Decoded['Values'][Name]
+        Counts = np.bincount(Steps, minlength=NSteps)
+        Sums = np.bincount(Steps, weights=Values, minlength=NSteps)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            Axes[Name] = Sums/Counts
+        if Name == 'time':
+            Axes[Name][Counts == 0] = np.nan
+    return Cube, Mask, Axes
+
+class MomentAccumulator:
+    """
+    This is an accumulator of the per-pixel moments of the intensity distribution (rocking curve) along one or more scan axes. Frames are added one at a time, each with its motor position(s), and only the sums  sum(w), sum(w*x) and sum(w*x**2) are kept (float64 arrays of the frame shape), where w is the (background-subtracted and thresholded) intensity and x the motor position. The positions are taken relative to the first position added, which keeps the variance accurate for narrow rocking curves at large angles. Used by getMomentMaps().
+
+    Shape:
+        Tuple. Shape of the frames (or tile of the frames) to add.
+    AxisNames:
+        List of strings. Names of the scan axes (for instance ['diffry', 'chi']).
+    Background:
+        numpy.array of shape <Shape>. Subtracted from each frame (for instance from getBackground()). If None, nothing is subtracted.
+    Threshold:
+        Float. Intensities (after background subtraction) below this value are set to zero.
+    """
+
+    def __init__(self, Shape, AxisNames, Background=None, Threshold=0.0):
+
+        self.AxisNames = list(AxisNames)
+        self.Background = Background
+        self.Threshold = Threshold
+        self.NFrames = 0
+        self.References = {}  # Set by the first frame added
+        self.Sum0 = np.zeros(Shape)
+        self.Sum1 = dict((Name, np.zeros(Shape)) for Name in AxisNames)
+        self.Sum2 = dict((Name, np.zeros(Shape)) for Name in AxisNames)
+
+    def add(self, Frame, Positions):
+        """
+        Adds a frame, where <Positions> is a dictionary of axis name: motor position of the frame.
+        """
+        if self.Background is not None:
+            Weight = np.asarray(Frame, dtype=np.float64) - self.Background
+        else:
+            Weight = np.array(Frame, dtype=np.float64)
+        Weight[Weight < self.Threshold] = 0
+        # Also remove negative intensities left by the background.
+        np.maximum(Weight, 0, out=Weight)
+        if self.NFrames == 0:
+            self.References = dict((Name, Positions[Name])
+                                   for Name in self.AxisNames)
+        self.Sum0 += Weight
+        for Name in self.AxisNames:
+            Position = Positions[Name] - self.References[Name]
+            self.Sum1[Name] += Weight*Position
+            self.Sum2[Name] += Weight*Position**2
+        self.NFrames += 1
+
+    def getMaps(self):
+        """
+        Returns a dictionary of maps (numpy.array of the frame shape): 'Intensity' (integrated intensity), and for each axis name, for instance 'diffry': 'COM_diffry' (centre of mass), 'Variance_diffry' and 'FWHM_diffry' (of a Gaussian with that variance). NaN where the integrated intensity is zero.
+        """
+        Maps = {'Intensity': self.Sum0.copy()}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for Name in self.AxisNames:
+                Mean = self.Sum1[Name]/self.Sum0
+                Variance = np.maximum(self.Sum2[Name]/self.Sum0 - Mean**2, 0)
+                Maps['COM_' + Name] = Mean + self.References.get(Name, 0)
+                Maps['Variance_' + Name] = Variance
+                Maps['FWHM_' + Name] = 2*np.sqrt(2*np.log(2)*Variance)
+        return Maps
+def accumulateMoments(Frames, RowStart, RowStop, Positions, AxisNames,
+                      Background=None, Threshold=0.0):
+    """
+    This function adds the rows <RowStart> to <RowStop> of all frames in <Frames> to a MomentAccumulator, reading only these rows of each (memory-mapped) file. It is used by getMomentMaps() to process tiles of the frames in parallel.
+
+    Frames:
+        FrameStack (from loadFolder() with Lazy=True).
+    RowStart, RowStop:
+        int. First row (zero-indexed) and the row after the last row of the tile.
+    Positions:
+        Dictionary of axis name: numpy.array of the motor position of each frame.
+    AxisNames, Background, Threshold:
+        As in MomentAccumulator. Background is the whole (not tiled) background.
+    Accumulator:
+        MomentAccumulator of the tile.
+    """
+    if Background is not None:
+        Background = Background[RowStart:RowStop]
+    Accumulator = None  # Made from the shape of the first tile
+    for Index in range(len(Frames)):
+        Frame = Frames[Index, RowStart:RowStop]
+        if Accumulator == None:
+            Accumulator = MomentAccumulator(np.shape(Frame), AxisNames,
+                                            Background=Background,
+                                            Threshold=Threshold)
+        Accumulator.add(Frame, dict((Name, Positions[Name][Index])
+                                    for Name in AxisNames))
+    return Accumulator
+def getMomentMaps(FolderPath, AxisNames=None, Background=None,
+                  Threshold=0.0, DataType='edf', Scan=None, NTiles=None,
+                  Workers=None, Mute=False):
+    """
+    This function computes per-pixel maps of integrated intensity, centre of mass, variance and FWHM of the rocking curves of a scan (for instance along diffry and chi for a mosaicity scan), without holding the scan in memory. The frames are opened as a FrameStack and split into tiles of rows, which are streamed through MomentAccumulator in parallel (with accumulateMoments()). Motor positions are found with MotorTable.
+
+    FolderPath:
+        String/path. Folder with the edf-files of the scan.
+    AxisNames:
+        List of strings. Motors to compute moments along. If None, ['diffry', 'chi'] is used for mosaicity scans, ['diffry', 'obpitch'] for strain scans and ['diffry'] otherwise.
+    Background:
+        numpy.array of the frame shape. Subtracted from each frame, for instance the median background from getBackground(). If None, nothing is subtracted.
+    Threshold:
+        Float. Intensities (after background subtraction) below this value are set to zero.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included, otherwise all files are included.
+    Scan:
+        String. 'scan' header entry of the files to include, for folders with more than one scan. If None, the scan of the first file is used.
+    NTiles:
+        int. Number of tiles (bands of rows) the frames are split into. If None, 4 tiles per worker are used. Each tile uses (3 + 2*len(AxisNames)) float64 values per pixel.
+    Workers:
+        int. Number of tiles processed in parallel. If None, the number of CPU cores is used.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Maps:
+        Dictionary of maps, as returned by MomentAccumulator.getMaps(). None is returned if no files are found.
+    """
+    Frames, FileNames = loadFolder(FolderPath, DataType=DataType, Mute=True,
+                                   Lazy=True)
+    if Frames == None:
+        print('No files found in %s' % FolderPath)
+        return None
+    if Scan == None:
+        Scan = Frames.Headers[0]['scan']
+    Frames = Frames[[Index for Index, Header in enumerate(Frames.Headers)
+                     if Header.get('scan') == Scan]]
+    if AxisNames == None:
+        ScanType = getScanType(Frames.Headers[0])
+        if ScanType in ['mosaicity', 'zapimage-mosaicity']:
+            AxisNames = ['diffry', 'chi']
+        elif ScanType == 'strain':
+            AxisNames = ['diffry', 'obpitch']
+        else:
+            AxisNames = ['diffry']
+    Table = MotorTable(Frames.Headers)
+    Positions = dict((Name, Table[Name]) for Name in AxisNames)
+
+    if Workers == None:
+        Workers = cpu_count() or 1
+    if NTiles == None:
+        NTiles = 4*Workers
+    NRows = Frames.shape[1]
+    Edges = np.linspace(0, NRows, min(NTiles, NRows) + 1).astype(int)
+    if not Mute:
+        print('\nComputing moments along %s of %i files in %i tiles...' %
+              (', '.join(AxisNames), len(Frames), len(Edges)-1))
+
+    Maps = {}  # Fill in below
+    with ThreadPoolExecutor(max_workers=Workers) as Pool:
+        Futures = [Pool.submit(accumulateMoments, Frames, RowStart, RowStop,
+                               Positions, AxisNames, Background=Background,
+                               Threshold=Threshold)
+                   for RowStart, RowStop in zip(Edges[:-1], Edges[1:])]
+        for RowStart, RowStop, Future in zip(Edges[:-1], Edges[1:],
+                                             Futures):
+            for Key, TileMap in Future.result().getMaps().items():
+                if Key not in Maps:
+                    Maps[Key] = np.empty((NRows,) + TileMap.shape[1:])
+                Maps[Key][RowStart:RowStop] = TileMap
+    return Maps
+
+"""Live functions:"""
+class FolderWatcher:
+    """
+    This is a watcher of a folder which is being filled with (edf) files during acquisition. poll() lists the folder and returns the files that are complete since the last poll, in sorted order. A file is complete when its size has not changed since the previous poll and, for uncompressed edf-files, it is at least as large as the header offset plus the image data (so a half-written file is never returned). Only new or growing files are checked, so a poll costs one directory listing. Used by watchFolder().
+
+    FolderPath:
+        String/path. Folder to watch.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included.
+    Existing:
+        bool. If true, files already in the folder are returned by the first poll(s), otherwise they are skipped.
+    """
+
+    def __init__(self, FolderPath, DataType='edf', Existing=False):
+
+        self.FolderPath = FolderPath
+        self.DataType = DataType
+        self.Sizes = {}  # Files not complete yet: file name: size at last poll
+        self.Invalid = {}  # Files without a valid header: file name: size
+        self.Done = set()
+        if not Existing:
+            self.Done.update(self.listSizes())
+
+    def listSizes(self):
+        """
+        Returns a dictionary of file name: size (bytes) of the files in the folder (with names ending with DataType).
+        """
+        Sizes = {}  # Fill in below
+        for Entry in scandir(self.FolderPath):
+            if Entry.is_file() and (self.DataType == None or
+                                    Entry.name.endswith(self.DataType)):
+                Sizes[Entry.name] = Entry.stat().st_size
+        return Sizes
+
+    def isComplete(self, FileName, Size):
+        """
+        Returns True if the edf-file <FileName> (of <Size> bytes) holds its whole header and image data. A file without a valid header is reported (by readEdfHeader()) once, and not read again until its size changes.
+        """
+        if not FileName.endswith('edf'):
+            return True
+        if self.Invalid.get(FileName) == Size:
+            return False
+        Header, DataOffset = readEdfHeader(path.join(self.FolderPath,
+                                                     FileName))
+        if Header == None:
+            self.Invalid[FileName] = Size
+            return False
+        self.Invalid.pop(FileName, None)
+        DataType, Shape = getEdfLayout(Header)
+        if DataType is None:
+            return True     # Compressed: size is stable
+        return Size >= DataOffset + DataType.itemsize*Shape[0]*Shape[1]
+
+    def poll(self):
+        """
+        Returns a sorted list of the file names that have become complete since the last poll.
+        """
+        Complete = []  # Fill in below
+        for FileName, Size in self.listSizes().items():
+            if FileName in self.Done:
+                continue
+            if self.Sizes.get(FileName) == Size and Size > 0 and\
+                    self.isComplete(FileName, Size):
+                Complete.append(FileName)
+                self.Done.add(FileName)
+                del self.Sizes[FileName]
+            else:
+                self.Sizes[FileName] = Size
+        return sorted(Complete)
+class LivePipeline:
+    """
+    This is a pipeline which processes frames one at a time as they are acquired (see watchFolder()). Each frame is classified with getScanType() and getScanLocation(), and then passed through the stages in <Stages>, in order. The built-in stages are:
+        'background':   Subtracts <Background> from the frame (Item['Subtracted']).
+        'moments':      Adds the frame to a MomentAccumulator of its scan (one per 'scan' entry; a new one is started when 'run' is 0 again), so moment maps of the scan so far are available from getMaps() at any time. The axes are chosen as in getMomentMaps().
+        'thumbnail':    Saves a downscaled 8-bit png of the (background-subtracted) frame to <ThumbnailFolder>, with the same name as the file.
+    A stage can also be a function taking the pipeline and the item (a dictionary with 'FileName', 'FilePath', 'Header', 'ScanType', 'Location', 'Frame' and, after 'background', 'Subtracted'); it can add entries to the item for later stages.
+
+    Stages:
+        List of strings (built-in stages) and/or functions.
+    Background:
+        numpy.array of the frame shape, or BackgroundModel (whose median is used). If None, nothing is subtracted.
+    Threshold:
+        Float. As in MomentAccumulator.
+    ThumbnailFolder:
+        String/path. Folder for the thumbnails (made if it does not exist).
+    ThumbnailSize:
+        int. Approximate size (pixels along the longest side) of the thumbnails.
+    """
+
+    def __init__(self, Stages=('background', 'moments', 'thumbnail'),
+                 Background=None, Threshold=0.0, ThumbnailFolder=None,
+                 ThumbnailSize=256):
+
+        try:
+            for Stage in Stages:
+                if not callable(Stage) and Stage not in ['background',
+                                                         'moments',
+                                                         'thumbnail']:
+                    raise MyException('Invalid stage: %s' % Stage)
+            if 'thumbnail' in Stages and ThumbnailFolder == None:
+                raise MyException('ThumbnailFolder needed for thumbnails')
+        except MyException as e:
+            print(e)
+            Stages = [Stage for Stage in Stages if callable(Stage) or
+                      Stage in ['background', 'moments']]
+        if isinstance(Background, BackgroundModel):
+            Background = Background.getMedian()
+        self.Stages = list(Stages)
+        self.Background = Background
+        self.Threshold = Threshold
+        self.ThumbnailFolder = ThumbnailFolder
+        self.ThumbnailSize = ThumbnailSize
+        if ThumbnailFolder != None:
+            makedirs(ThumbnailFolder, exist_ok=True)
+        self.Accumulators = OrderedDict()  # scan: MomentAccumulator
+        self.Scan = None  # 'scan' entry of the last frame
+        self.FileNames = []
+        self.Latencies = []  # Seconds from file modification to processed
+
+    def process(self, FilePath, Header, Frame):
+        """
+        Classifies the frame of <FilePath> (with header <Header>, as a numpy.array or numpy.memmap) and passes it through the stages. Returns the item.
+        """
+        FileName = path.basename(FilePath)
+        ScanType = getScanType(Header) if 'scan' in Header else None
+        Location = None
+        if ScanType != None:
+            Location = getScanLocation(Header, FileName=FileName)
+        Item = {'FileName': FileName, 'FilePath': FilePath,
+                'Header': Header, 'ScanType': ScanType,
+                'Location': Location, 'Frame': Frame}
+        for Stage in self.Stages:
+            if callable(Stage):
+                Stage(self, Item)
+            elif Stage == 'background':
+                self.subtractBackground(Item)
+            elif Stage == 'moments':
+                self.addMoments(Item)
+            elif Stage == 'thumbnail':
+                self.saveThumbnail(Item)
+        self.FileNames.append(FileName)
+        self.Latencies.append(time.time() - path.getmtime(FilePath))
+        return Item
+
+    def subtractBackground(self, Item):
+
+        if self.Background is None:
+            Item['Subtracted'] = np.asarray(Item['Frame'], dtype=np.float64)
+        else:
+            Item['Subtracted'] = (np.asarray(Item['Frame'], dtype=np.float64)
+                                  - self.Background)
+
+    def addMoments(self, Item):
+
+        Header = Item['Header']
+        Scan = Header.get('scan')
+        if Scan == None:
+            return
+        if Scan not in self.Accumulators or (
+                Header.get('run') == '0' and
+                self.Accumulators[Scan].NFrames > 0):
+            if Item['ScanType'] in ['mosaicity', 'zapimage-mosaicity']:
+                AxisNames = ['diffry', 'chi']
+            elif Item['ScanType'] == 'strain':
+                AxisNames = ['diffry', 'obpitch']
+            else:
+                AxisNames = ['diffry']
+            self.Accumulators[Scan] = MomentAccumulator(
+                np.shape(Item['Frame']), AxisNames,
+                Background=self.Background, Threshold=self.Threshold)
+            self.Accumulators.move_to_end(Scan)
+        Accumulator = self.Accumulators[Scan]
+        Positions = dict((Name, getMotorValue(Header, Name))
+                         for Name in Accumulator.AxisNames)
+        Accumulator.add(Item['Frame'], Positions)
+        self.Scan = Scan
+
+    def saveThumbnail(self, Item):
+
+        Frame = Item.get('Subtracted', Item['Frame'])
+        Factor = max(1, max(np.shape(Frame))//self.ThumbnailSize)
+        Thumbnail = downscaleFrame(np.asarray(Frame, dtype=np.float64),
+                                   Factor)
+        Low, High = np.percentile(Thumbnail, [0.5, 99.5])
+        Thumbnail = np.clip((Thumbnail - Low)/max(High - Low, 1e-12), 0, 1)
+        Image.fromarray((Thumbnail*255).astype(np.uint8)).save(
+            path.join(self.ThumbnailFolder,
+                      path.splitext(Item['FileName'])[0] + '.png'))
+
+    def getMaps(self, Scan=None):
+        """
+        Returns the moment maps (see MomentAccumulator.getMaps()) of the frames of <Scan> ('scan' header entry) processed so far. If None, the scan of the last frame is used. None if there is no such scan.
+        """
+        if Scan == None:
+            Scan = self.Scan
+        if Scan not in self.Accumulators:
+            return None
+        return self.Accumulators[Scan].getMaps()
+def readLiveFrames(Watcher, Interval, FileQueue, Stop):
+    """
+    This function is the watcher thread of watchFolder(): it polls <Watcher> every <Interval> seconds and puts the paths of complete files into the bounded queue <FileQueue> (waiting while the queue is full), until the threading.Event <Stop> is set.
+    """
+    while not Stop.is_set():
+        for FileName in Watcher.poll():
+            FilePath = path.join(Watcher.FolderPath, FileName)
+            while not Stop.is_set():
+                try:
+                    FileQueue.put(FilePath, timeout=Interval)
+                    break
+                except queue.Full:
+                    continue
+        Stop.wait(Interval)
+def loadLiveFrames(FileQueue, FrameQueue, Stop):
+    """
+    This function is the reader thread of watchFolder(): it takes file paths from <FileQueue>, reads the header and image data, and puts (path, header, frame) into the bounded queue <FrameQueue>, until the threading.Event <Stop> is set. Files which can not be read are reported and skipped.
+    """
+    while not Stop.is_set():
+        try:
+            FilePath = FileQueue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        try:
+            if FilePath.endswith('edf'):
+                Header, DataOffset = readEdfHeader(FilePath)
+                if Header == None:
+                    raise MyException('No valid edf header')
+                Frame = np.array(FrameStack([FilePath], [Header],
+                                            [DataOffset])[0])
+            else:
+                Header = {}
+                Frame = np.array(Image.open(FilePath))
+        except Exception as e:
+            print('%s skipped: %s' % (FilePath, e))
+            continue
+        while not Stop.is_set():
+            try:
+                FrameQueue.put((FilePath, Header, Frame), timeout=0.1)
+                break
+            except queue.Full:
+                continue
+def watchFolder(FolderPath, DataType='edf', Pipeline=None, Interval=0.2,
+                QueueSize=8, IdleTimeout=None, MaxFiles=None,
+                Existing=False, Callback=None, Mute=False):
+    """
+    This function watches a folder during acquisition (for instance mosa_zap_590C) and processes each file as soon as it is completely written, so that moment maps and thumbnails are updated during the scan. The folder is polled by a FolderWatcher in one thread, files are read in a second thread, and frames are processed by a LivePipeline in the calling thread. The threads are connected by bounded queues of <QueueSize> items, so a slow pipeline makes the readers wait instead of filling the memory. The latency from file modification to processed frame is about <Interval> plus the read and processing time. Watching stops after <IdleTimeout> seconds without new files, after <MaxFiles> files, or with Ctrl+C.
+
+    FolderPath:
+        String/path. Folder to watch.
+    DataType:
+        String. If specified (not None), only files with names ending with <DataType> are included.
+    Pipeline:
+        LivePipeline. Processes the frames. If None, LivePipeline(Stages=['moments']) is used.
+    Interval:
+        Float. Seconds between polls of the folder.
+    QueueSize:
+        int. Maximum number of files (and of frames) waiting in each queue.
+    IdleTimeout:
+        Float. Seconds without new files after which watching stops. If None, there is no limit.
+    MaxFiles:
+        int. Number of files after which watching stops. If None, there is no limit.
+    Existing:
+        bool. If true, files already in the folder are processed too.
+    Callback:
+        Function taking the pipeline and the item of each processed frame (see LivePipeline), for instance to update a plot with Pipeline.getMaps().
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Pipeline:
+        LivePipeline. Holds the moment maps (getMaps()), processed file names and latencies.
+    """
+    if Pipeline == None:
+        Pipeline = LivePipeline(Stages=['moments'])
+    Watcher = FolderWatcher(FolderPath, DataType=DataType, Existing=Existing)
+    FileQueue = queue.Queue(maxsize=QueueSize)
+    FrameQueue = queue.Queue(maxsize=QueueSize)
+    Stop = threading.Event()
+    Threads = [threading.Thread(target=readLiveFrames,
+                                args=(Watcher, Interval, FileQueue, Stop),
+                                daemon=True),
+               threading.Thread(target=loadLiveFrames,
+                                args=(FileQueue, FrameQueue, Stop),
+                                daemon=True)]
+    for Thread in Threads:
+        Thread.start()
+    if not Mute:
+        print('\nWatching %s (Ctrl+C to stop)...' % FolderPath)
+
+    NFiles = 0
+    LastTime = time.perf_counter()
+    try:
+        while MaxFiles == None or NFiles < MaxFiles:
+            try:
+                FilePath, Header, Frame = FrameQueue.get(timeout=Interval)
+            except queue.Empty:
+                if IdleTimeout != None and\
+                        time.perf_counter() - LastTime > IdleTimeout:
+                    break
+                continue
+            Item = Pipeline.process(FilePath, Header, Frame)
+            NFiles += 1
+            LastTime = time.perf_counter()
+            if Callback != None:
+                Callback(Pipeline, Item)
+            if not Mute:
+                print('%s (%s) processed, latency %.3f s' %
+                      (Item['FileName'], Item['ScanType'],
+                       Pipeline.Latencies[-1]))
+    except KeyboardInterrupt:
+        print('Watching stopped')
+    finally:
+        # Also stop the threads if the pipeline or Callback raised.
+        Stop.set()
+        for Thread in Threads:
+            Thread.join()
+    if not Mute and len(Pipeline.Latencies) > 0:
+        print('%i files processed, latency %.3f s (mean), %.3f s (max)' %
+              (NFiles, np.mean(Pipeline.Latencies),
+               np.max(Pipeline.Latencies)))
+    return Pipeline
+
+"""Catalog functions:"""
+def openCatalog(CatalogPath):
+    """
+    This function opens (and creates, if it does not exist) an SQLite database used as a catalog of edf-files, as filled by buildCatalog(). There is one row per file in the table 'files', and one row per file and motor in the table 'motors'. The 'temperature' column of 'files' is filled by alignCatalogTemperatures().
+
+    CatalogPath:
+        String/path. Database file.
+    Connection:
+        sqlite3.Connection. Rows are returned as sqlite3.Row (accessible by column name).
+    """
+    Connection = sqlite3.connect(CatalogPath)
+    Connection.row_factory = sqlite3.Row
+    Connection.executescript("""
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, folder TEXT, filename TEXT,
+            mtime REAL, size INTEGER,
+            scan TEXT, scan_type TEXT, run INTEGER, acq_frame_nb INTEGER,
+            time TEXT, datetime TEXT,
+            dim_1 INTEGER, dim_2 INTEGER, data_type TEXT,
+            data_offset INTEGER,
+            diffry_step INTEGER, chi_step INTEGER, obpitch_step INTEGER,
+            time_step INTEGER, obxyz_step INTEGER, diffty_step INTEGER,
+            temperature REAL);
+        CREATE TABLE IF NOT EXISTS motors (
+            path TEXT, name TEXT, value REAL,
+            PRIMARY KEY (path, name)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+        CREATE INDEX IF NOT EXISTS files_scan_type ON files (scan_type);
+        CREATE INDEX IF NOT EXISTS files_datetime ON files (datetime);
+        CREATE INDEX IF NOT EXISTS motors_name_value ON motors (name, value);
+        """)
+    # Catalogs made before the temperature column was added.
+    Columns = [Row['name'] for Row in
+               Connection.execute('PRAGMA table_info(files)')]
+    if 'temperature' not in Columns:
+        Connection.execute('ALTER TABLE files ADD COLUMN temperature REAL')
+    Connection.execute('CREATE INDEX IF NOT EXISTS files_temperature ON files (temperature)')
+    return Connection
+def buildCatalog(RootFolder, CatalogPath, DataType='edf', Workers=None,
+                 TemperatureFolder=None, Mute=False):
+    """
+    This function crawls all folders below <RootFolder> and stores the header entries of every file (read with readEdfHeader(), so without image data) in an SQLite catalog (see openCatalog()). ScanType and scan steps are found with decodeScanSteps(), and motor positions are stored in a separate table. The catalog is updated incrementally: files whose modification time and size are unchanged since the last run are not read again, and files that no longer exist are removed. Files without a valid header, or whose motor positions can not be read, are reported and left out (and tried again on the next run). Use queryCatalog() to search the catalog.
+
+    RootFolder:
+        String/path. Folder to crawl (including all sub-folders).
+    CatalogPath:
+        String/path. Database file. Created if it does not exist.
+    DataType:
+        String. Only files with names ending with <DataType> are included.
+    Workers:
+        int. Number of headers read concurrently. If None, the default of concurrent.futures.ThreadPoolExecutor is used.
+    TemperatureFolder:
+        String/path. Folder with the LabVIEW temperature logs. If given, new and updated files are given a temperature with alignCatalogTemperatures().
+    Mute:
+        bool. If true, skip print operations.
+    NUpdated:
+        int. Number of files added or updated in the catalog.
+    """
+    RootFolder = path.normpath(RootFolder)
+    Connection = openCatalog(CatalogPath)
+    Known = {}  # Fill in below: path: (mtime, size)
+    RootPrefix = path.join(RootFolder, '')
+    for Row in Connection.execute(
+            'SELECT path, mtime, size FROM files WHERE substr(path, 1, ?) = ?',
+            (len(RootPrefix), RootPrefix)):
+        Known[Row['path']] = (Row['mtime'], Row['size'])
+
+    Found = set()  # Fill in later
+    ToRead = []  # Fill in later: (path, folder, filename, mtime, size)
+    for Folder, SubFolders, FileNames in walk(RootFolder):
+        SubFolders.sort()
+        for FileName in sorted(FileNames):
+            if not FileName.endswith(DataType):
+                continue
+            FilePath = path.join(Folder, FileName)
+            Found.add(FilePath)
+            MTime = path.getmtime(FilePath)
+            Size = path.getsize(FilePath)
+            if Known.get(FilePath) != (MTime, Size):
+                ToRead.append((FilePath, Folder, FileName, MTime, Size))
+
+    with ThreadPoolExecutor(max_workers=Workers) as Pool:
+        Results = list(Pool.map(readEdfHeader,
+                                [Entry[0] for Entry in ToRead]))
+
+    # Motor positions of each file, checked before anything is written.
+    Motors = []  # Fill in below: list of (name, position) per file
+    for Index, (Header, DataOffset) in enumerate(Results):
+        Motors.append([])
+        if Header == None or 'motor_mne' not in Header or\
+                'motor_pos' not in Header:
+            continue
+        Names = Header['motor_mne'].split()
+        try:
+            Positions = [float(Value) for Value in
+                         Header['motor_pos'].split()]
+            if len(Positions) != len(Names):
+                raise MyException('%i motor names, %i positions' %
+                                  (len(Names), len(Positions)))
+        except (ValueError, MyException) as e:
+            print('%s not catalogued, bad motor_pos: %s' %
+                  (ToRead[Index][0], e))
+            Results[Index] = (None, None)
+            continue
+        Motors[Index] = list(zip(Names, Positions))
+
+    # Decode the scan steps of all new files at once.
+    Decoded = decodeScanSteps(
+        [Header or {} for Header, DataOffset in Results],
+        FileNames=[Entry[2] for Entry in ToRead])
+    StepNames = ['diffry', 'chi', 'obpitch', 'time', 'obxyz', 'diffty']
+    NUpdated = 0
+    with Connection:
+        for Index, ((FilePath, Folder, FileName, MTime, Size),
+                    (Header, DataOffset)) in enumerate(zip(ToRead, Results)):
+            if Header == None:
+                continue
+            HeaderDatetime = getHeaderDatetime(Header)
+            if HeaderDatetime != None:
+                HeaderDatetime = HeaderDatetime.isoformat()
+            Row = [FilePath, Folder, FileName, MTime, Size,
+                   Header.get('scan'), Decoded['ScanTypes'][Index],
+                   Header.get('run'), Header.get('acq_frame_nb'),
+                   Header.get('time', Header.get('date')), HeaderDatetime,
+                   Header.get('Dim_1'), Header.get('Dim_2'),
+                   Header.get('DataType'), DataOffset]
+            for StepName in StepNames:
+                Step = int(Decoded['Steps'][StepName][Index])
+                if Step == -1:
+                    Step = None
+                Row.append(Step)
+            Connection.execute(
+                'INSERT OR REPLACE INTO files VALUES (%s, NULL)' %
+                ', '.join(['?']*len(Row)), Row)
+            Connection.execute('DELETE FROM motors WHERE path = ?',
+                               (FilePath,))
+            Connection.executemany(
+                'INSERT OR REPLACE INTO motors VALUES (?, ?, ?)',
+                [(FilePath, Name, Position)
+                 for Name, Position in Motors[Index]])
+            NUpdated += 1
+        Removed = [(FilePath,) for FilePath in Known
+                   if FilePath not in Found]
+        Connection.executemany('DELETE FROM files WHERE path = ?', Removed)
+        Connection.executemany('DELETE FROM motors WHERE path = ?', Removed)
+    Connection.close()
+    if not Mute:
+        print('Catalog %s: %i files found, %i added/updated, %i not readable, %i removed' %
+              (CatalogPath, len(Found), NUpdated, len(ToRead) - NUpdated,
+               len(Removed)))
+    if TemperatureFolder != None:
+        alignCatalogTemperatures(CatalogPath, TemperatureFolder, Mute=Mute)
+    return NUpdated
+def alignCatalogTemperatures(CatalogPath, TemperatureFolder, MaxGap=60.0,
+                             Overwrite=False, Mute=False):
+    """
+    This function fills the 'temperature' column of a catalog made by buildCatalog() with the sample temperature at the time of each file (from the 'datetime' column), interpolated in the LabVIEW logs of the days in the catalog (see loadTemperatureLogs() and getFrameTemperatures()). All files are aligned at once, after which frames can be filtered by temperature, for instance:
+        queryCatalog(CatalogPath, 'temperature BETWEEN ? AND ?', (580, 600))
+
+    CatalogPath:
+        String/path. Database file.
+    TemperatureFolder:
+        String/path. Folder with the temperature logs.
+    MaxGap:
+        Float. As in getFrameTemperatures().
+    Overwrite:
+        bool. If true, all files are aligned again, otherwise only files without a temperature.
+    Mute:
+        bool. If true, skip print operations.
+    NAligned:
+        int. Number of files given a temperature.
+    """
+    Connection = openCatalog(CatalogPath)
+    Where = 'datetime IS NOT NULL'
+    if not Overwrite:
+        Where += ' AND temperature IS NULL'
+    Rows = Connection.execute('SELECT path, datetime FROM files WHERE ' +
+                              Where).fetchall()
+    NAligned = 0
+    if len(Rows) > 0:
+        FrameDatetimes = np.array([Row['datetime'] for Row in Rows],
+                                  dtype='datetime64[s]')
+        LogDatetimes, SampleTemperatures = loadTemperatureLogs(
+            TemperatureFolder, Days=FrameDatetimes)
+        if LogDatetimes is not None:
+            FrameTemperatures = getFrameTemperatures(
+                FrameDatetimes, LogDatetimes, SampleTemperatures,
+                MaxGap=MaxGap)
+            Found = ~np.isnan(FrameTemperatures)
+            with Connection:
+                Connection.executemany(
+                    'UPDATE files SET temperature = ? WHERE path = ?',
+                    [(float(Temperature), Row['path']) for Row, Temperature
+                     in zip(Rows, FrameTemperatures)
+                     if not np.isnan(Temperature)])
+            NAligned = int(np.sum(Found))
+    Connection.close()
+    if not Mute:
+        print('Catalog %s: %i of %i files given a temperature' %
+              (CatalogPath, NAligned, len(Rows)))
+    return NAligned
+def queryCatalog(CatalogPath, Where='1', Parameters=(), Motors=None,
+                 OrderBy='path'):
+    """
+    This function returns the files in a catalog made by buildCatalog() that fulfil an SQL condition on the columns of the 'files' table (see openCatalog()) and, optionally, limits on motor positions. For instance all mosaicity frames with chi step 3 and diffry above 0.1:
+        queryCatalog(CatalogPath, 'scan_type = ? AND chi_step = ?', ('mosaicity', 3), Motors={'diffry': (0.1, None)})
+
+    CatalogPath:
+        String/path. Database file.
+    Where:
+        String. SQL condition, with '?' for each entry of <Parameters>.
+    Parameters:
+        Tuple. Values inserted for '?' in <Where>.
+    Motors:
+        Dictionary of motor name: (min, max). Only files with the motor position within the limits (inclusive) are returned. A limit given as None is not applied.
+    OrderBy:
+        String. SQL ORDER BY clause.
+    Rows:
+        List of dictionaries, one per file, with the columns of the 'files' table as keys.
+    """
+    Conditions = [Where]
+    Parameters = list(Parameters)
+    if Motors != None:
+        for Name, (Min, Max) in Motors.items():
+            Condition = 'EXISTS (SELECT 1 FROM motors WHERE motors.path = files.path AND motors.name = ?'
+            Parameters.append(Name)
+            if Min != None:
+                Condition += ' AND motors.value >= ?'
+                Parameters.append(Min)
+            if Max != None:
+                Condition += ' AND motors.value <= ?'
+                Parameters.append(Max)
+            Conditions.append(Condition + ')')
+    Connection = openCatalog(CatalogPath)
+    Rows = [dict(Row) for Row in Connection.execute(
+        'SELECT * FROM files WHERE (%s) ORDER BY %s' %
+        (') AND ('.join(Conditions), OrderBy), Parameters)]
+    Connection.close()
+    return Rows
+
+"""Benchmark functions:"""
+""" Dictionary of ScanType: (scan entry, number of steps along the fast scan axis or None). Used by makeSyntheticScan() to write headers for every ScanType recognized by getScanType(); '%i' is replaced with the number of intervals of the fast axis, and '%j' with that of the slow axis."""
+SyntheticScans = {
+    'mosaicity': 'mesh diffry -0.16 0.16 %i chi -2 2 %j 0.5',
+    'strain': 'ascan diffry -0.16 0.16 %i 0.5',
+    'timescan': 'timescan 0.5 0',
+    'zapline-diffry': 'zapline diffry -0.16 0.16 %i 100',
+    'obfoc': 'ascan obx -1 1 %i 0.5',
+    'none': '(none)',
+    'loopscan': 'loopscan %i 0.5 0',
+    'diffty': 'ascan diffty -0.1 0.1 %i 0.5',
+    'zapimage-mosaicity': 'zapimage diffry -0.16 0.16 %i 100 chi -2 2 %j 100'}
+""" Motor names (motor_mne) used in synthetic headers, similar to ESRF ID06 in June 2018."""
+SyntheticMotors = ['mainx', 'obx', 'oby', 'obz', 'obpitch', 'obyaw',
+                   'cdx', 'dcx', 'dcz', 'ffz', 'ffy', 'ffsel', 'diffrx',
+                   'diffry', 'diffrz', 'diffty', 'difftz', 'chi', 'phi',
+                   'samx', 'samy', 'samz', 's8vg', 's8vo', 's8hg', 's8ho',
+                   'bstx', 'bsty', 'furnx', 'furnz']
+def makeSyntheticScan(FolderPath, ScanType='mosaicity', NFrames=20,
+                      Shape=(2048, 2048), Seed=0, Mute=False):
+    """
+    This function writes a folder of synthetic single-image edf-files similar to those from ESRF ID06 (UnsignedShort data, header with 'scan', 'run', 'acq_frame_nb', 'motor_mne', 'motor_pos', 'time' and 'date'), to be used by benchmarkStages() without access to real data. The image is a noisy background with a bright 'grain' whose intensity and position follow the scan steps. The files are named as at ID06, so that getScanLocation() and getNewFileName() work for every ScanType in SyntheticScans. For 2D scans the fast axis has about sqrt(<NFrames>) steps.
+
+    FolderPath:
+        String/path. Folder to write the files in (made if it does not exist).
+    ScanType:
+        String. One of the ScanTypes in SyntheticScans.
+    NFrames:
+        int. Number of files to write.
+    Shape:
+        Tuple of int. (rows, columns) of each image.
+    Seed:
+        int. Seed of the random noise.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    FileNames:
+        List of strings. Names of the written files, in order. None if ScanType is invalid.
+    """
+    try:
+        if ScanType not in SyntheticScans:
+            raise MyException('Invalid ScanType')
+    except MyException as e:
+        print(e)
+        return None
+    makedirs(FolderPath, exist_ok=True)
+    if ScanType in ['mosaicity', 'strain', 'zapline-diffry',
+                    'zapimage-mosaicity']:
+        FastN = max(1, int(np.sqrt(NFrames)))
+    else:
+        FastN = NFrames
+    SlowN = max(1, -(-NFrames//FastN))
+    Scan = SyntheticScans[ScanType].replace('%i', '%i' % (FastN-1))
+    Scan = Scan.replace('%j', '%i' % (SlowN-1))
+
+    Random = np.random.default_rng(Seed)
+    Noise = Random.integers(90, 110, size=Shape, dtype=np.uint16)
+    Rows = np.arange(Shape[0])[:, None]
+    Cols = np.arange(Shape[1])[None, :]
+    Grain = np.exp(-(((Rows - Shape[0]/2)/(Shape[0]/10))**2 +
+                     ((Cols - Shape[1]/2)/(Shape[1]/8))**2))
+    StartTime = datetime(2018, 6, 18, 21, 0, 0)
+    MotorMne = ' '.join(SyntheticMotors)
+    FileNames = []  # Fill in below
+    for Index in range(NFrames):
+        FastStep = Index % FastN
+        SlowStep = Index // FastN
+        Positions = dict.fromkeys(SyntheticMotors, 0.0)
+        Positions['diffry'] = -0.16 + 0.32*FastStep/max(FastN-1, 1)
+        Positions['chi'] = -2 + 4*SlowStep/max(SlowN-1, 1)
+        Positions['obpitch'] = 24.5 + 0.01*SlowStep
+        Positions['obx'] = -1 + 2*Index/max(NFrames-1, 1)
+        Positions['diffty'] = -0.1 + 0.2*Index/max(NFrames-1, 1)
+        Positions['ffz'] = 100.0
+        FrameTime = StartTime + timedelta(seconds=Index)
+        Header = {'scan': Scan,
+                  'run': '%i' % Index,
+                  'acq_frame_nb': '%i' % FastStep,
+                  'motor_mne': MotorMne,
+                  'motor_pos': ' '.join('%.6g' % Positions[Name]
+                                        for Name in SyntheticMotors),
+                  'count_time': '0.5',
+                  'time': FrameTime.strftime('%a %b %d %H:%M:%S %Y'),
+                  'date': FrameTime.strftime('%a %b %d %H:%M:%S %Y')}
+        # Rocking curve: intensity falls off from the centre of each axis.
+        Rocking = np.exp(-((FastStep - (FastN-1)/2)/max(FastN/4, 1))**2 -
+                         ((SlowStep - (SlowN-1)/2)/max(SlowN/4, 1))**2)
+        Data = Noise + (Rocking*4000*np.roll(Grain, 4*FastStep, axis=1)
+                        ).astype(np.uint16)
+        Noise = np.roll(Noise, 7, axis=0)
+        if ScanType in ['zapline-diffry', 'zapimage-mosaicity']:
+            # Slow step (one-indexed) at FileName[-18:-14], see getScanLocation().
+            FileName = 'zap_%04i_0000_%04i.edf' % (SlowStep+1, FastStep)
+        else:
+            FileName = '%s_%04i.edf' % (ScanType.replace('-', '_'), Index)
+        fabio.edfimage.EdfImage(data=Data, header=Header).write(
+            path.join(FolderPath, FileName))
+        FileNames.append(FileName)
+    if not Mute:
+        print('%i synthetic %s files (%ix%i) written to %s' %
+              (NFrames, ScanType, Shape[0], Shape[1], FolderPath))
+    return FileNames
+def getPeakRSS():
+    """
+    This function returns the peak resident set size (memory) of this process so far, in MB. This high-water mark never goes down, so it is the largest peak of everything run before, not of the last function. The resource module is only available on Unix; None is returned elsewhere.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    PeakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == 'Darwin':
+        return PeakRSS/1024**2     # bytes on macOS
+    return PeakRSS/1024            # kB on Linux
+def getCurrentRSS():
+    """
+    This function returns the current resident set size (memory) of this process, in MB, from /proc/self/statm. Only available on Linux; None is returned elsewhere.
+    """
+    try:
+        import resource
+        with open('/proc/self/statm') as OpenFile:
+            Pages = int(OpenFile.read().split()[1])
+    except (ImportError, OSError, ValueError, IndexError):
+        return None
+    return Pages*resource.getpagesize()/1024**2
+def sampleRSS(Stop, Samples, Interval=0.001):
+    """
+    This function is the sampling thread of timeStage(): it appends getCurrentRSS() to the list <Samples> every <Interval> seconds, until the threading.Event <Stop> is set.
+    """
+    while not Stop.is_set():
+        Samples.append(getCurrentRSS())
+        Stop.wait(Interval)
+    Samples.append(getCurrentRSS())
+def timeStage(Calls, NFrames, FrameBytes, Repeats=3):
+    """
+    This function times one stage of benchmarkStages(). Each repeat runs all the functions in <Calls> in turn, and each call is timed separately. Peak memory is measured in two extra runs which are not timed: one with tracemalloc (Python and numpy allocations of the stage, not memory-mapped files; tracing slows down Python code), and one where the current RSS is sampled every millisecond by a thread running sampleRSS(), giving the peak RSS of the stage above the RSS when it started (including memory-mapped pages read, but not memory freed by earlier runs which the allocator reuses, so it can be lower than the tracemalloc peak). The high-water mark of the whole process (getPeakRSS()) is also stored, but it includes all earlier stages.
+
+    Calls:
+        List of functions without arguments. Together they process <NFrames> frames once.
+    NFrames:
+        int. Number of frames processed by one run of all <Calls>.
+    FrameBytes:
+        int. Bytes of image data per frame (for the throughput in MB/s).
+    Repeats:
+        int. Number of times all <Calls> are run.
+    Result:
+        Dictionary with the times (s) of each repeat, best throughput (frames/s and MB/s), per-call latency (ms: mean, median, min, max) and peak memory (MB): 'peak_alloc_MB' (tracemalloc), 'peak_rss_MB' (RSS increase during the stage, None if not on Linux) and 'process_peak_rss_MB' (high-water mark of the process).
+    """
+    Times = []  # Fill in below
+    Latencies = []  # Fill in below
+    for Repeat in range(Repeats):
+        RepeatStart = time.perf_counter()
+        for Call in Calls:
+            CallStart = time.perf_counter()
+            Call()
+            Latencies.append(time.perf_counter() - CallStart)
+        Times.append(time.perf_counter() - RepeatStart)
+    tracemalloc.start()
+    for Call in Calls:
+        Call()
+    PeakAlloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    StartRSS = getCurrentRSS()
+    StageRSS = None
+    if StartRSS != None:
+        Samples = [StartRSS]
+        Stop = threading.Event()
+        Sampler = threading.Thread(target=sampleRSS, args=(Stop, Samples),
+                                   daemon=True)
+        Sampler.start()
+        for Call in Calls:
+            Call()
+        Stop.set()
+        Sampler.join()
+        StageRSS = max(Samples) - StartRSS
+    Latencies = np.array(Latencies)*1000
+    BestTime = min(Times)
+    return {'frames': NFrames, 'calls': len(Calls), 'repeats': Repeats,
+            'times_s': Times,
+            'frames_per_s': NFrames/BestTime,
+            'MB_per_s': NFrames*FrameBytes/BestTime/1024**2,
+            'latency_ms': {'mean': float(np.mean(Latencies)),
+                           'median': float(np.median(Latencies)),
+                           'min': float(np.min(Latencies)),
+                           'max': float(np.max(Latencies))},
+            'peak_alloc_MB': PeakAlloc/1024**2,
+            'peak_rss_MB': StageRSS,
+            'process_peak_rss_MB': getPeakRSS()}
+def benchmarkStages(FrameCounts=(10, 50), Shape=(2048, 2048),
+                    ScanType='mosaicity', Stages=None, Repeats=3,
+                    ResultPath=None, WorkFolder=None, Mute=False):
+    """
+    This function benchmarks the loading, conversion and analysis hot paths on synthetic ID06-style edf-files (made with makeSyntheticScan()), for each number of frames in <FrameCounts>. The results are printed, and saved as json to <ResultPath> so that runs can be compared with compareBenchmarks().
+
+    The stages are:
+        'loadFolder':       loadFolder() (fabio) of the whole folder, and closeFiles().
+        'make_data_array':  make_data_array() of the loaded files.
+        'median':           getBackground() with Method='median'.
+        'saveAs':           saveAs() of each file as 16-bit png (Cmpr1), one call per file.
+        'getNewFileName':   getNewFileName() of each file, one call per file.
+        'getNewFileNames':  getNewFileNames() of all files at once.
+
+    FrameCounts:
+        Tuple of int. Numbers of frames to benchmark.
+    Shape:
+        Tuple of int. (rows, columns) of the synthetic images. ID06 images are 2048x2048.
+    ScanType:
+        String. ScanType of the synthetic files (see SyntheticScans).
+    Stages:
+        List of strings. Stages to run (see above). If None, all stages are run.
+    Repeats:
+        int. Number of times each stage is run (the best time gives the throughput).
+    ResultPath:
+        String/path. json-file to save the results in. If None, the results are not saved.
+    WorkFolder:
+        String/path. Folder for the synthetic and converted files, which are kept. If None, a temporary folder is used and removed afterwards.
+    Mute:
+        bool. If true, skip print operations (except for unexpected behavior).
+    Results:
+        Dictionary with the settings, system information and a list of results (one per stage and frame count, see timeStage()).
+    """
+    AllStages = ['loadFolder', 'make_data_array', 'median', 'saveAs',
+                 'getNewFileName', 'getNewFileNames']
+    if Stages == None:
+        Stages = AllStages
+    try:
+        for Stage in Stages:
+            if Stage not in AllStages:
+                raise MyException('Invalid Stage: %s' % Stage)
+    except MyException as e:
+        print(e)
+        return None
+    RemoveWorkFolder = WorkFolder == None
+    if RemoveWorkFolder:
+        WorkFolder = tempfile.mkdtemp(prefix='benchmark_')
+    FrameBytes = Shape[0]*Shape[1]*2
+    Results = {'date': datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'fabio': fabio.version,
+               'machine': platform.platform(),
+               'cpu_count': cpu_count(),
+               'shape': list(Shape),
+               'scan_type': ScanType,
+               'results': []}
+
+    for NFrames in FrameCounts:
+        DataFolder = path.join(WorkFolder, '%s_%i' % (ScanType, NFrames))
+        SaveFolder = DataFolder + '_png16_Cmpr1'
+        makedirs(SaveFolder, exist_ok=True)
+        if len(namesFromFolder(DataFolder, DataType='edf')
+               if path.isdir(DataFolder) else []) != NFrames:
+            makeSyntheticScan(DataFolder, ScanType=ScanType,
+                              NFrames=NFrames, Shape=Shape, Mute=Mute)
+        Files, FileNames = loadFolder(DataFolder, DataType='edf', Mute=True)
+        Headers = [File.header for File in Files]
+        Calls = {
+            'loadFolder': [lambda: closeFiles(
+                loadFolder(DataFolder, DataType='edf', Mute=True)[0],
+                Mute=True)],
+            'make_data_array': [lambda: make_data_array(Files)],
+            'median': [lambda: getBackground(DataFolder, Method='median',
+                                             Mute=True)],
+            'saveAs': [lambda File=File, FileName=FileName: saveAs(
+                File, 'png', SaveFolder, FileName, pngCpr=1, Mute=True)
+                for File, FileName in zip(Files, FileNames)],
+            'getNewFileName': [lambda Header=Header, FileName=FileName:
+                               getNewFileName(FileName, Header)
+                               for Header, FileName in zip(Headers,
+                                                           FileNames)],
+            'getNewFileNames': [lambda: getNewFileNames(FileNames, Headers)]}
+        for Stage in Stages:
+            Result = timeStage(Calls[Stage], NFrames, FrameBytes,
+                               Repeats=Repeats)
+            Result['stage'] = Stage
+            Results['results'].append(Result)
+            if not Mute:
+                print('%-16s %5i frames: %9.1f frames/s %8.1f MB/s, %9.3f ms/call (median), peak %7.1f MB allocated, %s MB RSS (stage)' %
+                      (Stage, NFrames, Result['frames_per_s'],
+                       Result['MB_per_s'], Result['latency_ms']['median'],
+                       Result['peak_alloc_MB'],
+                       ('%.0f' % Result['peak_rss_MB']
+                        if Result['peak_rss_MB'] != None else 'n/a')))
+        closeFiles(Files, Mute=True)
+
+    if RemoveWorkFolder:
+        shutil.rmtree(WorkFolder, ignore_errors=True)
+    if ResultPath != None:
+        with open(ResultPath, 'w') as OpenFile:
+            json.dump(Results, OpenFile, indent=1)
+        if not Mute:
+            print('Results saved to ' + ResultPath)
+    return Results
+def compareBenchmarks(OldPath, NewPath):
+    """
+    This function prints the change in throughput (frames/s) and peak memory of each stage and frame count between two json-files saved by benchmarkStages(). A speedup above 1 means that the new run is faster.
+
+    OldPath, NewPath:
+        String/path. json-files from benchmarkStages().
+    Speedups:
+        Dictionary of (stage, frames): speedup (new frames/s divided by old frames/s), for the stages and frame counts in both files.
+    """
+    with open(OldPath) as OpenFile:
+        Old = json.load(OpenFile)
+    with open(NewPath) as OpenFile:
+        New = json.load(OpenFile)
+    OldResults = {(Result['stage'], Result['frames']): Result
+                  for Result in Old['results']}
+    Speedups = {}  # Fill in below
+    print('%-16s %6s %12s %12s %8s %10s' % ('Stage', 'Frames', 'Old fr/s',
+                                             'New fr/s', 'Speedup',
+                                             'Memory'))
+    for Result in New['results']:
+        Key = (Result['stage'], Result['frames'])
+        if Key not in OldResults:
+            continue
+        OldResult = OldResults[Key]
+        Speedups[Key] = Result['frames_per_s']/OldResult['frames_per_s']
+        print('%-16s %6i %12.1f %12.1f %7.2fx %9.2fx' %
+              (Key[0], Key[1], OldResult['frames_per_s'],
+               Result['frames_per_s'], Speedups[Key],
+               Result['peak_alloc_MB']/max(OldResult['peak_alloc_MB'],
+                                           1e-9)))
+    return Speedups
+def benchmarkLayouts(file_list, Repeats=3, Mute=False):
+    """
+    This function times make_data_array() and the median and mean along the frame axis for both layouts ('frames': (files, rows, columns), 'pixels': (rows, columns, files)) and for the native data type of the files, float32 and float64 (the old default). The output buffer of make_data_array() is reused between repeats.
+
+    file_list:
+        List of fabio.image, or FrameStack. Frames to use.
+    Repeats:
+        int. Number of times each operation is run (the best time is kept).
+    Mute:
+        bool. If true, skip print operations.
+    Times:
+        Dictionary of (layout, data type name): dictionary of 'make_data_array', 'median' and 'mean': best time (s), and 'MB': size of the array.
+    """
+    if isinstance(file_list, FrameStack):
+        NativeType = file_list.dtype
+    else:
+        NativeType = file_list[0].data.dtype
+    Times = {}  # Fill in below
+    for Layout in ['frames', 'pixels']:
+        Axis = 0 if Layout == 'frames' else -1
+        for DataType in [NativeType, np.dtype(np.float32),
+                         np.dtype(np.float64)]:
+            Array = make_data_array(file_list, dtype=DataType, layout=Layout)
+            Operations = {
+                'make_data_array': lambda: make_data_array(
+                    file_list, dtype=DataType, layout=Layout, out=Array),
+                'median': lambda: np.median(Array, axis=Axis),
+                'mean': lambda: np.mean(Array, axis=Axis,
+                                        dtype=np.float64)}
+            Result = {'MB': Array.nbytes/1024**2}
+            for Name, Operation in Operations.items():
+                Best = None
+                for Repeat in range(Repeats):
+                    StartTime = time.perf_counter()
+                    Operation()
+                    Elapsed = time.perf_counter() - StartTime
+                    if Best == None or Elapsed < Best:
+                        Best = Elapsed
+                Result[Name] = Best
+            Times[(Layout, DataType.name)] = Result
+            if not Mute:
+                print('%-6s %-7s %8.1f MB: make_data_array %7.3f s, median %7.3f s, mean %7.3f s' %
+                      (Layout, DataType.name, Result['MB'],
+                       Result['make_data_array'], Result['median'],
+                       Result['mean']))
+    return Times
+def benchmarkLoadFolder(FolderPath, DataType=None, WorkerCounts=(1, 4, 16),
+                        MaxBytes=None, Lazy=False, Roi=None, Mute=False):
+    """
+    This function times loadFolder() with different numbers of workers (Workers=1 reads the files one at a time, as before). Files read once are cached by the operating system, so after the first run later runs mostly time the decoding; for the read latency of a network drive, use a folder that has not been read recently (or drop the caches between runs).
+
+    FolderPath, DataType, MaxBytes, Lazy, Roi:
+        See loadFolder().
+    WorkerCounts:
+        Tuple of int. Numbers of workers to time.
+    Mute:
+        bool. If true, skip print operations.
+    Times:
+        Dictionary of number of workers: time (s).
+    """
+    Times = {}  # Fill in below
+    for Workers in WorkerCounts:
+        StartTime = time.perf_counter()
+        Files, FileNames = loadFolder(FolderPath, DataType=DataType,
+                                      Mute=True, Lazy=Lazy, Roi=Roi,
+                                      Workers=Workers, MaxBytes=MaxBytes)
+        Times[Workers] = time.perf_counter() - StartTime
+        if Files is None:
+            print('No files found in %s' % FolderPath)
+            return None
+        if not Mute:
+            print('%3i worker(s): %i files in %7.3f s (%.1f files/s)' %
+                  (Workers, len(FileNames), Times[Workers],
+                   len(FileNames)/Times[Workers]))
+        if isinstance(Files, list):
+            closeFiles(Files, Mute=True)
+    return Times
 """Testing functions:"""
 def TestAllFolders():
     Folders = getAllFoldersJune2018(DriveLetter='D')
     for Folder in Folders:
-        File, FileName = loadFile(Folder, DataType='edf', Mute=True)
-        if File.header['DataType']!='UnsignedShort':
-            print(Folder, 'DataType', File.header['DataType'])
-        if File.header['Dim_1']!='2048':
-            print(Folder, 'Dim_1', File.header['Dim_1'])
-        File.close()
+        FileName = namesFromFolder(Folder, DataType='edf')[0]
+        Header, DataOffset = readEdfHeader(path.join(Folder, FileName))
+        if Header['DataType']!='UnsignedShort':
+            print(Folder, 'DataType', Header['DataType'])
+        if Header['Dim_1']!='2048':
+            print(Folder, 'Dim_1', Header['Dim_1'])
 def TestAllFolders2():
     Folders = getAllFoldersJune2018(DriveLetter='F')
     for Folder in Folders:
-        File, FileName = loadFile(Folder, DataType='edf', Mute=True)
-        print(Folder[41:], 'ScanType:', getScanType(File.header))
-        File.close()
+        FileName = namesFromFolder(Folder, DataType='edf')[0]
+        Header, DataOffset = readEdfHeader(path.join(Folder, FileName))
+        print(Folder[41:], 'ScanType:', getScanType(Header))
 """Sandbox:"""
 def doStuff():
     """
@@ -1391,15 +5129,65 @@ def doStuff():
     """
     # TestAllFolders()
     return
-doStuff()
+# Not run on import, for instance by the worker processes of convertFolder().
+if __name__ == '__main__':
+    doStuff()
 
 """ New functions """
-def make_data_array(file_list):
-    # Convert background images from list of fabio.image to numpy.array
-    rows_in_image = np.shape(file_list[0].data)[0]
-    cols_in_image = np.shape(file_list[0].data)[1]
+def make_data_array(file_list, Roi=None, dtype=None, layout='frames',
+                    out=None):
+    # Convert images from list of fabio.image (or a FrameStack, from which
+    # only the Roi window is read) to numpy.array.
+    # dtype: data type of the array. None keeps the data type of the files
+    #   (uint16 for ESRF ID06, 2 bytes per pixel); use np.float32 when
+    #   arithmetic (like background subtraction) needs it.
+    # layout: 'frames' gives (files, rows, cols), each frame contiguous
+    #   (fast to fill, and a (rows, cols) background broadcasts over it);
+    #   'pixels' gives the (rows, cols, files) layout used before.
+    # out: preallocated array of the right shape, reused across calls.
+    try:
+        if layout not in ['frames', 'pixels']:
+            raise MyException('Invalid layout')
+    except MyException as e:
+        print(e)
+        return None
+    if isinstance(file_list, FrameStack):
+        frame_shape = file_list.shape[1:]
+        file_dtype = file_list.dtype
+    else:
+        frame_shape = np.shape(file_list[0].data)
+        file_dtype = file_list[0].data.dtype
+    rows_start, rows_stop, cols_start, cols_stop = getRoiBounds(Roi,
+                                                                frame_shape)
+    rows_in_image = rows_stop - rows_start
+    cols_in_image = cols_stop - cols_start
     files_loaded = len(file_list)
-    array = np.zeros((rows_in_image, cols_in_image, files_loaded))
+    if dtype is None:
+        dtype = file_dtype
+    if layout == 'frames':
+        shape = (files_loaded, rows_in_image, cols_in_image)
+    else:
+        shape = (rows_in_image, cols_in_image, files_loaded)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    try:
+        if out.shape != shape:
+            raise MyException('out has shape %s, not %s' % (out.shape, shape))
+    except MyException as e:
+        print(e)
+        return None
+    if isinstance(file_list, FrameStack) and layout == 'frames' and\
+            out.dtype == file_dtype:
+        # Read directly into the output buffer.
+        return readRoiStack(file_list, Roi, Out=out)
     for image in range(files_loaded):
-        array[:,:,image] = file_list[image].data
-    return array
\ No newline at end of file
+        if isinstance(file_list, FrameStack):
+            data = readRoiStack(file_list[[image]], Roi)[0]
+        else:
+            data = file_list[image].data[rows_start:rows_stop,
+                                         cols_start:cols_stop]
+        if layout == 'frames':
+            out[image] = data
+        else:
+            out[:,:,image] = data
+    return out
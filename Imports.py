@@ -4,13 +4,14 @@ Author: Magnus Christensen
 To be run before ReadData.py
 """
 import fabio, time
-from os import listdir, path, makedirs
+from os import listdir, path, makedirs, cpu_count, walk, replace, scandir
 import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib import dates
 from matplotlib import rc
 from matplotlib import ticker
-from PIL import Image, ImageTk
+from matplotlib import animation
+from PIL import Image, ImageTk, PngImagePlugin
 import png
 import tkinter as tk
 import calendar
@@ -18,7 +19,17 @@ from datetime import date
 from datetime import datetime
 from datetime import timedelta
 import csv
+import sqlite3
+import json
 from tkinter.filedialog import askdirectory
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict, deque
+import threading
+import queue
+import tempfile
+import shutil
+import platform
+import tracemalloc
 """
 To run in python shell and keep shell running:
 exec(open("\\\\home.ansatt.ntnu.no/Magnussc/Documents/PhD/Notes/Python/Imports.py").read(), globals())